@@ -1,15 +1,57 @@
+import os
 import asyncio
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from typing import Optional
+from fastapi import FastAPI, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
 
 from engine import OpenJudgeEngine
+from llm_client import get_gateway
+from model_router import model_router
+from session_stream import SessionRegistry, ndjson_batches
+from job_queue import JobQueue, JobWorkerPool, TERMINAL_STATUSES, default_db_path
 
 app = FastAPI(title="OpenJudge V3 Microservice API")
 
 # Instantiate a global engine pool (in a real enterprise app, this would be a session-managed factory)
-global_engine = OpenJudgeEngine(max_iterations=25)
+# Sessions are checkpointed every iteration so they survive worker restarts (see /resume)
+global_engine = OpenJudgeEngine(
+    max_iterations=25,
+    checkpoint_dir=os.getenv("OPENJUDGE_CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "checkpoints")),
+    speculative_branches=int(os.getenv("OPENJUDGE_SPECULATIVE_BRANCHES", "0"))
+)
+
+# Agent runs are owned by the registry, not by HTTP connections: a dropped client
+# re-attaches with Last-Event-ID and replays what it missed. A session nobody has
+# watched for OPENJUDGE_ABANDON_SECONDS is cancelled (0 = never).
+session_registry = SessionRegistry(
+    capacity=int(os.getenv("OPENJUDGE_STREAM_BUFFER", 1000)),
+    retention_seconds=float(os.getenv("OPENJUDGE_STREAM_RETENTION_SECONDS", 900)),
+    abandon_seconds=float(os.getenv("OPENJUDGE_ABANDON_SECONDS", 120)) or None
+)
+
+# Durable job queue: runs submitted via /jobs outlive client connections and API restarts.
+# This process drains it with OPENJUDGE_JOB_WORKERS workers (0 = leave it to `python job_queue.py` processes).
+job_queue = JobQueue(default_db_path())
+job_workers = JobWorkerPool(job_queue, global_engine, workers=int(os.getenv("OPENJUDGE_JOB_WORKERS", 2)))
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.start()
+
+@app.on_event("startup")
+async def start_memory_compaction():
+    # Retention policies keep the long-term memory collection (and query latency) bounded
+    interval = float(os.getenv("OPENJUDGE_MEMORY_COMPACT_INTERVAL", 6 * 3600))
+    if interval > 0:
+        from memory_db import memory_db
+        memory_db.start_background_compaction(interval)
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    # Interrupted jobs keep their lease until it expires, then another worker resumes them
+    await job_workers.stop()
 
 class ExecuteRequest(BaseModel):
     objective: str
@@ -18,24 +60,144 @@ class ExecuteRequest(BaseModel):
 def health_check():
     return {"status": "online", "system": "OpenJudge V3 Cognitive Overlord"}
 
+@app.get("/api/v1/stats/llm")
+def llm_stats():
+    """Per-route model latency, cost and failure rates, per-endpoint gateway health, and LLM retries saved by local format repair."""
+    return {"router": model_router.stats(), "gateway": get_gateway().stats(),
+            "format_repairs": global_engine.format_repairs}
+
+def _parse_event_id(value: Optional[str]) -> int:
+    try:
+        return max(0, int(value)) if value else 0
+    except ValueError:
+        return 0
+
+def _sse_stream(session_id: str, last_event_id: int):
+    buffer = session_registry.get(session_id)
+
+    async def sse_event_generator():
+        # Disconnecting only ends this subscription; the agent keeps running in the registry
+        async for event_id, telemetry_json in buffer.subscribe(last_event_id):
+            yield {"id": str(event_id), "data": telemetry_json}
+
+    return EventSourceResponse(sse_event_generator(), headers={"X-OpenJudge-Session": session_id})
+
 @app.post("/api/v1/judge/execute")
 async def execute_agent_loop(request: Request, payload: ExecuteRequest):
     """
     Enterprise Streaming Endpoint.
     Consumes the objective, initiates the OpenJudge LLM verification cycle, 
     and bridges the yield stream over HTTP Server-Sent Events (SSE).
+    Every event carries an `id`; reconnect to /sessions/{session_id}/stream with
+    Last-Event-ID to continue without losing events.
+    """
+    session_id = session_registry.start(
+        None, lambda sid, token: global_engine.stream_execute(payload.objective, session_id=sid, cancel_token=token)
+    )
+    return _sse_stream(session_id, 0)
+
+@app.get("/api/v1/judge/sessions/{session_id}/stream")
+async def stream_session(session_id: str, last_event_id: Optional[str] = None,
+                         transport: str = "sse", batch_ms: int = 50, gzip: bool = False,
+                         last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """
+    Re-attach Endpoint.
+    Replays a live or recently finished session from the event after Last-Event-ID
+    (header, or `last_event_id` query parameter) and then follows it live.
+    `transport=ndjson` batches events into newline-delimited JSON chunks every
+    `batch_ms` milliseconds, optionally gzip-compressed, for high-rate consumers.
     """
-    
+    if session_registry.get(session_id) is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown or expired session '{session_id}'."})
+
+    start_after = _parse_event_id(last_event_id_header or last_event_id)
+    if transport != "ndjson":
+        return _sse_stream(session_id, start_after)
+
+    events = session_registry.get(session_id).subscribe(start_after)
+    headers = {"X-OpenJudge-Session": session_id}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        ndjson_batches(events, batch_ms=max(0, batch_ms), compress=gzip),
+        media_type="application/x-ndjson", headers=headers
+    )
+
+@app.post("/api/v1/judge/resume/{session_id}")
+async def resume_agent_loop(request: Request, session_id: str):
+    """
+    Crash-Recovery Endpoint.
+    Restarts a checkpointed session (session_id from its AGENT_START event) from its
+    last completed iteration and streams the remaining telemetry over SSE.
+    If the session is still running in this process, the client is simply re-attached.
+    """
+    last_event_id = _parse_event_id(request.headers.get("Last-Event-ID"))
+    # Event IDs keep rising across resumes, so the client's Last-Event-ID never hides new events
+    session_registry.start(session_id, lambda sid, token: global_engine.resume(sid, cancel_token=token),
+                           first_event_id=last_event_id + 1)
+    return _sse_stream(session_id, last_event_id)
+
+@app.post("/api/v1/judge/sessions/{session_id}/cancel")
+async def cancel_session(session_id: str):
+    """
+    Cancellation Endpoint.
+    Kills the session's in-flight tool processes, browser and LLM requests; the stream
+    ends with an ENGINE_HALT event whose reason is CANCELLED. The session stays resumable.
+    """
+    if session_registry.get(session_id) is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown or expired session '{session_id}'."})
+    if not session_registry.cancel(session_id):
+        return JSONResponse(status_code=409, content={"error": f"Session '{session_id}' is not running."})
+    return {"session_id": session_id, "status": "cancelling"}
+
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_job(payload: ExecuteRequest):
+    """
+    Durable Submission Endpoint.
+    Enqueues the objective and returns immediately; any worker on the node runs it.
+    """
+    job_id = await asyncio.to_thread(job_queue.enqueue, payload.objective)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, attempt count and (once finished) the run summary."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+    return job
+
+@app.post("/api/v1/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancels a queued job, or stops a running one wherever its worker lives."""
+    status = await asyncio.to_thread(job_queue.cancel, job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+    return {"job_id": job_id, "status": status}
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, last_event_id: Optional[str] = None, poll_interval: float = 0.5,
+                            last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """
+    Job Subscription Endpoint.
+    Streams the persisted telemetry of a job over SSE (whichever process runs it),
+    replaying from Last-Event-ID and following live until the job finishes.
+    """
+    if await asyncio.to_thread(job_queue.get, job_id) is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+
     async def sse_event_generator():
-        # Iterate over the natively generated AsyncGenerator from engine.py
-        async for telemetry_json in global_engine.stream_execute(payload.objective):
-            # Checking if the client disconnected (e.g. closed browser)
-            if await request.is_disconnected():
-                print("[!] Client disconnected. Halting execution.")
-                break
-                
-            # Yield formatted SSE event
-            yield {"data": telemetry_json}
+        cursor = _parse_event_id(last_event_id_header or last_event_id)
+        while True:
+            events = await asyncio.to_thread(job_queue.events_after, job_id, cursor)
+            for seq, telemetry_json in events:
+                cursor = seq
+                yield {"id": str(seq), "data": telemetry_json}
+            if not events:
+                job = await asyncio.to_thread(job_queue.get, job_id)
+                if job["status"] in TERMINAL_STATUSES and job["events"] <= cursor:
+                    break
+                await asyncio.sleep(max(0.05, poll_interval))
 
     return EventSourceResponse(sse_event_generator())
 
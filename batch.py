@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Set
+
+from engine import OpenJudgeEngine
+
+
+def load_objectives(input_path: str) -> List[Dict[str, Any]]:
+    """
+    Reads objectives from a JSONL file. Each line is either a JSON object with an
+    'objective' field (and an optional 'id') or a bare JSON string.
+    Objectives without an explicit id are keyed by their line number.
+    """
+    objectives = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"objective": record}
+            if not record.get("objective"):
+                raise ValueError(f"Line {line_no} of {input_path} has no 'objective' field.")
+            record["id"] = str(record.get("id", line_no))
+            objectives.append(record)
+    return objectives
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """Returns the ids already present in a previous results file (for resumption)."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                completed.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                # A torn final line from an interrupted run; that objective is simply re-run
+                continue
+    return completed
+
+
+def discard_torn_tail(output_path: str) -> None:
+    """Truncates a results file after its last complete line, so new results start on a fresh line."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'r+b') as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def new_summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": record["id"],
+        "objective": record["objective"],
+        "halt_reason": None,
+        "verdict": None,
+        "iterations": 0,
+        "final_logic": None,
+        "tool_calls": 0,
+        "format_violations": 0,
+        "time_to_first_action_s": None,
+    }
+
+
+def fold_event(result: Dict[str, Any], event: Dict[str, Any], elapsed: float) -> None:
+    """Accumulates one telemetry event into a run summary (elapsed = seconds since the run started)."""
+    kind = event.get("event")
+    if kind == "ITERATION_START":
+        result["iterations"] = event["iteration"]
+    elif kind == "TOOL_TRIGGERED":
+        result["tool_calls"] += 1
+        if result["time_to_first_action_s"] is None:
+            result["time_to_first_action_s"] = round(elapsed, 3)
+    elif kind == "FORMAT_VIOLATION":
+        result["format_violations"] += 1
+    elif kind == "API_ERROR":
+        result["error"] = event.get("message")
+    elif kind == "THOUGHT_PROCESS" and event.get("branch") is None:
+        result["verdict"] = event.get("verdict")
+    elif kind == "ENGINE_HALT":
+        result["halt_reason"] = event.get("reason")
+        result["final_logic"] = event.get("final_logic")
+        if event.get("branch") is not None:
+            # A speculative branch only wins with a verified PASS
+            result["verdict"] = "PASS"
+
+
+def succeeded(result: Dict[str, Any]) -> bool:
+    """Only a TERMINATE backed by a PASS verdict is a success (not a halt on iterations, loops or a blocked task)."""
+    return result["halt_reason"] == "TERMINATE_ACHIEVED" and "PASS" in str(result.get("verdict") or "").upper()
+
+
+async def run_objective(engine: OpenJudgeEngine, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Drives one objective through the shared engine and summarizes its telemetry."""
+    started_at = time.time()
+    start = time.perf_counter()
+    result = new_summary(record)
+
+    try:
+        async for telemetry_json in engine.stream_execute(record["objective"]):
+            fold_event(result, json.loads(telemetry_json), time.perf_counter() - start)
+    except Exception as e:
+        result["halt_reason"] = "BATCH_RUNNER_ERROR"
+        result["error"] = str(e)
+
+    result["started_at"] = started_at
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def run_batch(input_path: str, output_path: str, workers: int = 4, max_iterations: int = 25) -> Dict[str, Any]:
+    """
+    Runs every pending objective of input_path through a single warm OpenJudgeEngine
+    with at most `workers` objectives in flight. Results are appended to output_path
+    as they finish, so an interrupted batch resumes where it left off.
+    """
+    objectives = load_objectives(input_path)
+    completed = load_completed_ids(output_path)
+    # The torn line's objective is re-run; its fragment must not swallow the first new result
+    discard_torn_tail(output_path)
+    pending = [record for record in objectives if record["id"] not in completed]
+
+    # Bound the threadpool that carries the blocking LLM and tool calls to the worker count
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(1, workers)))
+
+    engine = OpenJudgeEngine(max_iterations=max_iterations)
+    queue: asyncio.Queue = asyncio.Queue()
+    for record in pending:
+        queue.put_nowait(record)
+
+    halt_counts: Dict[str, int] = {}
+    batch_start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        async def worker():
+            while True:
+                try:
+                    record = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await run_objective(engine, record)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                halt_counts[result["halt_reason"]] = halt_counts.get(result["halt_reason"], 0) + 1
+                print(f"[batch] {record['id']}: {result['halt_reason']} in {result['duration_s']}s", file=sys.stderr)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(pending))))))
+
+    return {
+        "total": len(objectives),
+        "skipped_completed": len(objectives) - len(pending),
+        "executed": len(pending),
+        "halt_reasons": halt_counts,
+        "wall_clock_s": round(time.perf_counter() - batch_start, 3),
+    }
+
+
+def cli(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(
+        prog="openjudge batch",
+        description="Run many OpenJudge objectives from a JSONL file with bounded parallelism."
+    )
+    arg_parser.add_argument("input", help="JSONL file of objectives ({\"id\": ..., \"objective\": ...} per line).")
+    arg_parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results file (appended, resumable).")
+    arg_parser.add_argument("-w", "--workers", type=int, default=4, help="Maximum objectives executed concurrently.")
+    arg_parser.add_argument("--max-iterations", type=int, default=25, help="Iteration cap per objective.")
+    args = arg_parser.parse_args(argv)
+
+    summary = asyncio.run(run_batch(args.input, args.output, args.workers, args.max_iterations))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -2,30 +2,137 @@
 
 /**
  * OpenJudge NPM Wrapper
- * This script serves as the bridge allowing Node.js users to run 
+ * This script serves as the bridge allowing Node.js users to run
  * the Python-based OpenJudge engine globally using `npx openjudge`.
+ *
+ * If a resident daemon is listening (`openjudge daemon start`), objectives are
+ * streamed through its Unix socket and start in milliseconds; otherwise a fresh
+ * Python process is spawned as before.
  */
 
 const { spawnSync } = require('child_process');
+const net = require('net');
+const os = require('os');
 const path = require('path');
-const fs = require('fs');
+const readline = require('readline');
 
 const mainPyPath = path.join(__dirname, '..', 'main.py');
+const args = process.argv.slice(2);
 
-// Check if Python dependencies are likely installed (look for .env or requirements logic)
-console.log("\x1b[36m[OpenJudge] Starting engine wrapper...\x1b[0m");
+// Subcommands that always run in their own Python process
+const PYTHON_ONLY_COMMANDS = new Set(['batch', 'index', 'daemon', '--help', '-h']);
 
-// We prefer 'python3', but fallback to 'python' (especially on Windows)
-const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
+function socketPath() {
+    if (process.env.OPENJUDGE_SOCKET) return process.env.OPENJUDGE_SOCKET;
+    const base = process.env.XDG_RUNTIME_DIR || path.join(os.homedir(), '.cache', 'openjudge');
+    return path.join(base, 'openjudge.sock');
+}
+
+function runInPython() {
+    // Check if Python dependencies are likely installed (look for .env or requirements logic)
+    console.log("\x1b[36m[OpenJudge] Starting engine wrapper...\x1b[0m");
+
+    // We prefer 'python3', but fallback to 'python' (especially on Windows)
+    const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
 
-const result = spawnSync(pythonCmd, [mainPyPath, ...process.argv.slice(2)], {
-    stdio: 'inherit'
-});
+    const result = spawnSync(pythonCmd, [mainPyPath, ...args], {
+        stdio: 'inherit'
+    });
+
+    if (result.error) {
+        console.error(`\x1b[31m[OpenJudge Fatal Error]\x1b[0m Could not spawn Python process. Is Python installed?`);
+        console.error(result.error);
+        process.exit(1);
+    }
+
+    process.exit(result.status);
+}
 
-if (result.error) {
-    console.error(`\x1b[31m[OpenJudge Fatal Error]\x1b[0m Could not spawn Python process. Is Python installed?`);
-    console.error(result.error);
-    process.exit(1);
+function renderEvent(event) {
+    switch (event.event) {
+        case 'AGENT_START':
+            console.log(`\x1b[34m=== ${event.message} ===\x1b[0m`);
+            break;
+        case 'ITERATION_START':
+            console.log(`\n\x1b[35m======== AGENT ITERATION ${event.iteration} ========\x1b[0m`);
+            break;
+        case 'THOUGHT_PROCESS':
+            console.log(`\x1b[36m${event.logical_extern || ''}\x1b[0m`);
+            console.log(`\x1b[1m[*] Verdict: ${event.verdict} | [ENFORCE: ${event.enforcement}]\x1b[0m`);
+            break;
+        case 'TOOL_TRIGGERED':
+            console.log(`\x1b[33m[*] Tool: ${event.tool}\x1b[0m`);
+            break;
+        case 'TOOL_RESULT': {
+            const output = String(event.output_snippet || '');
+            const snippet = output.slice(0, 150).replace(/\n/g, ' ') + (output.length > 150 ? '...' : '');
+            console.log(`\x1b[33m    -> ${snippet}\x1b[0m`);
+            break;
+        }
+        case 'CHAT_RESPONSE':
+            console.log(event.message);
+            break;
+        case 'ENGINE_HALT':
+            console.log(`\n\x1b[1m>>> OpenJudge halted: ${event.reason}\x1b[0m`);
+            if (event.final_logic) console.log(event.final_logic);
+            break;
+        case 'FORMAT_VIOLATION':
+        case 'LOOP_DETECTED':
+        case 'TOOL_ERROR':
+        case 'API_ERROR':
+        case 'CRITICAL_ERROR':
+            console.log(`\x1b[31m[!] ${event.event}: ${event.error || event.message || ''}\x1b[0m`);
+            break;
+        default:
+            break;
+    }
 }
 
-process.exit(result.status);
+function runThroughDaemon(objective) {
+    let halt = null;
+    let buffered = '';
+    const client = net.createConnection(socketPath(), () => {
+        client.write(JSON.stringify({ objective, cwd: process.cwd() }) + '\n');
+    });
+    client.setEncoding('utf8');
+    client.on('data', (chunk) => {
+        buffered += chunk;
+        let newline;
+        while ((newline = buffered.indexOf('\n')) >= 0) {
+            const line = buffered.slice(0, newline);
+            buffered = buffered.slice(newline + 1);
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            renderEvent(event);
+            if (event.event === 'ENGINE_HALT') halt = event.reason;
+            if (event.event === 'CHAT_RESPONSE') halt = 'TERMINATE_ACHIEVED';
+        }
+    });
+    client.on('end', () => process.exit(halt === 'TERMINATE_ACHIEVED' ? 0 : 1));
+    process.on('SIGINT', () => {
+        // Closing the socket makes the daemon abandon the session
+        client.destroy();
+        process.exit(130);
+    });
+}
+
+function withObjective(callback) {
+    if (args.length > 0) return callback(args.join(' '));
+    const rl = readline.createInterface({ input: process.stdin, output: process.stdout });
+    rl.question('Enter the objective for OpenJudge: ', (answer) => {
+        rl.close();
+        callback(answer);
+    });
+}
+
+if (process.platform === 'win32' || PYTHON_ONLY_COMMANDS.has(args[0])) {
+    runInPython();
+} else {
+    // Probe the daemon; any connection failure falls back to a fresh Python process
+    const probe = net.createConnection(socketPath());
+    probe.on('connect', () => {
+        probe.destroy();
+        withObjective(runThroughDaemon);
+    });
+    probe.on('error', runInPython);
+}
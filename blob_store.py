@@ -0,0 +1,74 @@
+import os
+import time
+import hashlib
+import tempfile
+from typing import Optional
+
+
+class BlobStore:
+    """
+    On-disk, content-addressed, deduplicated store for large tool outputs.
+    Blobs are addressed by the SHA-256 of their UTF-8 bytes, so identical outputs
+    across iterations and sessions are stored once. Readers dereference byte ranges
+    on demand instead of keeping whole outputs in the ledger.
+    """
+
+    def __init__(self, directory: str, inline_threshold: int = 2048):
+        self.directory = directory
+        # Outputs up to this many characters stay inline in the ledger
+        self.inline_threshold = inline_threshold
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, blob_hash: str) -> str:
+        if len(blob_hash) != 64 or any(c not in "0123456789abcdef" for c in blob_hash):
+            raise ValueError(f"Invalid blob hash: {blob_hash}")
+        return os.path.join(self.directory, blob_hash[:2], blob_hash[2:])
+
+    def put(self, text: str) -> str:
+        """Stores text (if not already present) and returns its hash."""
+        data = text.encode("utf-8", "replace")
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_hash)
+        if os.path.exists(path):
+            # Deduplicated: refresh the mtime so pruning treats it as recently used
+            os.utime(path)
+            return blob_hash
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Atomic publish: concurrent writers of the same content race harmlessly
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_hash
+
+    def size(self, blob_hash: str) -> int:
+        return os.path.getsize(self._path(blob_hash))
+
+    def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> str:
+        """Returns bytes [start, end) of a blob decoded as UTF-8."""
+        with open(self._path(blob_hash), "rb") as f:
+            f.seek(max(0, start))
+            data = f.read() if end is None else f.read(max(0, end - max(0, start)))
+        return data.decode("utf-8", "replace")
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Deletes blobs not written or deduplicated within max_age_seconds. Returns bytes reclaimed."""
+        cutoff = time.time() - max_age_seconds
+        reclaimed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    if st.st_mtime < cutoff:
+                        os.remove(path)
+                        reclaimed += st.st_size
+                except OSError:
+                    continue
+        return reclaimed
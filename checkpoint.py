@@ -0,0 +1,146 @@
+import os
+import json
+import time
+from urllib.parse import quote, unquote
+from typing import Any, Dict, List, Optional
+
+from state_manager import StateManager
+from blob_store import BlobStore
+
+# Halt reasons after which a session is finished for good; any other halt (e.g. API_DISRUPTION) stays resumable.
+FINAL_HALT_REASONS = {"TERMINATE_ACHIEVED", "MAX_ITERATIONS", "LOOP_DETECTED"}
+
+
+class CheckpointLog:
+    """
+    Crash-safe, append-only checkpoint log of engine sessions (one JSONL file per session).
+    Each completed iteration appends a compact delta record (only the ledger entries added
+    since the previous checkpoint, plus the engine position). Records are flushed on every
+    write and fsync'd in batches, every `fsync_every` records or `fsync_interval` seconds.
+    """
+
+    def __init__(self, directory: str, fsync_every: int = 8, fsync_interval: float = 2.0):
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._handles: Dict[str, Any] = {}
+        self._cursors: Dict[str, Dict[str, int]] = {}
+        self._unsynced: set = set()
+        self._writes_since_sync = 0
+        self._last_sync = time.monotonic()
+
+    def path_for(self, session_id: str) -> str:
+        # Percent-escaping is reversible, so distinct ids never share a ledger file
+        safe_id = quote(session_id, safe="-_")
+        return os.path.join(self.directory, f"{safe_id}.ckpt.jsonl")
+
+    def checkpoint(self, session_id: str, objective: str, state_manager: StateManager, extra: Optional[dict] = None) -> None:
+        """Appends the ledger delta since the last checkpoint of this session."""
+        cursor = self._cursors.setdefault(session_id, {"actions": 0, "failures": 0, "outputs": 0})
+        record = {
+            "session_id": session_id,
+            "objective": objective,
+            "iteration": state_manager.iteration_count,
+            "timestamp": time.time(),
+            "actions": state_manager.history_of_actions[cursor["actions"]:],
+            "failures": state_manager.known_failures[cursor["failures"]:],
+            "outputs": state_manager.tool_outputs[cursor["outputs"]:],
+        }
+        if extra:
+            record.update(extra)
+        self._append(session_id, record)
+        cursor["actions"] = len(state_manager.history_of_actions)
+        cursor["failures"] = len(state_manager.known_failures)
+        cursor["outputs"] = len(state_manager.tool_outputs)
+
+    def mark_halted(self, session_id: str, reason: str) -> None:
+        """Records the terminal event of a session and releases its file handle."""
+        self._append(session_id, {"session_id": session_id, "halted": reason, "timestamp": time.time()})
+        self.close(session_id)
+
+    def load(self, session_id: str, token_budget: int = 6000, blob_store: Optional[BlobStore] = None) -> Optional[dict]:
+        """
+        Replays a session log. Returns None if the session is unknown, otherwise a dict with
+        the rebuilt StateManager, the objective, the last engine extras and the halt reason (if any).
+        """
+        path = self.path_for(session_id)
+        if not os.path.exists(path):
+            return None
+
+        state_manager = StateManager(token_budget=token_budget, blob_store=blob_store)
+        session = {"objective": None, "state_manager": state_manager, "extra": {}, "halted": None}
+        # Byte offset just past the last complete record
+        intact = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: everything before it is intact
+                    break
+                intact += len(line)
+                if "halted" in record:
+                    session["halted"] = record["halted"]
+                    continue
+                session["objective"] = record["objective"]
+                state_manager.iteration_count = record["iteration"]
+                state_manager.history_of_actions.extend(record["actions"])
+                state_manager.known_failures.extend(record["failures"])
+                state_manager.tool_outputs.extend(record["outputs"])
+                session["extra"] = {k: v for k, v in record.items() if k not in
+                                    ("session_id", "objective", "iteration", "timestamp", "actions", "failures", "outputs")}
+                session["halted"] = None
+
+        if os.path.getsize(path) > intact:
+            # Cut the torn fragment off, so records appended by the resumed session stay readable
+            self.close(session_id)
+            with open(path, 'r+b') as f:
+                f.truncate(intact)
+                os.fsync(f.fileno())
+
+        if session["objective"] is None:
+            return None
+        self._cursors[session_id] = {
+            "actions": len(state_manager.history_of_actions),
+            "failures": len(state_manager.known_failures),
+            "outputs": len(state_manager.tool_outputs),
+        }
+        return session
+
+    def list_sessions(self) -> List[str]:
+        return sorted(unquote(name[:-len(".ckpt.jsonl")]) for name in os.listdir(self.directory) if name.endswith(".ckpt.jsonl"))
+
+    def _append(self, session_id: str, record: dict) -> None:
+        handle = self._handles.get(session_id)
+        if handle is None:
+            handle = open(self.path_for(session_id), 'a', encoding='utf-8')
+            self._handles[session_id] = handle
+        # Tools may return non-string output; record it as text rather than fail the checkpoint
+        handle.write(json.dumps(record, default=str) + "\n")
+        handle.flush()
+        self._unsynced.add(session_id)
+        self._writes_since_sync += 1
+        if self._writes_since_sync >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """fsyncs every session file with pending writes."""
+        for session_id in list(self._unsynced):
+            handle = self._handles.get(session_id)
+            if handle is not None:
+                os.fsync(handle.fileno())
+        self._unsynced.clear()
+        self._writes_since_sync = 0
+        self._last_sync = time.monotonic()
+
+    def close(self, session_id: str) -> None:
+        handle = self._handles.pop(session_id, None)
+        if handle is not None:
+            if session_id in self._unsynced:
+                os.fsync(handle.fileno())
+                self._unsynced.discard(session_id)
+            handle.close()
+        self._cursors.pop(session_id, None)
@@ -0,0 +1,79 @@
+import re
+from typing import List
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken missing or its BPE files unavailable offline: fall back to the ~4 chars/token heuristic
+    _ENCODING = None
+
+ERROR_LINE_PATTERN = re.compile(r'error|exception|traceback|fail|fatal|denied|not found|timed out', re.IGNORECASE)
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with the local tokenizer (tiktoken when available)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Returns the longest prefix of text that fits within max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return _ENCODING.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def digest_output(text: str, max_tokens: int) -> str:
+    """
+    Compacts a tool output into at most max_tokens.
+    Outputs that contain error lines are reduced to an error-line extract (the lines
+    that matter for the next decision); everything else becomes a head/tail digest.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    lines = text.splitlines()
+    error_lines = [line for line in lines if ERROR_LINE_PATTERN.search(line)]
+    if error_lines:
+        header = f"[ERROR-LINE EXTRACT | {len(error_lines)} of {len(lines)} lines]"
+        return _fit_lines(header, error_lines, max_tokens)
+
+    # Head/tail digest: keep as many lines from both ends as fit
+    keep = max(1, min(len(lines) // 2, 20))
+    while keep > 0:
+        omitted = len(lines) - 2 * keep
+        digest = "\n".join(
+            lines[:keep]
+            + [f"... [DIGEST | {omitted} lines / ~{count_tokens(text)} tokens omitted] ..."]
+            + lines[-keep:]
+        )
+        if count_tokens(digest) <= max_tokens:
+            return digest
+        keep //= 2
+
+    # A single huge line (minified HTML, base64...): cut it
+    return truncate_to_tokens(text, max(0, max_tokens - 8)) + "... [TRUNCATED]"
+
+
+def _fit_lines(header: str, lines: List[str], max_tokens: int) -> str:
+    """Keeps the newest lines that fit behind the header."""
+    kept: List[str] = []
+    used = count_tokens(header) + 1
+    for line in reversed(lines):
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if not kept:
+        return truncate_to_tokens(header + "\n" + lines[-1], max_tokens)
+    return "\n".join([header] + list(reversed(kept)))
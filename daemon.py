@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import subprocess
+from typing import Iterator, List, Optional
+
+from tool_context import CancellationToken, tool_workdir
+
+
+def default_socket_path() -> str:
+    base = os.getenv("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "openjudge")
+    return os.getenv("OPENJUDGE_SOCKET", os.path.join(base, "openjudge.sock"))
+
+
+class OpenJudgeDaemon:
+    """
+    Resident OpenJudge process listening on a Unix socket.
+    Keeps one warm engine (LLM gateway connections, tokenizer, tool caches, sandbox
+    slots, triage classifier) so CLI invocations skip interpreter start-up and imports.
+
+    Protocol (newline-delimited JSON): the client sends one request line,
+    {"objective": "...", "cwd": "..."} or {"command": "ping" | "shutdown"}, and the
+    daemon streams the session's telemetry events back, one JSON object per line.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, max_iterations: int = 25):
+        from engine import OpenJudgeEngine
+        from main import triage_route, CHAT_SYSTEM_PROMPT
+        from llm_client import get_gateway
+        from model_router import routed_call
+
+        self.socket_path = socket_path or default_socket_path()
+        self.engine = OpenJudgeEngine(max_iterations=max_iterations)
+        self.triage_route = triage_route
+        self.chat_system_prompt = CHAT_SYSTEM_PROMPT
+        self.routed_call = routed_call
+        # Open the gateway (and its HTTP clients) now rather than on the first request
+        get_gateway()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stop = asyncio.Event()
+        self.started_at = time.time()
+        self.sessions_served = 0
+
+    async def serve_forever(self) -> None:
+        directory = os.path.dirname(self.socket_path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if _is_alive(self.socket_path):
+                raise RuntimeError(f"An OpenJudge daemon is already listening on {self.socket_path}.")
+            os.unlink(self.socket_path)
+
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"[daemon] OpenJudge daemon (pid {os.getpid()}) listening on {self.socket_path}", flush=True)
+        try:
+            async with self._server:
+                await self._stop.wait()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _send(self, writer: asyncio.StreamWriter, line: str) -> None:
+        writer.write(line.encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await reader.readline()
+            if not line:
+                # Connection probe from the CLI wrapper
+                return
+            request = json.loads(line)
+            command = request.get("command")
+            if command == "ping":
+                await self._send(writer, json.dumps({
+                    "event": "PONG", "pid": os.getpid(), "uptime_s": round(time.time() - self.started_at, 1),
+                    "sessions_served": self.sessions_served
+                }))
+            elif command == "shutdown":
+                await self._send(writer, json.dumps({"event": "DAEMON_SHUTDOWN", "pid": os.getpid()}))
+                self.stop()
+            elif request.get("objective"):
+                await self._run_session(request, reader, writer)
+            else:
+                await self._send(writer, json.dumps({"event": "CRITICAL_ERROR", "message": "Request needs an 'objective' or a 'command'."}))
+        except (ConnectionResetError, BrokenPipeError):
+            # The CLI went away (Ctrl+C): the session generator is closed below
+            pass
+        except ValueError as e:
+            await self._send(writer, json.dumps({"event": "CRITICAL_ERROR", "message": f"Malformed request: {e}"}))
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+    async def _run_session(self, request: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        objective = request["objective"]
+        self.sessions_served += 1
+        # Each connection is its own task: its tools (and their worker threads) resolve
+        # relative paths against the client's directory, so sessions can run concurrently
+        cwd = request.get("cwd")
+        if cwd and os.path.isdir(cwd):
+            tool_workdir.set(os.path.abspath(cwd))
+
+        route = await asyncio.to_thread(self.triage_route, objective)
+        if route == "CHAT":
+            response, _ = await asyncio.to_thread(self.routed_call, "chat", self.chat_system_prompt, objective)
+            await self._send(writer, json.dumps({"event": "CHAT_RESPONSE", "message": response}))
+            return
+
+        # The client sends nothing after its request: EOF means it went away (Ctrl+C),
+        # even while a long tool run produces no events to fail a write on
+        cancel_token = CancellationToken()
+
+        async def watch_client():
+            while await reader.read(4096):
+                pass
+            cancel_token.cancel("CLIENT_DISCONNECTED")
+        watcher = asyncio.create_task(watch_client())
+
+        events = self.engine.stream_execute(objective, cancel_token=cancel_token)
+        try:
+            async for telemetry_json in events:
+                await self._send(writer, telemetry_json)
+        finally:
+            watcher.cancel()
+            await events.aclose()
+
+
+def _is_alive(socket_path: str) -> bool:
+    try:
+        return bool(request_daemon({"command": "ping"}, socket_path, timeout=1.0))
+    except OSError:
+        return False
+
+
+def request_daemon(request: dict, socket_path: Optional[str] = None, timeout: Optional[float] = None) -> List[dict]:
+    return list(stream_from_daemon(request, socket_path, timeout))
+
+
+def stream_from_daemon(request: dict, socket_path: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[dict]:
+    """Thin client: sends one request and yields the daemon's events as they arrive."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path or default_socket_path())
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def start_detached(socket_path: str, log_path: str) -> int:
+    """Starts `daemon.py serve` in its own session and waits until it answers pings."""
+    with open(log_path, "a", encoding="utf-8") as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--socket", socket_path],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Daemon exited during start-up (see {log_path}).")
+        if _is_alive(socket_path):
+            return proc.pid
+        time.sleep(0.1)
+    raise RuntimeError(f"Daemon did not come up within 60s (see {log_path}).")
+
+
+def cli(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(prog="openjudge daemon", description="Resident OpenJudge engine on a Unix socket.")
+    arg_parser.add_argument("command", choices=["serve", "start", "stop", "status", "run"],
+                            help="serve: foreground; start: background; run: execute an objective through the daemon.")
+    arg_parser.add_argument("objective", nargs="*", help="Objective for `run`.")
+    arg_parser.add_argument("--socket", default=default_socket_path(), help="Unix socket path.")
+    arg_parser.add_argument("--max-iterations", type=int, default=25)
+    args = arg_parser.parse_args(argv)
+
+    if os.name != "posix":
+        sys.exit("[daemon] Unix sockets are not available on this platform; use the regular CLI.")
+
+    if args.command == "serve":
+        async def serve():
+            daemon = OpenJudgeDaemon(args.socket, args.max_iterations)
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                asyncio.get_running_loop().add_signal_handler(sig, daemon.stop)
+            await daemon.serve_forever()
+        asyncio.run(serve())
+    elif args.command == "start":
+        if _is_alive(args.socket):
+            print(f"[daemon] Already running on {args.socket}.")
+            return
+        log_path = os.path.join(os.path.dirname(args.socket), "openjudge-daemon.log")
+        os.makedirs(os.path.dirname(args.socket), mode=0o700, exist_ok=True)
+        print(f"[daemon] Started (pid {start_detached(args.socket, log_path)}) on {args.socket}; log: {log_path}")
+    elif args.command == "stop":
+        if not _is_alive(args.socket):
+            print("[daemon] Not running.")
+            return
+        request_daemon({"command": "shutdown"}, args.socket, timeout=5)
+        print("[daemon] Stopped.")
+    elif args.command == "status":
+        try:
+            print(json.dumps(request_daemon({"command": "ping"}, args.socket, timeout=2)[0]))
+        except OSError:
+            print("[daemon] Not running.")
+            sys.exit(1)
+    elif args.command == "run":
+        objective = " ".join(args.objective) or input("Enter the objective for OpenJudge: ")
+        halt = None
+        for event in stream_from_daemon({"objective": objective, "cwd": os.getcwd()}, args.socket):
+            print(json.dumps(event), flush=True)
+            halt = event.get("reason") if event.get("event") == "ENGINE_HALT" else halt
+            if event.get("event") == "CHAT_RESPONSE":
+                halt = "TERMINATE_ACHIEVED"
+        sys.exit(0 if halt == "TERMINATE_ACHIEVED" else 1)
+
+
+if __name__ == "__main__":
+    cli(sys.argv[1:])
@@ -1,21 +1,118 @@
 import os
 import json
+import time
+import uuid
 import asyncio
-from typing import Callable, Dict, Any, AsyncGenerator
+import functools
+from typing import Callable, Dict, Any, AsyncGenerator, Hashable, List, Optional
 
-from parser import OpenJudgeParser, FormatViolationError
+from parser import OpenJudgeParser, FormatViolationError, build_step_schema, tool_parameters
 from state_manager import StateManager
 from llm_client import call_llm
+from model_router import ModelRouter, SessionRoute, model_router
+from tool_cache import ToolResultCache, file_state_key, normalized_text_key
+from loop_detector import LoopDetector
+from checkpoint import CheckpointLog, FINAL_HALT_REASONS
+from blob_store import BlobStore
+from speculation import ScratchWorkspace
+from tool_context import tool_workdir, CancellationToken, SessionCancelled, run_cancellable
 import tools
 
+# Response protocols: "xml" is the OPENJUDGE.md tag contract parsed by regex; "json" sends the
+# tools as typed function schemas and receives one schema-constrained JSON object per step
+PROTOCOLS = ("xml", "json")
+
+# Minimum seconds between two blob store prunes triggered by session halts
+BLOB_PRUNE_INTERVAL = 3600
+
+# Ledger entry of a tool killed by a cancellation before it returned
+CANCELLED_TOOL_OUTPUT = "[CANCELLED] Tool killed before it finished; any changes it made may be partial."
+
+STRUCTURED_OUTPUT_FORMAT = """OUTPUT FORMAT (MANDATORY, STRUCTURED JSON)
+Return ONLY one JSON object with exactly these fields. No markdown, no XML, no [ENFORCE:] tag.
+- "state_memory": what criteria you are checking, and your internal reasoning for this iteration.
+- "logical_extern": the step-by-step verification logic needed to prove the criteria.
+- "tool_call": null if no tool is needed, otherwise {"name": <a tool from the Registry below>, "arguments": {...}}
+  with every argument of that tool; optional arguments you do not use are null.
+- "verdict": "PASS", "FAIL" or "UNAVAILABLE". Must correspond to the current evidence.
+- "enforcement": "PROCEED", "PURGE", "PIVOT" or "TERMINATE" (see ACTION TAGS).
+
+"""
+
+STRUCTURED_TOOL_REGISTRY = """### TOOL REGISTRY
+You have access to the following deterministic tools. Call one through "tool_call", passing the typed arguments listed for it.
+
+"""
+
+
+def _signature(parameters: dict) -> str:
+    """Compact argument list of a tool schema for the prompt, e.g. `filepath: string, count?: integer`."""
+    arguments = []
+    for name, schema in parameters.get("properties", {}).items():
+        types = schema.get("type", "any")
+        types = types if isinstance(types, list) else [types]
+        optional = "null" in types
+        if "enum" in schema:
+            kind = " | ".join(json.dumps(v) for v in schema["enum"] if v is not None)
+        else:
+            kind = " | ".join(t for t in types if t != "null")
+        arguments.append(f"{name}{'?' if optional else ''}: {kind}")
+    return ", ".join(arguments)
+
+
+def _present(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Drops null optional arguments so the tool's own defaults apply."""
+    return {k: v for k, v in arguments.items() if v is not None}
+
+
 class OpenJudgeEngine:
-    def __init__(self, max_iterations: int = 25):
+    def __init__(self, max_iterations: int = 25, context_token_budget: int = 6000,
+                 loop_threshold: int = 3, loop_halt_after: int = 2, checkpoint_dir: Optional[str] = None,
+                 blob_dir: Optional[str] = None, speculative_branches: int = 0, speculate_at_start: bool = False,
+                 max_speculation_rounds: int = 2, scratch_root: Optional[str] = None,
+                 router: Optional[ModelRouter] = None, confirm_terminate: bool = True,
+                 protocol: Optional[str] = None, blob_max_age_days: Optional[float] = None):
         self.max_iterations = max_iterations
+        self.context_token_budget = context_token_budget
+        # Loop enforcement: a repetition seen loop_threshold times triggers an override,
+        # the loop_halt_after-th detection halts the session with LOOP_DETECTED.
+        self.loop_threshold = loop_threshold
+        self.loop_halt_after = loop_halt_after
+        # Crash-safe session checkpoints (disabled unless a directory is given)
+        self.checkpoints = CheckpointLog(checkpoint_dir) if checkpoint_dir else None
+        # Content-addressed store keeping large tool outputs out of the in-memory ledger
+        self.blob_store = BlobStore(blob_dir or os.path.expanduser(
+            os.getenv("OPENJUDGE_BLOB_DIR", os.path.join("~", ".cache", "openjudge", "blobs"))
+        ))
+        # Blobs unused for this long are pruned when a session halts (at most once per BLOB_PRUNE_INTERVAL)
+        self.blob_max_age = 86400 * (blob_max_age_days if blob_max_age_days is not None
+                                     else float(os.getenv("OPENJUDGE_BLOB_MAX_AGE_DAYS", 7)))
+        self._blob_pruned_at = 0.0
+        # Speculative execution (opt-in): on PIVOT (and optionally at the start) fork
+        # `speculative_branches` branches into scratch copies of the working directory,
+        # race them, and keep the first one that TERMINATEs with a PASS verdict.
+        self.speculative_branches = speculative_branches
+        self.speculate_at_start = speculate_at_start
+        self.max_speculation_rounds = max_speculation_rounds
+        self.scratch_root = scratch_root
+        # Model per call: main reasoning starts on the cheapest model of its ladder and
+        # escalates after format violations and loops. With confirm_terminate, a
+        # TERMINATE from a cheaper model is re-checked by the strongest one before halting.
+        self.router = router or model_router
+        self.confirm_terminate = confirm_terminate
+        # Response protocol (OPENJUDGE_PROTOCOL): "xml" tags, or "json" structured output whose
+        # typed tool arguments replace the pipe-delimited payloads
+        self.protocol = (protocol or os.getenv("OPENJUDGE_PROTOCOL", "xml")).strip().lower()
+        if self.protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol {self.protocol!r}. Expected one of: {', '.join(PROTOCOLS)}.")
         self.parser = OpenJudgeParser()
+        # LLM self-healing calls saved by local format repair, across all sessions
+        self.format_repairs = 0
         self.registered_tools: Dict[str, Dict[str, Any]] = {}
         
         # Load the base system prompt blueprint
         self.system_prompt_blueprint = self._load_blueprint()
+        self.structured_blueprint = self._structured_blueprint()
         
         # Automatically register the standard toolset
         self._register_default_tools()
@@ -28,14 +125,49 @@ class OpenJudgeEngine:
         except FileNotFoundError:
             return "CRITICAL ERROR: OPENJUDGE.md blueprint not found. The Engine cannot function."
 
-    def register_tool(self, name: str, description: str, func: Callable[[str], str]):
+    def register_tool(self, name: str, description: str, func: Callable[[str], str],
+                      idempotent: bool = False, cache_key: Optional[Callable[[str], Hashable]] = None,
+                      invalidates: Optional[List[str]] = None, parameters: Optional[dict] = None,
+                      structured: Optional[Callable[..., str]] = None):
         """
         BYOT SDK Endpoint: Allows developers to dynamically inject custom tools 
         into the OpenJudge cognitive loop.
+        Tools marked idempotent are memoized per session. `cache_key` maps the payload
+        to a key (return None to skip caching) and should embed validity signals;
+        `invalidates` lists tools whose cached results this tool makes stale.
+        For the json protocol, `parameters` is the strict JSON schema of the tool's
+        arguments (see parser.tool_parameters) and `structured` receives them as keyword
+        arguments. Without them the tool takes a single string argument, `payload`.
         """
+        if parameters is None:
+            parameters = tool_parameters({"payload": {"type": "string"}})
+            structured = structured or (lambda payload: func(payload))
         self.registered_tools[name] = {
             "description": description,
-            "func": func
+            "func": func,
+            "idempotent": idempotent,
+            "cache_key": cache_key,
+            "invalidates": invalidates or [],
+            "parameters": parameters,
+            "structured": structured or func
+        }
+
+    def _structured_blueprint(self) -> str:
+        """OPENJUDGE.md with its XML output contract and registry preamble swapped for the JSON ones."""
+        head, found, rest = self.system_prompt_blueprint.partition("OUTPUT FORMAT (MANDATORY")
+        rules_at, registry_at = rest.find("ACTION TAGS"), rest.find("### TOOL REGISTRY")
+        if not found or rules_at < 0 or registry_at < rules_at:
+            return self.system_prompt_blueprint
+        return head + STRUCTURED_OUTPUT_FORMAT + rest[rules_at:registry_at] + STRUCTURED_TOOL_REGISTRY + "{{TOOL_REGISTRY_PLACEHOLDER}}\n"
+
+    def tool_schemas(self) -> Dict[str, dict]:
+        return {name: metadata["parameters"] for name, metadata in self.registered_tools.items()}
+
+    def _response_format(self) -> dict:
+        """Strict json_schema response format constraining each step (json protocol)."""
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "openjudge_step", "strict": True, "schema": build_step_schema(self.tool_schemas())}
         }
 
     def _generate_dynamic_prompt(self, state_context: str) -> str:
@@ -44,27 +176,148 @@ class OpenJudgeEngine:
         """
         registry_text = ""
         for i, (name, metadata) in enumerate(self.registered_tools.items(), 1):
-            registry_text += f"{i}. **{name}**\n   - {metadata['description']}\n"
-            
-        base_prompt = self.system_prompt_blueprint.replace("{{TOOL_REGISTRY_PLACEHOLDER}}", registry_text)
+            if self.protocol == "json":
+                # Typed arguments replace the payload conventions of the XML protocol
+                lines = [line for line in metadata["description"].split("\n") if not line.strip().startswith("Payload:")]
+                details = "".join(f"{line}\n" if line.startswith("   ") else f"   - {line.strip()}\n" for line in lines if line.strip())
+                registry_text += f"{i}. **{name}**({_signature(metadata['parameters'])})\n{details}"
+            else:
+                registry_text += f"{i}. **{name}**\n   - {metadata['description']}\n"
+
+        blueprint = self.structured_blueprint if self.protocol == "json" else self.system_prompt_blueprint
+        base_prompt = blueprint.replace("{{TOOL_REGISTRY_PLACEHOLDER}}", registry_text)
         return f"{base_prompt}\n\n{state_context}"
 
-    async def stream_execute(self, user_goal: str) -> AsyncGenerator[str, None]:
+    async def stream_execute(self, user_goal: str, session_id: Optional[str] = None,
+                             cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[str, None]:
         """
         The Enterprise Streaming API. Executes the autonomous agent loop and 
         yields structured JSON telemetry events to empower "Observer UI" dashboards.
+        Cancelling `cancel_token` kills the in-flight tool or LLM call and halts with
+        CANCELLED; closing the generator early cancels it as well.
         """
-        state_manager = StateManager()
+        session_id = session_id or uuid.uuid4().hex
+        cancel_token = cancel_token or CancellationToken()
+        state_manager = StateManager(token_budget=self.context_token_budget, blob_store=self.blob_store)
+        loop_detector = LoopDetector(repeat_threshold=self.loop_threshold, halt_after=self.loop_halt_after)
         
         yield json.dumps({
             "event": "AGENT_START",
+            "session_id": session_id,
             "message": f"Booting OpenJudge Engine. Objective: {user_goal}",
             "registered_tools": list(self.registered_tools.keys())
         })
-        
+
+        try:
+            async for telemetry_json in self._agent_loop(session_id, user_goal, state_manager, loop_detector,
+                                                         cancel_token=cancel_token):
+                yield telemetry_json
+        except (GeneratorExit, asyncio.CancelledError):
+            # The consumer went away (closed stream, cancelled task): release the in-flight work
+            cancel_token.cancel("ABANDONED")
+            raise
+
+    async def resume(self, session_id: str, cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[str, None]:
+        """
+        Resume API: restarts a checkpointed session from its last completed iteration,
+        e.g. after a worker restart, without re-paying earlier LLM calls and tool runs.
+        CANCELLED sessions can be resumed as well.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        session = self.checkpoints.load(session_id, self.context_token_budget, self.blob_store) if self.checkpoints else None
+        if session is None:
+            yield json.dumps({"event": "ENGINE_HALT", "reason": "SESSION_NOT_FOUND", "session_id": session_id})
+            return
+        if session["halted"] in FINAL_HALT_REASONS:
+            yield json.dumps({"event": "ENGINE_HALT", "reason": session["halted"], "session_id": session_id, "resumed": False})
+            return
+
+        state_manager = session["state_manager"]
+        loop_detector = LoopDetector(repeat_threshold=self.loop_threshold, halt_after=self.loop_halt_after)
+        loop_detector.restore(session["extra"].get("loop_detector", {}))
+
+        yield json.dumps({
+            "event": "AGENT_RESUMED",
+            "session_id": session_id,
+            "message": f"Resuming OpenJudge session after iteration {state_manager.iteration_count}. Objective: {session['objective']}",
+            "iteration": state_manager.iteration_count,
+            "registered_tools": list(self.registered_tools.keys())
+        })
+
+        try:
+            async for telemetry_json in self._agent_loop(session_id, session["objective"], state_manager, loop_detector,
+                                                         cancel_token=cancel_token):
+                yield telemetry_json
+        except (GeneratorExit, asyncio.CancelledError):
+            cancel_token.cancel("ABANDONED")
+            raise
+
+    def _checkpoint(self, session_id: str, user_goal: str, state_manager: StateManager, loop_detector: LoopDetector) -> None:
+        if self.checkpoints:
+            self.checkpoints.checkpoint(session_id, user_goal, state_manager, {"loop_detector": loop_detector.to_dict()})
+
+    def _halt(self, session_id: str, user_goal: str, state_manager: StateManager,
+              loop_detector: LoopDetector, halt_event: Dict[str, Any]) -> str:
+        """Checkpoints the final ledger, records the halt and returns the ENGINE_HALT event."""
+        if self.checkpoints:
+            self._checkpoint(session_id, user_goal, state_manager, loop_detector)
+            self.checkpoints.mark_halted(session_id, halt_event["reason"])
+        self._prune_blobs()
+        return json.dumps({"event": "ENGINE_HALT", **halt_event})
+
+    def _prune_blobs(self) -> None:
+        """Reclaims blobs no session has written or deduplicated within blob_max_age."""
+        now = time.monotonic()
+        if self.blob_max_age <= 0 or (self._blob_pruned_at and now - self._blob_pruned_at < BLOB_PRUNE_INTERVAL):
+            return
+        self._blob_pruned_at = now
+        self.blob_store.prune(self.blob_max_age)
+
+    async def _agent_loop(self, session_id: str, user_goal: str, state_manager: StateManager,
+                          loop_detector: LoopDetector, branch: Optional[int] = None,
+                          cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[str, None]:
+        """
+        The verification loop. With `branch` set it runs as one speculative branch:
+        nothing is checkpointed and it never forks again.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        tool_cache = ToolResultCache(blob_store=self.blob_store)
+        checkpointed_iteration = state_manager.iteration_count
+        speculation_rounds = 0
+        # Routing: the class and escalation tier of the next call, and the previous call's
+        # route, which the next verdict judges
+        route = SessionRoute(self.router, self.confirm_terminate)
+        # Format violations repaired locally, each one an LLM retry not spent
+        repaired_steps = 0
+
+        def halt(halt_event: Dict[str, Any]) -> str:
+            if branch is not None:
+                return json.dumps({"event": "ENGINE_HALT", **halt_event})
+            return self._halt(session_id, user_goal, state_manager, loop_detector, halt_event)
+
+        if branch is None and self.speculate_at_start and self.speculative_branches > 1 and state_manager.iteration_count == 0:
+            speculation_rounds += 1
+            outcome: Dict[str, Any] = {}
+            async for telemetry_json in self._speculate(session_id, user_goal, state_manager, loop_detector,
+                                                        "START", None, outcome, cancel_token):
+                yield telemetry_json
+            if outcome.get("winner") is not None:
+                yield halt({"reason": "TERMINATE_ACHIEVED", "final_logic": outcome["final_logic"], "branch": outcome["winner"]})
+                return
+
         while True:
+            # Checkpoint the previously completed iteration before starting the next one
+            if branch is None and state_manager.iteration_count > checkpointed_iteration:
+                self._checkpoint(session_id, user_goal, state_manager, loop_detector)
+                checkpointed_iteration = state_manager.iteration_count
+
+            if cancel_token.cancelled:
+                yield halt({"reason": "CANCELLED", "cancel_reason": cancel_token.reason,
+                            "state_dump": state_manager.format_for_prompt()})
+                break
+
             if state_manager.iteration_count >= self.max_iterations:
-                yield json.dumps({"event": "ENGINE_HALT", "reason": "MAX_ITERATIONS", "state_dump": state_manager.format_for_prompt()})
+                yield halt({"reason": "MAX_ITERATIONS", "state_dump": state_manager.format_for_prompt()})
                 break
 
             state_manager.increment_iteration()
@@ -78,17 +331,45 @@ class OpenJudgeEngine:
             
             yield json.dumps({"event": "LLM_INFERENCE_START", "iteration": iter_num})
             
-            # Note: call_llm is synchronous, in a real ASGI backend we might run this in a threadpool
-            # but for this V3 initial prototype we yield before and after.
-            raw_response = call_llm(structured_system, f"USER OBJECTIVE: {user_goal}")
+            # call_llm is synchronous; run it in the default threadpool so concurrent
+            # sessions sharing this engine (API workers, batch mode) keep interleaving.
+            model = route.select()
+            user_prompt = f"USER OBJECTIVE: {user_goal}"
+            llm_call = call_llm
+            if self.protocol == "json":
+                llm_call = functools.partial(call_llm, response_format=self._response_format())
+            started = time.perf_counter()
+            try:
+                raw_response = await run_cancellable(cancel_token, llm_call, structured_system, user_prompt, model)
+            except SessionCancelled:
+                # Nothing of this iteration reached the ledger: roll it back so the checkpoint
+                # written at the top of the loop does not record it as completed
+                state_manager.discard_iteration()
+                continue
             
             if "[CRITICAL LLM API ERROR]" in raw_response:
+                self.router.record_outcome(route.call_class, model, False)
                 yield json.dumps({"event": "API_ERROR", "message": raw_response})
-                yield json.dumps({"event": "ENGINE_HALT", "reason": "API_DISRUPTION"})
+                yield halt({"reason": "API_DISRUPTION"})
                 break
 
+            self.router.record_call(route.call_class, model, time.perf_counter() - started, structured_system + user_prompt, raw_response)
+
+            running_tool = None
             try:
-                parsed_data = self.parser.parse(raw_response)
+                repairs: List[str] = []
+                if self.protocol == "json":
+                    parsed_data = self.parser.parse_structured(raw_response, self.tool_schemas())
+                else:
+                    # Near misses (fences, tag case, unclosed blocks) are fixed locally instead of
+                    # spending a self-healing iteration
+                    parsed_data, repairs = self.parser.parse_or_repair(raw_response)
+                if repairs:
+                    self.format_repairs += 1
+                    repaired_steps += 1
+                    state_manager.add_action(f"Format repair: {'; '.join(repairs)} (reply in the exact format)")
+                    yield json.dumps({"event": "FORMAT_REPAIRED", "iteration": iter_num, "repairs": repairs,
+                                      "llm_calls_saved": repaired_steps})
                 enforcement = parsed_data.get("enforcement")
                 tool_req = parsed_data.get("tool_required")
                 tool_payload = parsed_data.get("tool_payload")
@@ -100,73 +381,282 @@ class OpenJudgeEngine:
                     "state_memory": parsed_data.get("state_memory"),
                     "logical_extern": parsed_data.get("logical_extern"),
                     "verdict": parsed_data.get("verdict"),
-                    "enforcement": enforcement
+                    "enforcement": enforcement,
+                    "model": model
                 })
+
+                route.on_step(model, enforcement)
+
+                stronger = route.confirm_terminate_by(model) if enforcement == "TERMINATE" else None
+                if stronger:
+                    state_manager.add_action(f"Agent Action: TERMINATE proposed by {model}; re-verification by {stronger} required")
+                    yield json.dumps({"event": "MODEL_ESCALATED", "iteration": iter_num, "reason": "CONFIRM_TERMINATE",
+                                      "from": model, "to": stronger})
+                    continue
                 
                 if enforcement == "TERMINATE":
-                    yield json.dumps({"event": "ENGINE_HALT", "reason": "TERMINATE_ACHIEVED", "final_logic": parsed_data.get("logical_extern")})
+                    yield halt({"reason": "TERMINATE_ACHIEVED", "final_logic": parsed_data.get("logical_extern")})
                     break
 
+                if (enforcement == "PIVOT" and branch is None and self.speculative_branches > 1
+                        and speculation_rounds < self.max_speculation_rounds):
+                    # Race several candidate strategies instead of following one new plan serially
+                    speculation_rounds += 1
+                    state_manager.add_action("Agent Action: PIVOT (speculative fork)")
+                    outcome = {}
+                    async for telemetry_json in self._speculate(session_id, user_goal, state_manager, loop_detector,
+                                                                "PIVOT", parsed_data.get("logical_extern"), outcome,
+                                                                cancel_token):
+                        yield telemetry_json
+                    if outcome.get("winner") is not None:
+                        yield halt({"reason": "TERMINATE_ACHIEVED", "final_logic": outcome["final_logic"], "branch": outcome["winner"]})
+                        break
+                    continue
+
                 if enforcement in ["PROCEED", "PURGE", "PIVOT"]:
                     state_manager.add_action(f"Agent Action: {enforcement}")
                     
                     if tool_req and tool_req in self.registered_tools:
                         yield json.dumps({"event": "TOOL_TRIGGERED", "tool": tool_req, "payload": tool_payload})
                         
-                        tool_func = self.registered_tools[tool_req]["func"]
-                        try:
-                            tool_output = tool_func(tool_payload)
-                        except Exception as tool_e:
-                            tool_output = f"[ERROR] Tool failed: {str(tool_e)}"
+                        tool_meta = self.registered_tools[tool_req]
+                        running_tool = tool_req
+                        tool_output, cached = await self._run_tool(tool_req, tool_meta, tool_payload, tool_cache, cancel_token,
+                                                                   parsed_data.get("tool_arguments"))
+                        running_tool = None
                             
                         # Feed the exact truth back to the ledger
-                        state_manager.add_tool_output(tool_req, tool_output)
+                        state_manager.add_tool_output(tool_req, tool_output, cached=cached)
+                        loop_detector.observe_step(tool_req, tool_payload, tool_output)
                         
                         yield json.dumps({
                             "event": "TOOL_RESULT",
                             "tool": tool_req,
+                            "cached": cached,
+                            "usage": getattr(tool_output, "usage", None),
                             "output_snippet": str(tool_output)[:200] + ("..." if len(str(tool_output)) > 200 else "")
                         })
                     elif tool_req:
                         err_msg = f"[ERROR] Tool '{tool_req}' requested but is not registered in the BYOT registry."
                         state_manager.add_tool_output(tool_req, err_msg)
+                        loop_detector.observe_step(tool_req, tool_payload, err_msg)
                         yield json.dumps({"event": "TOOL_ERROR", "message": err_msg})
                     else:
                         yield json.dumps({"event": "NO_TOOL_REQUESTED", "message": "Enforcement tag received but no physical tool was designated."})
 
+                    # Loop & Stall Enforcement
+                    loop_description = loop_detector.observe_iteration(parsed_data.get("verdict"), enforcement)
+                    if loop_description:
+                        yield json.dumps({"event": "LOOP_DETECTED", "iteration": iter_num, "message": loop_description})
+                        if loop_detector.should_halt:
+                            yield halt({"reason": "LOOP_DETECTED", "state_dump": state_manager.format_for_prompt()})
+                            break
+                        state_manager.add_failure(loop_detector.override_message(loop_description))
+                        escalated = route.on_loop()
+                        if escalated:
+                            yield json.dumps({"event": "MODEL_ESCALATED", "iteration": iter_num, "reason": "LOOP_DETECTED",
+                                              "from": model, "to": escalated})
+
+            except SessionCancelled:
+                # The killed tool may have done part of its work: the ledger (and the checkpoint a
+                # resume starts from) records that instead of a result
+                if running_tool:
+                    state_manager.add_tool_output(running_tool, CANCELLED_TOOL_OUTPUT)
+                # The CANCELLED halt is emitted at the top of the loop
+                continue
+
             except FormatViolationError as e:
                 err_text = str(e)
                 yield json.dumps({"event": "FORMAT_VIOLATION", "error": err_text})
+
+                escalated = route.on_violation(model)
+                if escalated:
+                    yield json.dumps({"event": "MODEL_ESCALATED", "iteration": iter_num, "reason": "FORMAT_VIOLATION",
+                                      "from": model, "to": escalated})
                 
                 # Self-Healing
-                override_msg = (
-                    f"SYSTEM OVERRIDE: Invalid output format. {err_text} "
-                    "You MUST output the <openjudge_process> XML block containing <state_memory>, "
-                    "<logical_extern>, <verdict>, and optionally <tool_required>, <tool_payload>. "
-                    "End your response with an [ENFORCE: ACTION] tag. Fix immediately."
-                )
+                if self.protocol == "json":
+                    override_msg = (
+                        f"SYSTEM OVERRIDE: Invalid output format. {err_text} "
+                        "You MUST return one JSON object with state_memory, logical_extern, tool_call "
+                        "(null or a registered tool with its typed arguments), verdict and enforcement. Fix immediately."
+                    )
+                else:
+                    override_msg = (
+                        f"SYSTEM OVERRIDE: Invalid output format. {err_text} "
+                        "You MUST output the <openjudge_process> XML block containing <state_memory>, "
+                        "<logical_extern>, <verdict>, and optionally <tool_required>, <tool_payload>. "
+                        "End your response with an [ENFORCE: ACTION] tag. Fix immediately."
+                    )
                 state_manager.add_failure(override_msg)
                 
             except Exception as generic_e:
                 yield json.dumps({"event": "CRITICAL_ERROR", "message": str(generic_e)})
                 state_manager.add_failure(str(generic_e))
 
+    def _branch_directive(self, index: int, count: int, trigger: str, pivot_logic: Optional[str]) -> str:
+        if index == 0:
+            plan = (f"pursue the pivot you just proposed: {pivot_logic[:600]}" if pivot_logic
+                    else "pursue the most direct strategy")
+        else:
+            plan = (f"commit to candidate strategy #{index + 1}: a plan materially different from the most direct one "
+                    "(a different tool, algorithm or point of attack) and from the other branches")
+        return (
+            f"SYSTEM OVERRIDE: SPECULATIVE BRANCH {index + 1}/{count} ({trigger}). Other branches explore other "
+            f"strategies in parallel, each in its own scratch copy of the working directory. In this branch, {plan}. "
+            "Only TERMINATE with a PASS verdict once the result is empirically verified."
+        )
+
+    async def _speculate(self, session_id: str, user_goal: str, state_manager: StateManager, loop_detector: LoopDetector,
+                         trigger: str, pivot_logic: Optional[str], outcome: Dict[str, Any],
+                         cancel_token: CancellationToken) -> AsyncGenerator[str, None]:
+        """
+        Runs `speculative_branches` forks of the session concurrently, each in an isolated
+        scratch workspace. The first branch to TERMINATE with a PASS verdict wins: the others
+        are cancelled, its ledger is merged into state_manager and its file changes are synced
+        back to the working directory. outcome receives "winner" (None if every branch failed).
+        """
+        count = self.speculative_branches
+        started = time.perf_counter()
+        origin = tool_workdir.get() or os.getcwd()
+        workspaces = [ScratchWorkspace(origin, self.scratch_root, f"{session_id[:8]}-b{i}") for i in range(count)]
+        branches: Dict[int, tuple] = {}
+        # Child tokens: cancelling the session cancels every branch, and losers are cancelled alone
+        branch_tokens = [CancellationToken(parent=cancel_token) for _ in range(count)]
+        queue: asyncio.Queue = asyncio.Queue()
+        outcome["winner"] = None
+
+        yield json.dumps({"event": "SPECULATION_START", "trigger": trigger, "iteration": state_manager.iteration_count,
+                          "branches": count})
+
+        async def run_branch(i: int):
+            verdict = None
+            try:
+                workdir = await asyncio.to_thread(workspaces[i].create)
+                # Tools of this task (and its to_thread workers) run inside the scratch copy
+                tool_workdir.set(workdir)
+                branch_state = state_manager.fork()
+                branch_state.add_failure(self._branch_directive(i, count, trigger, pivot_logic))
+                branch_detector = LoopDetector(repeat_threshold=self.loop_threshold, halt_after=self.loop_halt_after)
+                branch_detector.restore(loop_detector.to_dict())
+                branches[i] = (branch_state, branch_detector)
+                await queue.put({"event": "BRANCH_START", "branch": i, "workdir": workdir})
+
+                async for telemetry_json in self._agent_loop(f"{session_id}.b{i}", user_goal, branch_state, branch_detector,
+                                                             branch=i, cancel_token=branch_tokens[i]):
+                    event = json.loads(telemetry_json)
+                    event["branch"] = i
+                    if event["event"] == "THOUGHT_PROCESS":
+                        verdict = event.get("verdict")
+                    if event["event"] == "ENGINE_HALT":
+                        event["event"] = "BRANCH_HALT"
+                        event["verified"] = event.get("reason") == "TERMINATE_ACHIEVED" and "PASS" in str(verdict or "").upper()
+                    await queue.put(event)
+            except Exception as e:
+                await queue.put({"event": "BRANCH_HALT", "branch": i, "reason": "BRANCH_ERROR", "message": str(e), "verified": False})
+
+        tasks = [asyncio.create_task(run_branch(i)) for i in range(count)]
+        halted = []
+        try:
+            while len(halted) < count:
+                event = await queue.get()
+                yield json.dumps(event)
+                if event["event"] != "BRANCH_HALT":
+                    continue
+                halted.append(event)
+                if event["verified"]:
+                    outcome["winner"] = event["branch"]
+                    outcome["final_logic"] = event.get("final_logic")
+                    break
+        finally:
+            # Losers' processes and LLM streams are killed; their scratch copies are discarded
+            for i, task in enumerate(tasks):
+                branch_tokens[i].cancel("SUPERSEDED")
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            winner = outcome["winner"]
+            synced = None
+            if winner is not None:
+                branch_state, branch_detector = branches[winner]
+                state_manager.adopt(branch_state)
+                loop_detector.restore(branch_detector.to_dict())
+                synced = await asyncio.to_thread(workspaces[winner].sync_back)
+            else:
+                state_manager.add_failure(
+                    f"Speculative fork: none of the {count} branches reached a verified PASS ("
+                    + "; ".join(f"branch {e['branch'] + 1}: {e['reason']}" for e in halted)
+                    + "). Continue on the main line with a different approach."
+                )
+            await asyncio.gather(*(asyncio.to_thread(ws.cleanup) for ws in workspaces))
+
+        yield json.dumps({
+            "event": "SPECULATION_RESOLVED",
+            "winner": winner,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+            "branch_halts": {e["branch"]: e["reason"] for e in halted},
+            "synced_files": synced
+        })
+
+    async def _run_tool(self, tool_name: str, tool_meta: Dict[str, Any], payload: str,
+                        tool_cache: ToolResultCache, cancel_token: Optional[CancellationToken] = None,
+                        arguments: Optional[Dict[str, Any]] = None) -> tuple:
+        """
+        Executes a registered tool, serving idempotent calls from the session cache.
+        With typed `arguments` (json protocol) the tool's structured entry point is called;
+        `payload` is then their canonical text form, which keys the cache.
+        Returns (output, served_from_cache).
+        """
+        cache_key = tool_cache.key_for(tool_name, tool_meta, payload or "")
+        if cache_key is not None:
+            cached_output = tool_cache.get(cache_key)
+            if cached_output is not None:
+                return cached_output, True
+
+        try:
+            if arguments is not None:
+                call = functools.partial(tool_meta["structured"], **_present(arguments))
+                tool_output = await run_cancellable(cancel_token, call)
+            else:
+                tool_output = await run_cancellable(cancel_token, tool_meta["func"], payload)
+        except SessionCancelled:
+            # A killed writer may have changed files before dying
+            for stale_tool in tool_meta["invalidates"]:
+                tool_cache.invalidate(stale_tool)
+            raise
+        except Exception as tool_e:
+            tool_output = f"[ERROR] Tool failed: {str(tool_e)}"
+
+        for stale_tool in tool_meta["invalidates"]:
+            tool_cache.invalidate(stale_tool)
+        if cache_key is not None:
+            tool_cache.put(cache_key, tool_output)
+        return tool_output, False
+
     def _register_default_tools(self):
         """Registers the standard OpenJudge suite of deterministic tools."""
         self.register_tool(
             "bash",
             "Payload: The raw shell command string.\n   - Use: System operations, git, file commands, installing packages.",
-            tools.execute_bash
+            tools.execute_bash,
+            parameters=tool_parameters({"command": {"type": "string"}}),
+            structured=lambda command: tools.execute_bash(command)
         )
         self.register_tool(
             "python",
             "Payload: The raw Python code string.\n   - Use: Executing logic, testing isolated scripts.",
-            tools.execute_python
+            tools.execute_python,
+            parameters=tool_parameters({"code": {"type": "string"}}),
+            structured=lambda code: tools.execute_python(code)
         )
         self.register_tool(
             "read_file",
             "Payload: Absolute or relative filepath.\n   - Use: Reading the contents of a file into your logical extern.",
-            tools.read_file
+            lambda payload: tools.read_file(payload.strip()),
+            idempotent=True,
+            cache_key=file_state_key,
+            parameters=tool_parameters({"filepath": {"type": "string"}}),
+            structured=lambda filepath: tools.read_file(filepath.strip())
         )
         def write_file_wrapper(payload: str):
             parts = payload.split("|", 1)
@@ -177,12 +667,19 @@ class OpenJudgeEngine:
         self.register_tool(
             "write_file",
             "Payload: filepath|content \n   - Use: Writing or overwriting a file with the provided content.",
-            write_file_wrapper
+            write_file_wrapper,
+            invalidates=["read_file"],
+            parameters=tool_parameters({"filepath": {"type": "string"}, "content": {"type": "string"}}),
+            structured=lambda filepath, content: tools.write_file(filepath.strip(), content)
         )
         self.register_tool(
             "web_search",
             "Payload: The search query string.\n   - Use: Fetching real-time facts, reference data, or documentation from the web.",
-            tools.web_search
+            lambda payload: tools.web_search(payload.strip()),
+            idempotent=True,
+            cache_key=normalized_text_key,
+            parameters=tool_parameters({"query": {"type": "string"}}),
+            structured=lambda query: tools.web_search(query.strip())
         )
         def analyze_image_wrapper(payload: str):
             parts = payload.split("|", 1)
@@ -193,7 +690,9 @@ class OpenJudgeEngine:
         self.register_tool(
             "analyze_image",
             "Payload: filepath|question\n   - Use: Utilizing the Vision API to inspect pixels, verify screenshots, or analyze image data.",
-            analyze_image_wrapper
+            analyze_image_wrapper,
+            parameters=tool_parameters({"filepath": {"type": "string"}, "question": {"type": "string"}}),
+            structured=lambda filepath, question: tools.analyze_image(filepath.strip(), question.strip())
         )
         def git_action_wrapper(payload: str):
             parts = payload.split("|")
@@ -203,19 +702,53 @@ class OpenJudgeEngine:
             
         self.register_tool(
             "git_action",
-            "Payload: repo_path|action|[branch]|[message]\n   - Actions: init, clone, commit, push, checkout, status\n   - Use: Safe repository orchestration without raw bash errors.",
-            git_action_wrapper
+            "Payload: repo_path|action|[branch_or_url_or_revision]|[message_or_branch]\n   - Actions: init, clone (url, optional branch), commit, push, checkout, status, diff, log (structured JSON)\n   - Use: Safe repository orchestration without raw bash errors.",
+            git_action_wrapper,
+            parameters=tool_parameters(
+                {"repo_path": {"type": "string"},
+                 "action": {"type": "string", "enum": ["init", "clone", "commit", "push", "checkout", "status", "diff", "log"]}},
+                {"branch": {"type": "string"}, "message": {"type": "string"}}
+            ),
+            structured=lambda repo_path, action, branch="", message="": tools.git_action(repo_path.strip(), action, branch, message)
         )
         def browser_action_wrapper(payload: str):
+            # JSON payloads are multi-step scripts run in a single page session
+            if payload.lstrip().startswith(("{", "[")):
+                try:
+                    return tools.browser_script(json.loads(payload))
+                except (ValueError, AttributeError) as e:
+                    return f"[ERROR] Invalid browser script JSON: {e}"
             parts = payload.split("|")
             if len(parts) >= 2:
                 return tools.browser_action(parts[0].strip(), parts[1].strip(), parts[2].strip() if len(parts) > 2 else "", parts[3].strip() if len(parts) > 3 else "")
             return "[ERROR] Invalid payload for browser_action. Expected: url|action|[selector]|[value]"
             
+        def browser_action_structured(action: str, url: str = "", selector: str = "", value: str = "", steps=None):
+            if action == "script":
+                script = {"url": url, "steps": [_present(step) for step in steps or []]}
+                return tools.browser_script(_present(script))
+            return tools.browser_action(url, action, selector, value)
+
+        browser_step = tool_parameters(
+            {"action": {"type": "string", "enum": list(tools.BROWSER_SCRIPT_ACTIONS)}},
+            {"url": {"type": "string"}, "selector": {"type": "string"}, "value": {"type": "string"}, "text": {"type": "string"}}
+        )
+
         self.register_tool(
             "browser_action",
-            "Payload: url|action|[selector]|[value]\n   - Actions: goto_and_screenshot, extract_html, click, type\n   - Use: Physically controlling a headless Chrome browser to test SPAs, log in, or scrape dynamic DOMs.",
-            browser_action_wrapper
+            "Payload: url|action|[selector]|[value]  OR  a JSON script {\"url\": ..., \"steps\": [...]}\n"
+            "   - Actions: goto_and_screenshot, extract_html, click, type\n"
+            "   - Script steps (one page session, one iteration): {\"action\": \"goto\", \"url\"}, {\"action\": \"fill\", \"selector\", \"value\"}, "
+            "{\"action\": \"click\", \"selector\"}, {\"action\": \"wait_for\", \"selector\"}, {\"action\": \"extract_text\", \"selector\"?}, "
+            "{\"action\": \"assert_text\", \"text\", \"selector\"?}, {\"action\": \"screenshot\"}\n"
+            "   - Use: Physically controlling a headless Chrome browser to test SPAs, log in, or scrape dynamic DOMs. Prefer scripts for multi-step flows.",
+            browser_action_wrapper,
+            parameters=tool_parameters(
+                {"action": {"type": "string", "enum": ["goto_and_screenshot", "extract_html", "click", "type", "script"]}},
+                {"url": {"type": "string"}, "selector": {"type": "string"}, "value": {"type": "string"},
+                 "steps": {"type": "array", "items": browser_step}}
+            ),
+            structured=browser_action_structured
         )
         def memory_store_wrapper(payload: str):
             parts = payload.split("|", 1)
@@ -226,7 +759,10 @@ class OpenJudgeEngine:
         self.register_tool(
             "memory_store",
             "Payload: document_text|[type_tag]\n   - Use: Pushing a factual event or code snippet into ChromaDB Long-Term Vector Memory.",
-            memory_store_wrapper
+            memory_store_wrapper,
+            invalidates=["memory_query"],
+            parameters=tool_parameters({"document": {"type": "string"}}, {"mem_type": {"type": "string"}}),
+            structured=lambda document, mem_type="general": tools.memory_store(document.strip(), mem_type.strip())
         )
         def memory_query_wrapper(payload: str):
             parts = payload.split("|", 1)
@@ -237,5 +773,33 @@ class OpenJudgeEngine:
         self.register_tool(
             "memory_query",
             "Payload: semantic_search_query|[count]\n   - Use: Retrieving historical actions or state using semantic RAG from Vector Memory to avoid context bloat.",
-            memory_query_wrapper
+            memory_query_wrapper,
+            idempotent=True,
+            cache_key=normalized_text_key,
+            parameters=tool_parameters({"query": {"type": "string"}}, {"count": {"type": "integer"}}),
+            structured=lambda query, count=3: tools.memory_query(query.strip(), str(count))
+        )
+        def blob_read_wrapper(payload: str):
+            parts = payload.split("|")
+            try:
+                start = int(parts[1]) if len(parts) > 1 and parts[1].strip() else 0
+                end = int(parts[2]) if len(parts) > 2 and parts[2].strip() else start + 2000
+                return self.blob_store.read(parts[0].strip(), start, end)
+            except (ValueError, OSError) as e:
+                return f"[ERROR] Invalid blob_read request: {str(e)}"
+
+        def blob_read_structured(blob_hash: str, start_byte: int = 0, end_byte: Optional[int] = None):
+            try:
+                return self.blob_store.read(blob_hash.strip(), start_byte, start_byte + 2000 if end_byte is None else end_byte)
+            except (ValueError, OSError) as e:
+                return f"[ERROR] Invalid blob_read request: {str(e)}"
+
+        self.register_tool(
+            "blob_read",
+            "Payload: blob_hash|[start_byte]|[end_byte]\n   - Use: Reading a byte range (default 2000 bytes) of a large tool output that the ledger only shows as a digest.",
+            blob_read_wrapper,
+            idempotent=True,
+            parameters=tool_parameters({"blob_hash": {"type": "string"}},
+                                       {"start_byte": {"type": "integer"}, "end_byte": {"type": "integer"}}),
+            structured=blob_read_structured
         )
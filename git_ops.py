@@ -0,0 +1,239 @@
+import os
+import time
+import hashlib
+import threading
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from tool_context import on_cancel, raise_if_cancelled
+
+
+class GitError(Exception):
+    """Raised when a git subprocess exits with a non-zero status."""
+    pass
+
+
+def run_git(args: List[str], cwd: Optional[str] = None, timeout: int = 300) -> str:
+    """
+    Executes git with an argument vector (never through a shell), so paths, branch
+    names and commit messages cannot be reinterpreted by shell quoting.
+    """
+    proc = subprocess.Popen(["git"] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # Cancelling the session kills a long clone/fetch/push instead of waiting for it
+    unregister = on_cancel(proc.kill)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise
+    finally:
+        unregister()
+    raise_if_cancelled()
+    if proc.returncode != 0:
+        raise GitError(stderr.strip() or stdout.strip() or "Unknown Git Error")
+    return stdout
+
+
+def reject_option(value: str, what: str) -> str:
+    """Refuses agent-supplied values that git would parse as options (e.g. `--output=...`, `-u <cmd>`)."""
+    if value.startswith("-"):
+        raise GitError(f"Refusing {what} {value!r}: values starting with '-' would be parsed as git options.")
+    return value
+
+
+class GitMirrorCache:
+    """
+    Local cache of bare mirrors, one per remote URL.
+    Repeat clones of the same repository are served from the mirror through
+    `--reference` (objects are borrowed, not copied), so they cost no network
+    transfer once the mirror is fresh.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_age_seconds: float = 300.0):
+        self.directory = directory or os.getenv(
+            "OPENJUDGE_GIT_MIRROR_DIR", os.path.join(os.path.expanduser("~"), ".cache", "openjudge", "git-mirrors")
+        )
+        # A mirror fetched within max_age_seconds is reused without contacting the remote
+        self.max_age_seconds = max_age_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, url: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def mirror_path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".git")
+
+    def ensure_mirror(self, url: str) -> str:
+        """Creates or refreshes the bare mirror of url and returns its path."""
+        reject_option(url, "repository URL")
+        path = self.mirror_path(url)
+        stamp = os.path.join(path, "openjudge_fetched_at")
+        with self._lock_for(url):
+            if not os.path.isdir(path):
+                os.makedirs(self.directory, exist_ok=True)
+                run_git(["clone", "--mirror", "--quiet", "--", url, path])
+                # Clones borrow objects from the mirror, so it must never garbage-collect them
+                run_git(["config", "gc.auto", "0"], cwd=path)
+            elif not os.path.exists(stamp) or time.time() - os.path.getmtime(stamp) > self.max_age_seconds:
+                run_git(["remote", "update", "--prune"], cwd=path)
+            with open(stamp, "w", encoding="utf-8") as f:
+                f.write(str(time.time()))
+        return path
+
+    def clone(self, url: str, dest: str, branch: Optional[str] = None) -> str:
+        """Clones url into dest using the local mirror; origin still points at url."""
+        mirror = self.ensure_mirror(url)
+        args = ["clone", "--quiet", "--reference", mirror]
+        if branch:
+            args += ["--branch", branch]
+        run_git(args + ["--", mirror, dest])
+        run_git(["remote", "set-url", "origin", url], cwd=dest)
+        # Remote-tracking refs of the mirror clone are rewritten to the real remote on next fetch
+        return f"[SUCCESS] Cloned {url} into {dest} (via mirror cache {mirror})."
+
+
+def worktree_fingerprint(repo_path: str) -> str:
+    """
+    Fingerprint of a repository's state: HEAD, the index, every ref (local, remote-tracking
+    and tags, loose or packed) and the working tree as git status sees it, plus the
+    (mtime, size) of each dirty path so re-editing a modified file changes it too.
+    Ignored and untouched files are never walked: git's index stat cache does that work.
+    """
+    digest = hashlib.sha1()
+    status = run_git(["status", "--porcelain=v2", "--branch", "-z", "--untracked-files=all"], cwd=repo_path)
+    digest.update(status.encode("utf-8", "surrogateescape"))
+    digest.update(run_git(["for-each-ref", "--format=%(refname) %(objectname)"], cwd=repo_path).encode())
+    dirty = parse_status_porcelain(status)
+    paths = [entry["path"] for entry in dirty["changed"]] + dirty["untracked"] + dirty["conflicted"]
+    for rel in [".git/index"] + paths:
+        try:
+            st = os.lstat(os.path.join(repo_path, rel))
+            digest.update(f"{rel}:{st.st_mtime_ns}:{st.st_size};".encode("utf-8", "surrogateescape"))
+        except OSError:
+            digest.update(f"{rel}:missing;".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def parse_status_porcelain(output: str) -> dict:
+    """Parses `git status --porcelain=v2 --branch -z` into a structured dict."""
+    status = {"branch": None, "commit": None, "upstream": None, "ahead": 0, "behind": 0,
+              "changed": [], "untracked": [], "conflicted": []}
+    entries = output.split("\0")
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if not entry:
+            continue
+        if entry.startswith("# branch.oid "):
+            status["commit"] = entry.split(" ", 2)[2]
+        elif entry.startswith("# branch.head "):
+            status["branch"] = entry.split(" ", 2)[2]
+        elif entry.startswith("# branch.upstream "):
+            status["upstream"] = entry.split(" ", 2)[2]
+        elif entry.startswith("# branch.ab "):
+            ahead, behind = entry.split(" ")[2:4]
+            status["ahead"], status["behind"] = int(ahead), -int(behind)
+        elif entry.startswith("1 "):
+            fields = entry.split(" ", 8)
+            status["changed"].append({"xy": fields[1], "path": fields[8]})
+        elif entry.startswith("2 "):
+            fields = entry.split(" ", 9)
+            # Renames carry the original path as the next NUL-separated field
+            original = entries[i] if i < len(entries) else ""
+            i += 1
+            status["changed"].append({"xy": fields[1], "path": fields[9], "from": original})
+        elif entry.startswith("u "):
+            status["conflicted"].append(entry.split(" ", 10)[10])
+        elif entry.startswith("? "):
+            status["untracked"].append(entry[2:])
+    status["clean"] = not (status["changed"] or status["untracked"] or status["conflicted"])
+    return status
+
+
+def parse_numstat(output: str) -> List[dict]:
+    """Parses `git diff --numstat` output into per-file line counts (None for binary files)."""
+    files = []
+    for line in output.splitlines():
+        parts = line.split("\t", 2)
+        if len(parts) != 3:
+            continue
+        added, deleted, path = parts
+        files.append({
+            "path": path,
+            "added": None if added == "-" else int(added),
+            "deleted": None if deleted == "-" else int(deleted),
+        })
+    return files
+
+
+LOG_FORMAT = "%H%x1f%an%x1f%ae%x1f%at%x1f%s%x1e"
+
+
+def parse_log(output: str) -> List[dict]:
+    """Parses `git log --format=LOG_FORMAT` output."""
+    commits = []
+    for record in output.split("\x1e"):
+        record = record.strip("\n")
+        if not record:
+            continue
+        sha, author, email, timestamp, subject = record.split("\x1f", 4)
+        commits.append({"commit": sha, "author": author, "email": email,
+                        "timestamp": int(timestamp), "subject": subject})
+    return commits
+
+
+class StructuredGitQueries:
+    """
+    Structured status/diff/log results, memoized per repository until its
+    worktree fingerprint changes.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._cache: Dict[Tuple[str, str, str, str], dict] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, repo_path: str, query: str, arg: str, compute) -> dict:
+        repo_path = os.path.abspath(repo_path)
+        key = (repo_path, query, arg, worktree_fingerprint(repo_path))
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        result = compute()
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = result
+        return result
+
+    def status(self, repo_path: str) -> dict:
+        return self._cached(repo_path, "status", "", lambda: parse_status_porcelain(
+            run_git(["status", "--porcelain=v2", "--branch", "-z", "--untracked-files=all"], cwd=repo_path)
+        ))
+
+    def diff(self, repo_path: str, revision: str = "") -> dict:
+        # --end-of-options: a revision such as `--output=/path` is never taken for an option
+        rev_args = ["--end-of-options", reject_option(revision, "revision")] if revision else []
+
+        def compute():
+            return {
+                "files": parse_numstat(run_git(["diff", "--numstat"] + rev_args + ["--"], cwd=repo_path)),
+                "patch": run_git(["diff", "--no-color"] + rev_args + ["--"], cwd=repo_path),
+            }
+        return self._cached(repo_path, "diff", revision, compute)
+
+    def log(self, repo_path: str, revision: str = "", count: int = 20) -> dict:
+        rev_args = ["--end-of-options", reject_option(revision, "revision")] if revision else []
+        args = ["log", f"-n{count}", f"--format={LOG_FORMAT}"] + rev_args + ["--"]
+        return self._cached(repo_path, "log", f"{revision}:{count}", lambda: {
+            "commits": parse_log(run_git(args, cwd=repo_path))
+        })
+
+
+# Shared instances used by tools.git_action
+git_mirror_cache = GitMirrorCache()
+git_queries = StructuredGitQueries()
@@ -0,0 +1,340 @@
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from git_ops import run_git, GitError
+
+INDEXED_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".go", ".rs", ".java", ".kt", ".c", ".h", ".cc", ".cpp",
+    ".hpp", ".cs", ".rb", ".php", ".swift", ".scala", ".sh", ".sql", ".md", ".rst", ".txt", ".toml",
+    ".yaml", ".yml", ".json", ".ini", ".cfg", ".html", ".css",
+}
+INDEXED_FILENAMES = {"Dockerfile", "Makefile", "README"}
+SKIPPED_DIRS = {"node_modules", "__pycache__", "venv", ".venv", "dist", "build", "site-packages"}
+
+
+# --- Syntax-aware chunking ---
+
+def _chunk(lines: List[str], start: int, end: int, symbol: Optional[str]) -> dict:
+    """start/end are 1-based inclusive line numbers."""
+    return {"start_line": start, "end_line": end, "symbol": symbol, "text": "\n".join(lines[start - 1:end])}
+
+
+def chunk_text(text: str, max_chars: int = 1500, first_line: int = 1) -> List[dict]:
+    """
+    Splits plain text along blank-line paragraph boundaries, packing paragraphs up to
+    max_chars per chunk (an oversized paragraph is split between lines).
+    """
+    lines = text.split("\n")
+    chunks: List[dict] = []
+    start, size = None, 0
+    for offset, line in enumerate(lines):
+        number = first_line + offset
+        paragraph_break = not line.strip()
+        if start is not None and (size + len(line) > max_chars or (paragraph_break and size > max_chars // 2)):
+            chunks.append({"start_line": start, "end_line": number - 1, "symbol": None,
+                           "text": "\n".join(lines[start - first_line:offset])})
+            start, size = None, 0
+        if start is None:
+            if paragraph_break:
+                continue
+            start = number
+        size += len(line) + 1
+    if start is not None:
+        chunks.append({"start_line": start, "end_line": first_line + len(lines) - 1, "symbol": None,
+                       "text": "\n".join(lines[start - first_line:])})
+    return [c for c in chunks if c["text"].strip()]
+
+
+def _node_start(node: ast.AST) -> int:
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def _definitions(body: List[ast.stmt]) -> List[ast.stmt]:
+    return [n for n in body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+
+
+def chunk_python(source: str, max_lines: int = 120, max_chars: int = 1500) -> List[dict]:
+    """
+    Chunks Python source along top-level definitions: each function or class (with its
+    decorators and leading comments) is one chunk, module-level code between them is
+    grouped, and classes too large for one chunk are split at their methods.
+    Falls back to paragraph chunking if the file does not parse.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return chunk_text(source, max_chars)
+
+    lines = source.split("\n")
+    total = len(lines)
+    chunks: List[dict] = []
+
+    def emit(start: int, end: int, symbol: Optional[str], node: Optional[ast.AST] = None):
+        if start > end or not "\n".join(lines[start - 1:end]).strip():
+            return
+        if end - start + 1 <= max_lines:
+            chunks.append(_chunk(lines, start, end, symbol))
+        elif isinstance(node, ast.ClassDef) and _definitions(node.body):
+            methods = _definitions(node.body)
+            emit(start, _node_start(methods[0]) - 1, symbol)
+            for i, method in enumerate(methods):
+                method_end = _node_start(methods[i + 1]) - 1 if i + 1 < len(methods) else end
+                emit(_node_start(method), method_end, f"{symbol}.{method.name}", method)
+        else:
+            for piece in chunk_text("\n".join(lines[start - 1:end]), max_chars, first_line=start):
+                piece["symbol"] = symbol
+                chunks.append(piece)
+
+    definitions = _definitions(tree.body)
+    cursor = 1
+    for i, node in enumerate(definitions):
+        start = _node_start(node)
+        # Module-level code before this definition (imports, constants) is its own chunk;
+        # comments directly above a definition stay attached to it
+        attach_from = start
+        while attach_from - 1 >= cursor and lines[attach_from - 2].lstrip().startswith("#"):
+            attach_from -= 1
+        emit(cursor, attach_from - 1, None)
+        end = node.end_lineno
+        emit(attach_from, end, node.name, node)
+        cursor = end + 1
+    emit(cursor, total, None)
+    return chunks
+
+
+def chunk_file(path: str, source: str) -> List[dict]:
+    if path.endswith(".py"):
+        return chunk_python(source)
+    return chunk_text(source)
+
+
+# --- Embedding ---
+
+def sentence_transformer_embedder(model_name: str = "all-MiniLM-L6-v2") -> Callable[[List[str]], List[List[float]]]:
+    """
+    Batch embedder with the same model (and L2 normalization) that Chroma's default
+    embedding function uses for memory_query, so indexed vectors and queries agree.
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        return model.encode(texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False).tolist()
+    return embed
+
+
+# --- Incremental indexer ---
+
+class CodebaseIndexer:
+    """
+    Incremental, parallel indexing of a repository into long-term memory (VectorMemory).
+    A manifest records each file's (mtime, size, sha256) and chunk count: unchanged files
+    are skipped on a stat check alone, edited files are re-chunked and re-embedded, and
+    vectors of deleted files are removed. File reading/chunking and embedding batches
+    run in parallel worker threads (the embedding model releases the GIL).
+    """
+
+    def __init__(self, manifest_path: Optional[str] = None, memory=None,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 workers: Optional[int] = None, batch_size: int = 64, max_file_bytes: int = 1_000_000):
+        self.manifest_path = manifest_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "openjudge_index_manifest.json")
+        self._memory = memory
+        self._embed = embed
+        self.workers = workers or min(8, os.cpu_count() or 4)
+        self.batch_size = batch_size
+        self.max_file_bytes = max_file_bytes
+
+    @property
+    def memory(self):
+        if self._memory is None:
+            from memory_db import memory_db
+            self._memory = memory_db
+        return self._memory
+
+    @property
+    def embed(self):
+        if self._embed is None:
+            self._embed = sentence_transformer_embedder()
+        return self._embed
+
+    # --- Manifest ---
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest: dict) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # --- Discovery ---
+
+    def discover(self, root: str) -> List[str]:
+        """Relative paths of indexable files; honours .gitignore when root is a git work tree."""
+        try:
+            listed = run_git(["ls-files", "-z", "--cached", "--others", "--exclude-standard"], cwd=root).split("\0")
+            candidates = [p for p in listed if p]
+        except (GitError, OSError):
+            candidates = []
+            for directory, dirs, files in os.walk(root):
+                dirs[:] = [d for d in dirs if not d.startswith(".") and d not in SKIPPED_DIRS]
+                candidates += [os.path.relpath(os.path.join(directory, name), root) for name in files]
+
+        selected = []
+        for rel in candidates:
+            name = os.path.basename(rel)
+            if os.path.splitext(name)[1].lower() in INDEXED_EXTENSIONS or name in INDEXED_FILENAMES:
+                selected.append(rel.replace(os.sep, "/"))
+        return sorted(selected)
+
+    @staticmethod
+    def vector_id(repo_key: str, rel: str, i: int) -> str:
+        return f"code:{repo_key}:{rel}#{i}"
+
+    def _inspect(self, root: str, rel: str, previous: Optional[dict], full: bool) -> Tuple[str, Optional[dict], Optional[List[dict]], Optional[str]]:
+        """
+        Returns (rel, manifest entry, chunks, read error). chunks is None when the file is unchanged;
+        the entry is None when the file vanished or is not indexable (binary/too large).
+        An unreadable file (permissions, I/O error) keeps its previous entry and vectors.
+        """
+        path = os.path.join(root, rel)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return rel, None, None, None
+        except OSError as e:
+            return rel, previous, None, f"{type(e).__name__}: {e.strerror or e}"
+        if st.st_size > self.max_file_bytes:
+            return rel, None, None, None
+        if not full and previous and previous["mtime_ns"] == st.st_mtime_ns and previous["size"] == st.st_size:
+            return rel, previous, None, None
+
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return rel, None, None, None
+        except OSError as e:
+            return rel, previous, None, f"{type(e).__name__}: {e.strerror or e}"
+        digest = hashlib.sha256(raw).hexdigest()
+        entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest, "chunks": 0}
+        if not full and previous and previous["sha256"] == digest:
+            # Touched but identical (checkout, formatter no-op): keep the vectors
+            entry["chunks"] = previous["chunks"]
+            return rel, entry, None, None
+        if b"\0" in raw[:8192]:
+            return rel, None, None, None
+
+        chunks = chunk_file(rel, raw.decode("utf-8", "replace"))
+        entry["chunks"] = len(chunks)
+        return rel, entry, chunks, None
+
+    def index(self, root: str, full: bool = False) -> dict:
+        started = time.perf_counter()
+        root = os.path.abspath(root)
+        repo_key = hashlib.sha1(root.encode("utf-8")).hexdigest()[:12]
+        manifest = self._load_manifest()
+        previous_files: Dict[str, dict] = manifest.get(root, {})
+
+        files = self.discover(root)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            inspected = list(pool.map(lambda rel: self._inspect(root, rel, previous_files.get(rel), full), files))
+
+        current_files: Dict[str, dict] = {}
+        stale_ids: List[str] = []
+        pending: List[Tuple[str, dict, dict]] = []  # (vector id, chunk, metadata)
+        changed = 0
+        unreadable: Dict[str, str] = {}
+        for rel, entry, chunks, error in inspected:
+            if error:
+                unreadable[rel] = error
+                if entry is not None:
+                    current_files[rel] = entry
+                continue
+            old = previous_files.get(rel)
+            if chunks is None and entry is not None:
+                current_files[rel] = entry
+                continue
+            if old:
+                stale_ids += [self.vector_id(repo_key, rel, i) for i in range(old["chunks"])]
+            if entry is None:
+                continue
+            changed += 1
+            current_files[rel] = entry
+            for i, chunk in enumerate(chunks):
+                pending.append((self.vector_id(repo_key, rel, i), chunk, {
+                    "type": "code", "repo": root, "path": rel, "symbol": chunk["symbol"] or "",
+                    "start_line": chunk["start_line"], "end_line": chunk["end_line"],
+                }))
+
+        # Files deleted from the tree (inspected ones that vanished were handled above)
+        listed = set(files)
+        removed = [rel for rel in previous_files if rel not in current_files]
+        for rel in removed:
+            if rel not in listed:
+                stale_ids += [self.vector_id(repo_key, rel, i) for i in range(previous_files[rel]["chunks"])]
+
+        for i in range(0, len(stale_ids), 5000):
+            # The manifest is only saved after a clean run, so a failed delete is retried next time
+            result = self.memory.delete(ids=stale_ids[i:i + 5000])
+            if result is not True:
+                raise RuntimeError(f"Vector store delete failed: {result}")
+
+        # Embedding batches run concurrently; results are written as they complete, in order
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+
+        def embed_batch(batch):
+            documents = [f"{meta['path']}:{meta['start_line']}-{meta['end_line']}\n{chunk['text']}" for _, chunk, meta in batch]
+            return documents, self.embed(documents)
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for batch, (documents, vectors) in zip(batches, pool.map(embed_batch, batches)):
+                    result = self.memory.store_many([vid for vid, _, _ in batch], documents,
+                                                    [meta for _, _, meta in batch], vectors)
+                    if result is not True:
+                        raise RuntimeError(f"Vector store write failed: {result}")
+
+        manifest[root] = current_files
+        self._save_manifest(manifest)
+        return {
+            "repo": root,
+            "files_scanned": len(files),
+            "files_reindexed": changed,
+            "files_removed": len(removed),
+            "chunks_embedded": len(pending),
+            "vectors_deleted": len(stale_ids),
+            "files_unreadable": unreadable,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+def cli(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(
+        prog="openjudge index",
+        description="Incrementally index a codebase into OpenJudge's long-term memory."
+    )
+    arg_parser.add_argument("repo", nargs="?", default=".", help="Repository root to index.")
+    arg_parser.add_argument("-w", "--workers", type=int, default=None, help="Parallel read/chunk/embedding workers.")
+    arg_parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding batch.")
+    arg_parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-embed every file.")
+    args = arg_parser.parse_args(argv)
+
+    report = CodebaseIndexer(workers=args.workers, batch_size=args.batch_size).index(args.repo, full=args.full)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    cli(sys.argv[1:])
@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import argparse
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from engine import OpenJudgeEngine
+from batch import new_summary, fold_event, succeeded
+from tool_context import CancellationToken
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+
+class LeaseLost(Exception):
+    """Raised to a worker whose job was reclaimed by another worker (or finished) behind its back."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    objective TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class JobQueue:
+    """
+    Durable queue of agent runs backed by SQLite (WAL mode), shared by every
+    process on the node that opens the same database file.
+    Workers claim jobs under a lease; a job whose worker died (lease expired) is
+    claimed again and resumed from its engine checkpoint. Every telemetry event
+    is persisted, so status, results and live events are readable from any process.
+    Cancelling a running job flags it 'cancelling'; its worker notices within a second,
+    kills the run's tools and LLM calls and records it as 'cancelled'.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._db() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        # One short-lived connection per operation: safe across threads and processes
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers can never claim the same row
+        with self._db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def enqueue(self, objective: str, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self._db() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, objective, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, objective, time.time())
+            )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically takes the oldest queued job (or one whose lease expired) for this worker."""
+        now = time.time()
+        with self._transaction() as conn:
+            # Jobs abandoned too often are failed instead of being retried forever
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Worker lease expired too many times.' "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            # A job cancelled while its worker was dying is not worth resuming
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, lease_until = NULL "
+                "WHERE status = 'cancelling' AND lease_until < ?",
+                (now, now)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"])
+            )
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def _renew_lease(self, conn: sqlite3.Connection, job_id: str, worker: str) -> None:
+        renewed = conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status IN ('running', 'cancelling')",
+            (time.time() + self.lease_seconds, job_id, worker)
+        )
+        if renewed.rowcount == 0:
+            raise LeaseLost(f"Worker {worker} no longer owns job {job_id}.")
+
+    def append_event(self, job_id: str, worker: str, data: str) -> int:
+        """
+        Persists one telemetry event and renews the worker's lease. Returns the event sequence number.
+        Raises LeaseLost (and persists nothing) if the job is no longer this worker's.
+        """
+        with self._transaction() as conn:
+            self._renew_lease(conn, job_id, worker)
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.execute("INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)", (job_id, seq, data))
+        return seq
+
+    def heartbeat(self, job_id: str, worker: str) -> None:
+        """Renews the worker's lease. Raises LeaseLost if the job is no longer this worker's."""
+        with self._transaction() as conn:
+            self._renew_lease(conn, job_id, worker)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancels a queued job at once, or flags a running one for its worker. Returns the new status."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "queued":
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id))
+                return "cancelled"
+            if row["status"] == "running":
+                conn.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ?", (job_id,))
+                return "cancelling"
+            return row["status"]
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._db() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def finish(self, job_id: str, worker: str, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL, result = ?, error = ? "
+                "WHERE id = ? AND worker = ?",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id, worker)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._db() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["events"] = conn.execute("SELECT COUNT(*) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job.pop("lease_until")
+        return job
+
+    def events_after(self, job_id: str, seq: int = 0, limit: int = 500) -> List[tuple]:
+        with self._db() as conn:
+            return [tuple(r) for r in conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, seq, limit)
+            )]
+
+    def counts(self) -> Dict[str, int]:
+        with self._db() as conn:
+            return {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+
+class JobWorkerPool:
+    """
+    Async workers draining a JobQueue through one shared OpenJudgeEngine.
+    Run several processes (`python job_queue.py --workers N`) against the same
+    database to spread long agent runs across the node's cores.
+    """
+
+    def __init__(self, queue: JobQueue, engine: OpenJudgeEngine, workers: int = 2, poll_interval: float = 1.0):
+        self.queue = queue
+        self.engine = engine
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Starts the worker tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker(f"{self.worker_prefix}:{i}")) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_forever(self) -> None:
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    async def _worker(self, worker: str) -> None:
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, worker)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.run_job(job, worker)
+
+    async def run_job(self, job: Dict[str, Any], worker: str) -> None:
+        start = time.perf_counter()
+        result = new_summary({"id": job["id"], "objective": job["objective"]})
+
+        cancel_token = CancellationToken()
+
+        # A re-claimed job picks up from its last checkpoint instead of starting over
+        if job["attempts"] > 1 and self.engine.checkpoints and job["id"] in self.engine.checkpoints.list_sessions():
+            events = self.engine.resume(job["id"], cancel_token=cancel_token)
+        else:
+            events = self.engine.stream_execute(job["objective"], session_id=job["id"], cancel_token=cancel_token)
+
+        # Keeps the lease alive while a long LLM call or tool run produces no events,
+        # and watches for a cancellation requested from any process
+        async def keep_alive():
+            last_beat = time.monotonic()
+            while True:
+                await asyncio.sleep(min(1.0, self.queue.lease_seconds / 3))
+                if await asyncio.to_thread(self.queue.status, job["id"]) == "cancelling":
+                    cancel_token.cancel("CANCELLED")
+                if time.monotonic() - last_beat >= self.queue.lease_seconds / 3:
+                    try:
+                        await asyncio.to_thread(self.queue.heartbeat, job["id"], worker)
+                    except LeaseLost:
+                        # Another worker owns the job now: stop this run's tools and LLM calls
+                        cancel_token.cancel("LEASE_LOST")
+                        return
+                    last_beat = time.monotonic()
+        heartbeat = asyncio.create_task(keep_alive())
+
+        try:
+            async for telemetry_json in events:
+                await asyncio.to_thread(self.queue.append_event, job["id"], worker, telemetry_json)
+                fold_event(result, json.loads(telemetry_json), time.perf_counter() - start)
+        except asyncio.CancelledError:
+            # Worker shutdown: leave the job 'running' so its lease expires and another worker resumes it
+            raise
+        except LeaseLost:
+            # The job was reclaimed while this worker stalled: abandon the run, the new owner finishes it
+            cancel_token.cancel("LEASE_LOST")
+            await events.aclose()
+            return
+        except Exception as e:
+            result["duration_s"] = round(time.perf_counter() - start, 3)
+            await asyncio.to_thread(self.queue.finish, job["id"], worker, "failed", result, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        result["duration_s"] = round(time.perf_counter() - start, 3)
+        if result["halt_reason"] == "CANCELLED":
+            status = "cancelled"
+        elif succeeded(result):
+            status = "succeeded"
+        else:
+            # MAX_ITERATIONS, LOOP_DETECTED, API_DISRUPTION, or a TERMINATE without a PASS verdict
+            status = "failed"
+            result["error"] = result.get("error") or f"Halted with {result['halt_reason']} (verdict: {result.get('verdict')})."
+        await asyncio.to_thread(self.queue.finish, job["id"], worker, status, result, result.get("error"))
+
+
+def default_db_path() -> str:
+    return os.getenv("OPENJUDGE_JOB_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "openjudge_jobs.db"))
+
+
+def cli(argv: List[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(
+        prog="openjudge-worker",
+        description="Drain the OpenJudge job queue (start several processes to use more cores)."
+    )
+    arg_parser.add_argument("--db", default=default_db_path(), help="SQLite job database shared with the API.")
+    arg_parser.add_argument("-w", "--workers", type=int, default=2, help="Concurrent jobs in this process.")
+    arg_parser.add_argument("--max-iterations", type=int, default=25, help="Iteration cap per job.")
+    arg_parser.add_argument("--checkpoint-dir", default=os.getenv("OPENJUDGE_CHECKPOINT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")),
+                            help="Engine checkpoints, used to resume jobs of crashed workers.")
+    args = arg_parser.parse_args(argv)
+
+    engine = OpenJudgeEngine(max_iterations=args.max_iterations, checkpoint_dir=args.checkpoint_dir)
+    pool = JobWorkerPool(JobQueue(args.db), engine, workers=args.workers)
+    print(f"[worker] {pool.worker_prefix} draining {args.db} with {args.workers} workers")
+    try:
+        asyncio.run(pool.run_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
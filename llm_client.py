@@ -1,24 +1,325 @@
 import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+
+import openai
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from tool_context import CancellationToken, SessionCancelled, active_token
+
 # Load environment variables from .env file
 load_dotenv()
 
-def call_llm(system_prompt: str, user_prompt: str, model: str = "gpt-4o", image_base64: str = None, mime_type: str = "image/jpeg") -> str:
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, connection drops, rate limits and 5xx responses are worth retrying."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+
+class LLMEndpoint:
+    """One OpenAI-compatible endpoint with a reusable client and a rolling latency window per model."""
+
+    def __init__(self, name: str, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 model_map: Optional[Dict[str, str]] = None, timeout: float = 120.0):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        # Optional per-endpoint model aliases (e.g. Azure deployment names)
+        self.model_map = model_map or {}
+        self.timeout = timeout
+        # Latency differs by an order of magnitude between models (and so call classes): one window each
+        self.latencies: Dict[str, deque] = {}
+        self.calls = 0
+        self.errors = 0
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> OpenAI:
+        # Keep-alive connections are reused across calls; retries are owned by the gateway
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, timeout=self.timeout)
+        return self._client
+
+    def complete(self, messages: List[dict], model: str, cancel_token: Optional[CancellationToken] = None,
+                 options: Optional[dict] = None) -> str:
+        """options: extra request fields passed to the API verbatim (e.g. response_format)."""
+        start = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+        try:
+            if cancel_token is None:
+                response = self.client.chat.completions.create(
+                    model=self.model_map.get(model, model),
+                    messages=messages,
+                    temperature=0.0,  # OpenJudge must remain deterministic
+                    **(options or {})
+                )
+                content = response.choices[0].message.content
+            else:
+                content = self._complete_streamed(messages, model, cancel_token, options)
+        except SessionCancelled:
+            raise
+        except Exception:
+            if cancel_token is not None and cancel_token.cancelled:
+                # The connection was dropped on purpose: not an endpoint failure
+                raise SessionCancelled(cancel_token.reason)
+            with self._lock:
+                self.errors += 1
+            raise
+        with self._lock:
+            self.latencies.setdefault(model, deque(maxlen=200)).append(time.perf_counter() - start)
+        return content
+
+    def _complete_streamed(self, messages: List[dict], model: str, cancel_token: CancellationToken,
+                           options: Optional[dict] = None) -> str:
+        """Streams the completion so that cancelling closes the connection mid-generation."""
+        cancel_token.raise_if_cancelled()
+        stream = self.client.chat.completions.create(
+            model=self.model_map.get(model, model),
+            messages=messages,
+            temperature=0.0,
+            stream=True,
+            **(options or {})
+        )
+        unregister = cancel_token.on_cancel(stream.close)
+        parts = []
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            unregister()
+        cancel_token.raise_if_cancelled()
+        return "".join(parts)
+
+    def samples(self, model: Optional[str] = None) -> List[float]:
+        """Recorded latencies of one model, or of every model when None."""
+        with self._lock:
+            if model is not None:
+                return list(self.latencies.get(model, ()))
+            return [latency for window in self.latencies.values() for latency in window]
+
+    def failure_rate(self) -> float:
+        with self._lock:
+            return self.errors / self.calls if self.calls >= 5 else 0.0
+
+    def percentiles_by_model(self, q: float) -> Dict[str, Optional[float]]:
+        with self._lock:
+            models = list(self.latencies)
+        return {model: self.percentile(q, model) for model in models}
+
+    def percentile(self, q: float, model: Optional[str] = None) -> Optional[float]:
+        ordered = sorted(self.samples(model))
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMGateway:
+    """
+    Multi-endpoint LLM gateway.
+    - Retries transient errors with jittered exponential backoff, failing over to the next endpoint.
+    - Hedges slow requests: once the primary exceeds its p95 latency for the requested
+      model (or `hedge_after` seconds before enough samples exist), a duplicate is fired
+      at a second endpoint; whichever answers first wins and the other is cancelled.
+    - Honours the calling session's cancellation token: waits and backoffs end at once,
+      and in-flight requests are streamed so their connections can be dropped.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], max_attempts: int = 4, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, hedge_after: float = 15.0, min_hedge_samples: int = 20):
+        self.endpoints = endpoints
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.min_hedge_samples = min_hedge_samples
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self._rr = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-gateway")
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        """
+        OPENJUDGE_LLM_ENDPOINTS is either a JSON list of endpoint objects
+        ({"name", "base_url", "api_key", "model_map"}) or a comma-separated list of base URLs.
+        Without it, the single default OpenAI endpoint is used.
+        """
+        raw = os.getenv("OPENJUDGE_LLM_ENDPOINTS", "").strip()
+        endpoints: List[LLMEndpoint] = []
+        if raw.startswith("["):
+            for i, spec in enumerate(json.loads(raw)):
+                endpoints.append(LLMEndpoint(
+                    name=spec.get("name", f"endpoint-{i}"),
+                    base_url=spec.get("base_url"),
+                    api_key=spec.get("api_key"),
+                    model_map=spec.get("model_map")
+                ))
+        elif raw:
+            for i, base_url in enumerate(u.strip() for u in raw.split(",") if u.strip()):
+                endpoints.append(LLMEndpoint(name=f"endpoint-{i}", base_url=base_url))
+        else:
+            endpoints.append(LLMEndpoint(name="openai", base_url=os.getenv("OPENAI_BASE_URL")))
+
+        return cls(
+            endpoints,
+            max_attempts=int(os.getenv("OPENJUDGE_LLM_MAX_ATTEMPTS", 4)),
+            hedge_after=float(os.getenv("OPENJUDGE_LLM_HEDGE_AFTER", 15.0))
+        )
+
+    def _ordered_endpoints(self) -> List[LLMEndpoint]:
+        """Round-robin order, with endpoints that have been failing pushed to the back."""
+        with self._lock:
+            self._rr = (self._rr + 1) % len(self.endpoints)
+            start = self._rr
+        rotated = self.endpoints[start:] + self.endpoints[:start]
+        return sorted(rotated, key=lambda ep: ep.failure_rate())
+
+    def _hedge_delay(self, endpoint: LLMEndpoint, model: str) -> float:
+        samples = endpoint.samples(model)
+        if len(samples) >= self.min_hedge_samples:
+            return endpoint.percentile(0.95, model)
+        return self.hedge_after
+
+    def _hedged_call(self, messages: List[dict], model: str, primary: LLMEndpoint, backup: Optional[LLMEndpoint],
+                     cancel_token: Optional[CancellationToken] = None, options: Optional[dict] = None) -> str:
+        # Each request streams under its own child token, so the losing one can be dropped alone
+        request_tokens: Dict[Future, CancellationToken] = {}
+
+        def submit(endpoint: LLMEndpoint) -> Future:
+            token = CancellationToken(parent=cancel_token)
+            future = self._pool.submit(endpoint.complete, messages, model, token, options)
+            request_tokens[future] = token
+            futures[future] = endpoint
+            return future
+
+        futures: Dict[Future, LLMEndpoint] = {}
+        pending = {submit(primary)}
+        hedge_deadline = time.monotonic() + self._hedge_delay(primary, model)
+        backup_fired = backup is None
+        errors: List[Exception] = []
+
+        # Completed by the token's callback, so that cancellation wakes the wait below
+        cancelled: Future = Future()
+        unregister = lambda: None
+        if cancel_token is not None:
+            unregister = cancel_token.on_cancel(lambda: cancelled.done() or cancelled.set_result(None))
+            pending.add(cancelled)
+
+        try:
+            while pending - {cancelled}:
+                timeout = None if backup_fired else max(0.0, hedge_deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if cancelled in done:
+                    raise SessionCancelled(cancel_token.reason)
+                for future in done:
+                    if future.exception() is None:
+                        if futures[future] is backup and len(futures) > 1:
+                            with self._lock:
+                                self.hedges_won += 1
+                        return future.result()
+                    errors.append(future.exception())
+
+                # Fire the backup when the primary is slower than its p95 (hedge) or already failed (failover)
+                if not backup_fired and (not pending - {cancelled} or time.monotonic() >= hedge_deadline):
+                    if pending - {cancelled}:
+                        with self._lock:
+                            self.hedges_fired += 1
+                    backup_fired = True
+                    pending.add(submit(backup))
+        finally:
+            unregister()
+            # The losing request is not left running (and billed) in the background
+            for future, token in request_tokens.items():
+                if not future.done():
+                    token.cancel("HEDGE_LOST")
+
+        raise errors[-1]
+
+    def complete(self, messages: List[dict], model: str, options: Optional[dict] = None) -> str:
+        # Gateway worker threads do not inherit context variables: pass the token along
+        cancel_token = active_token.get()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_attempts):
+            ordered = self._ordered_endpoints()
+            primary = ordered[0]
+            backup = ordered[1] if len(ordered) > 1 else None
+            try:
+                return self._hedged_call(messages, model, primary, backup, cancel_token, options)
+            except SessionCancelled:
+                raise
+            except Exception as e:
+                last_error = e
+                # Non-transient errors (bad request, auth) get one failover attempt at most
+                if not is_transient(e) and (len(self.endpoints) == 1 or attempt > 0):
+                    break
+                if attempt < self.max_attempts - 1:
+                    # Full jitter exponential backoff
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                    if cancel_token is None:
+                        time.sleep(delay)
+                    elif cancel_token.wait(delay):
+                        raise SessionCancelled(cancel_token.reason)
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "endpoints": {
+                ep.name: {
+                    "calls": ep.calls,
+                    "errors": ep.errors,
+                    "p50_latency_s": ep.percentile(0.5),
+                    "p95_latency_s": ep.percentile(0.95),
+                    "p95_latency_s_by_model": ep.percentiles_by_model(0.95),
+                } for ep in self.endpoints
+            }
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway.from_env()
+    return _gateway
+
+
+def call_llm(system_prompt: str, user_prompt: str, model: str = "gpt-4o", image_base64: str = None, mime_type: str = "image/jpeg",
+             response_format: Optional[dict] = None) -> str:
     """
     API Gateway to communicate with the generic LLM API.
     Supports standard text generation and Vision API capabilities if image_base64 is provided.
+    response_format (e.g. a strict json_schema) constrains the completion to structured output.
+    Requests go through the multi-endpoint LLMGateway (retries, failover, hedging).
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if not os.getenv("OPENAI_API_KEY") and not os.getenv("OPENJUDGE_LLM_ENDPOINTS"):
         print("[WARNING] OPENAI_API_KEY is not set in environment or .env file.")
-        
+
     try:
-        client = OpenAI(api_key=api_key)
-        
         messages = [{"role": "system", "content": system_prompt}]
-        
+
         if image_base64:
             # Format payload for Vision API
             messages.append({
@@ -31,14 +332,12 @@ def call_llm(system_prompt: str, user_prompt: str, model: str = "gpt-4o", image_
         else:
             # Standard Text payload
             messages.append({"role": "user", "content": user_prompt})
-            
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0  # OpenJudge must remain deterministic
-        )
-        
-        return response.choices[0].message.content
-        
+
+        options = {"response_format": response_format} if response_format else None
+        return get_gateway().complete(messages, model, options)
+
+    except SessionCancelled:
+        # Not an API error: the engine turns it into a CANCELLED halt
+        raise
     except Exception as e:
         return f"[CRITICAL LLM API ERROR]: {str(e)}"
@@ -0,0 +1,107 @@
+import hashlib
+from typing import List, Optional
+
+
+class LoopDetector:
+    """
+    Enforces the "do not loop" rule of OPENJUDGE.md mechanically.
+    Keeps rolling hashes of every (tool, payload, output) step and of every iteration
+    fingerprint (verdict + step), and detects exact repetition (A A A) and
+    oscillation cycles (A B A B, A B C A B C) in either sequence.
+    """
+
+    def __init__(self, repeat_threshold: int = 3, max_cycle_length: int = 3, halt_after: int = 2, window: int = 24):
+        self.repeat_threshold = repeat_threshold
+        self.max_cycle_length = max_cycle_length
+        self.halt_after = halt_after
+        self.window = window
+        self.step_hashes: List[str] = []
+        self.iteration_hashes: List[str] = []
+        self.step_labels: List[str] = []
+        self.detections = 0
+        self._pending_step: Optional[str] = None
+
+    @staticmethod
+    def _hash(*parts) -> str:
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(str(part).encode("utf-8", "replace"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def observe_step(self, tool: str, payload: str, output: str) -> None:
+        """Records a physical tool execution of the current iteration."""
+        step_hash = self._hash(tool, (payload or "").strip(), output)
+        self._pending_step = step_hash
+        self.step_hashes = (self.step_hashes + [step_hash])[-self.window:]
+        label = f"{tool}({(payload or '').strip()[:80]})"
+        self.step_labels = (self.step_labels + [label])[-self.window:]
+
+    def observe_iteration(self, verdict: str, enforcement: str) -> Optional[str]:
+        """
+        Closes the current iteration and returns a description of the detected loop, if any.
+        """
+        normalized_verdict = " ".join((verdict or "").split()).lower()
+        self.iteration_hashes = (self.iteration_hashes + [self._hash(normalized_verdict, enforcement, self._pending_step)])[-self.window:]
+        had_step = self._pending_step is not None
+        self._pending_step = None
+
+        # Tool loops are only re-checked when a new step was appended this iteration
+        cycle = self._find_cycle(self.step_hashes) if had_step else None
+        if cycle:
+            steps = ", ".join(self.step_labels[-cycle:])
+            if cycle == 1:
+                description = f"The identical tool call {steps} returned the identical result {self.repeat_threshold} times in a row."
+            else:
+                description = f"The tool calls [{steps}] are oscillating in a cycle of length {cycle} with identical results."
+        else:
+            cycle = self._find_cycle(self.iteration_hashes)
+            if not cycle:
+                return None
+            description = f"The same verdict and action have recurred in a cycle of length {cycle} without any new evidence."
+
+        self.detections += 1
+        return description
+
+    @property
+    def should_halt(self) -> bool:
+        return self.detections >= self.halt_after
+
+    def _find_cycle(self, hashes: List[str]) -> Optional[int]:
+        """Returns the length of a cycle repeating at the tail of hashes, if any."""
+        for length in range(1, self.max_cycle_length + 1):
+            # Single-step repetition needs repeat_threshold copies; longer cycles need two full periods
+            repeats = self.repeat_threshold if length == 1 else 2
+            span = length * repeats
+            if len(hashes) < span:
+                continue
+            tail = hashes[-span:]
+            if all(tail[i] == tail[i + length] for i in range(span - length)):
+                # A constant sequence is reported as repetition, not as a longer cycle
+                if length > 1 and len(set(tail[:length])) == 1:
+                    continue
+                return length
+        return None
+
+    def to_dict(self) -> dict:
+        """Serializable detector state (used by session checkpoints)."""
+        return {
+            "step_hashes": self.step_hashes,
+            "iteration_hashes": self.iteration_hashes,
+            "step_labels": self.step_labels,
+            "detections": self.detections,
+        }
+
+    def restore(self, data: dict) -> None:
+        self.step_hashes = list(data.get("step_hashes", []))
+        self.iteration_hashes = list(data.get("iteration_hashes", []))
+        self.step_labels = list(data.get("step_labels", []))
+        self.detections = data.get("detections", 0)
+
+    def override_message(self, description: str) -> str:
+        return (
+            f"SYSTEM OVERRIDE: LOOP DETECTED. {description} "
+            "Repeating it will not produce new evidence. You MUST change the tool, the payload or the "
+            "verification logic ([ENFORCE: PIVOT]), or [ENFORCE: TERMINATE] with a clear failure report. "
+            "A further repetition halts the engine."
+        )
@@ -6,7 +6,9 @@ from rich.text import Text
 
 from parser import OpenJudgeParser, FormatViolationError
 from state_manager import StateManager
-from llm_client import call_llm
+from model_router import model_router, routed_call, SessionRoute
+from triage import triage_classifier
+from loop_detector import LoopDetector
 import tools
 
 # Load environment variables (e.g., OPENAI_API_KEY)
@@ -14,6 +16,7 @@ load_dotenv()
 
 console = Console()
 MAX_ITERATIONS = 25
+CHAT_SYSTEM_PROMPT = "You are a helpful, brilliant AI assistant operating within the OpenJudge ecosystem. Provide a clear, factual answer."
 
 def execute_action(action_type: str, tool_req: str, tool_payload: str, state_manager: StateManager) -> str:
     """
@@ -78,9 +81,16 @@ def execute_action(action_type: str, tool_req: str, tool_payload: str, state_man
 
 def triage_route(user_goal: str) -> str:
     """
-    A lightweight, token-optimized LLM call to categorize the user's intent.
+    Categorizes the user's intent. The local TriageClassifier answers clear cases
+    (and previously routed objectives) for free; only uncertain objectives fall
+    back to a lightweight, token-optimized LLM call.
     Returns either 'CHAT' or 'ENGINE'.
     """
+    local_route = triage_classifier.classify(user_goal)
+    if local_route:
+        console.print(f">>> [Triage Router] Local classifier routed request to {local_route}.", style="dim italic")
+        return local_route
+
     system_prompt = (
         "You are a cognitive routing matrix. The user will give an objective. "
         "If the objective is a simple conversational question that requires NO physical execution, "
@@ -90,21 +100,25 @@ def triage_route(user_goal: str) -> str:
     )
     
     console.print(">>> [Triage Router] Classifying Request Complexity...", style="dim italic")
-    raw_response = call_llm(system_prompt, user_goal)
+    raw_response, model = routed_call("triage", system_prompt, user_goal)
     
+    # Never cache a disrupted call; default to ENGINE for safety
+    if "[CRITICAL LLM API ERROR]" in raw_response:
+        return "ENGINE"
+
     # Default to ENGINE for safety if the LLM hallucinated
-    if "ROUTE: CHAT" in raw_response.upper():
-        return "CHAT"
-    return "ENGINE"
+    model_router.record_outcome("triage", model, "ROUTE:" in raw_response.upper())
+    route = "CHAT" if "ROUTE: CHAT" in raw_response.upper() else "ENGINE"
+    triage_classifier.remember(user_goal, route)
+    return route
 
 def execute_chat_route(user_goal: str):
     """
     Executes a standard, low-cost conversational LLM call.
     """
     console.print("[*] Triage Router selected: [bold green]CHAT ROUTE[/bold green] (Verification Engine Bypassed)", style="yellow")
-    sys_prompt = "You are a helpful, brilliant AI assistant operating within the OpenJudge ecosystem. Provide a clear, factual answer."
     console.print(">>> [LLM Standard Inference Engaged...]", style="dim")
-    response = call_llm(sys_prompt, user_goal)
+    response, _ = routed_call("chat", CHAT_SYSTEM_PROMPT, user_goal)
     console.print(Panel(response, title="OpenJudge Fast-Chat Response", border_style="blue"))
 
 def main(automated_goal: str = None):
@@ -123,6 +137,7 @@ def main(automated_goal: str = None):
     # Initialize Core Architectures
     parser = OpenJudgeParser()
     state_manager = StateManager()
+    loop_detector = LoopDetector()
 
     # 2. Accept final user goal via terminal input or parameter
     if automated_goal:
@@ -140,6 +155,9 @@ def main(automated_goal: str = None):
     # 4. Enter the autonomous while True loop
     console.print("\n[+] Entering Autonomous Agentic Loop...", style="bold green")
     
+    # Cheapest model first; violations and loops escalate the next call,
+    # and a TERMINATE from a cheaper model is re-verified by the strongest (as in the engine)
+    route = SessionRoute(model_router)
     while True:
         if state_manager.iteration_count >= MAX_ITERATIONS:
             console.print(Panel("MAX ITERATIONS REACHED - FORCE HALT", style="bold red on white"))
@@ -160,7 +178,8 @@ def main(automated_goal: str = None):
         
         # 4. Call LLM Gateway
         console.print(">>> [LLM Neural Gateway Engaged. Awaiting Inference...]", style="dim")
-        raw_response = call_llm(structured_system, f"USER OBJECTIVE: {user_goal}")
+        route.settle()
+        raw_response, model = routed_call(route.call_class, structured_system, f"USER OBJECTIVE: {user_goal}", tier=route.tier)
         
         # Check if the API call failed entirely at the socket/key level
         if "[CRITICAL LLM API ERROR]" in raw_response:
@@ -168,9 +187,12 @@ def main(automated_goal: str = None):
              console.print("[!] Halted due to external API disruption.", style="bold red")
              break
              
-        # 5. Parse response through strict XML/Tag parser
+        # 5. Parse response through strict XML/Tag parser (near misses are repaired locally, as in the engine)
         try:
-            parsed_data = parser.parse(raw_response)
+            parsed_data, repairs = parser.parse_or_repair(raw_response)
+            if repairs:
+                state_manager.add_action(f"Format repair: {'; '.join(repairs)} (reply in the exact format)")
+                console.print(f"[*] Format repaired locally: {'; '.join(repairs)}", style="yellow")
             enforcement = parsed_data.get("enforcement")
             tool_req = parsed_data.get("tool_required")
             tool_payload = parsed_data.get("tool_payload")
@@ -180,8 +202,15 @@ def main(automated_goal: str = None):
             thinking_text = f"State Memory:\n{parsed_data.get('state_memory')}\n\nLogical Extern:\n{parsed_data.get('logical_extern')}"
             console.print(Panel(thinking_text, title="Runtime Thought Process", border_style="cyan"))
             
-            console.print(f"[*] XML Extract | Verdict: {parsed_data.get('verdict')}", style="bold cyan")
-            
+            console.print(f"[*] XML Extract | Verdict: {parsed_data.get('verdict')} | Model: {model}", style="bold cyan")
+            route.on_step(model, enforcement)
+
+            stronger = route.confirm_terminate_by(model) if enforcement == "TERMINATE" else None
+            if stronger:
+                state_manager.add_action(f"Agent Action: TERMINATE proposed by {model}; re-verification by {stronger} required")
+                console.print(f"[*] TERMINATE proposed by {model}: re-verifying with {stronger}", style="bold yellow")
+                continue
+
             # Action Execution Matrix
             if enforcement == "TERMINATE":
                 console.print("\n[!] >>> KILL-SWITCH INITIATED <<< [!]", style="bold green")
@@ -204,6 +233,20 @@ def main(automated_goal: str = None):
                 console.print("[+] Feedback registered to Ledger of Truth:", style="yellow")
                 snippet = str(tool_output)[:150].replace('\n', ' ') + ('...' if len(str(tool_output)) > 150 else '')
                 console.print(f"    -> {snippet}", style="yellow")
+
+                # Loop & Stall Enforcement
+                if tool_req:
+                    loop_detector.observe_step(tool_req, tool_payload, tool_output)
+                loop_description = loop_detector.observe_iteration(parsed_data.get("verdict"), enforcement)
+                if loop_description:
+                    console.print(f"[!] LOOP DETECTED: {loop_description}", style="bold red")
+                    if loop_detector.should_halt:
+                        console.print(Panel("LOOP DETECTED - FORCE HALT", style="bold red on white"))
+                        break
+                    state_manager.add_failure(loop_detector.override_message(loop_description))
+                    escalated = route.on_loop()
+                    if escalated:
+                        console.print(f"[*] Loop detected: escalating to {escalated}", style="bold yellow")
                 
         # 7. Self-Healing Mechanism (Catches parsing failure and loops back)
         except FormatViolationError as e:
@@ -215,6 +258,7 @@ def main(automated_goal: str = None):
                 "End your response with an [ENFORCE: ACTION] tag. Fix immediately."
             )
             state_manager.add_failure(error_msg)
+            route.on_violation(model)
             console.print("[+] Self-Healing engaged: Error logged to StateManager to force correction.", style="bold red")
             continue
             
@@ -222,5 +266,30 @@ def main(automated_goal: str = None):
             console.print(f"\n[!] CRITICAL RUNTIME ERROR: {generic_e}", style="bold red")
             state_manager.add_failure(str(generic_e))
 
+CLI_USAGE = """usage: openjudge [OBJECTIVE ...]
+       openjudge batch OBJECTIVES_FILE [options]   run many objectives through one warm engine
+       openjudge index [REPO] [options]            incrementally index a codebase into long-term memory
+       openjudge daemon {serve,start,stop,status,run} [options]
+                                                   resident engine on a Unix socket
+
+Without an objective, OpenJudge prompts for one. Run `openjudge <command> --help` for a command's options."""
+
 if __name__ == "__main__":
-    main()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(CLI_USAGE)
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch":
+        # Batch Mode: many objectives through one warm engine (see batch.py)
+        from batch import cli as batch_cli
+        batch_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "index":
+        # Incremental codebase indexing into long-term memory (see indexer.py)
+        from indexer import cli as index_cli
+        index_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        # Resident engine on a Unix socket (see daemon.py)
+        from daemon import cli as daemon_cli
+        daemon_cli(sys.argv[2:])
+    else:
+        # An objective on the command line skips the interactive prompt
+        main(" ".join(sys.argv[1:]) or None)
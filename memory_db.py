@@ -1,7 +1,25 @@
 import os
+import json
+import time
+import threading
+import sqlite3
 import chromadb
 from chromadb.config import Settings
 
+from memory_retention import DEFAULT_POLICY_KEY, load_retention_policies, policy_for
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
 class VectorMemory:
     """
     A persistent Vector Database for OpenJudge using ChromaDB.
@@ -17,26 +35,63 @@ class VectorMemory:
 
     def _initialize(self):
         # Store the DB in the project root
-        db_path = os.path.join(os.path.dirname(__file__), "openjudge_memory_db")
-        self.client = chromadb.PersistentClient(path=db_path, settings=Settings(allow_reset=True))
+        self.db_path = os.path.join(os.path.dirname(__file__), "openjudge_memory_db")
+        self.client = chromadb.PersistentClient(path=self.db_path, settings=Settings(allow_reset=True))
         
         # Get or create the main memory collection
         self.collection = self.client.get_or_create_collection(name="openjudge_ledger")
 
+        self.retention = load_retention_policies()
+        # Retrieval recency is buffered and written back in batches by a background thread
+        self._touched = {}
+        self._touch_lock = threading.Lock()
+        self._last_touch_flush = time.time()
+        self.touch_flush_interval = 30.0
+        self._flusher = None
+        self._compactor = None
+
     def store(self, action_id: str, document: str, metadata: dict = None):
         """
         Embeds and stores a factual event or code snippet into long-term memory.
         """
+        metadata = dict(metadata or {"type": "general"})
+        now = time.time()
+        metadata.setdefault("created_at", now)
+        metadata.setdefault("last_retrieved", now)
         try:
             self.collection.add(
                 documents=[document],
-                metadatas=[metadata or {"type": "general"}],
+                metadatas=[metadata],
                 ids=[action_id]
             )
             return True
         except Exception as e:
             return str(e)
 
+    def store_many(self, ids: list, documents: list, metadatas: list, embeddings: list = None):
+        """
+        Upserts a batch of fragments in one write. Precomputed embeddings (e.g. from the
+        codebase indexer) skip Chroma's own embedding pass; they must come from the same
+        all-MiniLM-L6-v2 model the collection uses for queries.
+        """
+        now = time.time()
+        metadatas = [{"created_at": now, "last_retrieved": now, **meta} for meta in metadatas]
+        try:
+            self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+            return True
+        except Exception as e:
+            return str(e)
+
+    def delete(self, ids: list = None, where: dict = None):
+        """
+        Removes fragments by id and/or metadata filter (e.g. {"path": "src/app.py"}).
+        """
+        try:
+            self.collection.delete(ids=ids, where=where)
+            return True
+        except Exception as e:
+            return str(e)
+
     def query(self, search_text: str, n_results: int = 5):
         """
         Retrieves the most semantically relevant memories based on the search text.
@@ -54,10 +109,130 @@ class VectorMemory:
             for i, doc in enumerate(results["documents"][0]):
                 meta = results["metadatas"][0][i]
                 formatted.append(f"[{meta.get('type', 'Unknown')}] {doc}")
-                
+
+            self._record_retrieval(results["ids"][0])
             return "\n\n".join(formatted)
         except Exception as e:
-            return f"Query failed: {str(e)}"
+            return f"[ERROR] Memory Query Failed: {str(e)}"
+
+    def _record_retrieval(self, ids: list):
+        """Marks query hits as recently retrieved (protects them from LRU eviction)."""
+        now = time.time()
+        with self._touch_lock:
+            for doc_id in ids:
+                self._touched[doc_id] = now
+            due = now - self._last_touch_flush > self.touch_flush_interval
+            if due and (self._flusher is None or not self._flusher.is_alive()):
+                self._last_touch_flush = now
+                self._flusher = threading.Thread(target=self.flush_retrievals, name="memory-recency", daemon=True)
+                self._flusher.start()
+
+    def flush_retrievals(self):
+        """Writes buffered retrieval times back onto the fragments' current metadata."""
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._last_touch_flush = time.time()
+        if not touched:
+            return
+        try:
+            # Re-read the metadata: it may have been re-indexed or stamped since the query
+            current = self.collection.get(ids=list(touched), include=["metadatas"])
+            ids = current["ids"]
+            if ids:
+                self.collection.update(
+                    ids=ids,
+                    metadatas=[{**meta, "last_retrieved": touched[doc_id]} for doc_id, meta in zip(ids, current["metadatas"])]
+                )
+        except Exception:
+            # Recency is best-effort; fragments evicted in the meantime are simply absent
+            pass
+
+    def compact(self, vacuum: bool = True) -> dict:
+        """
+        Applies the retention policy of every configured memory type and reports what was
+        evicted and how much disk space was reclaimed. Fragments stored before retention
+        existed are stamped with the current time instead of being evicted.
+        """
+        started = time.perf_counter()
+        now = time.time()
+        bytes_before = _directory_size(self.db_path)
+        self.flush_retrievals()
+
+        report = {"evicted": {}, "remaining": {}}
+        configured = [mem_type for mem_type in self.retention if mem_type != DEFAULT_POLICY_KEY]
+        by_type = {}
+        for mem_type in configured:
+            policy = self.retention[mem_type]
+            if policy.max_age_days is None and policy.max_count is None:
+                # Unbounded (e.g. "code"): nothing to evict, so skip reading its metadata
+                continue
+            records = self.collection.get(where={"type": mem_type}, include=["metadatas"])
+            by_type[mem_type] = list(zip(records["ids"], records["metadatas"]))
+        # Types without their own entry fall under the default policy, each type on its own
+        records = self.collection.get(where={"type": {"$nin": configured}}, include=["metadatas"])
+        for doc_id, meta in zip(records["ids"], records["metadatas"]):
+            by_type.setdefault(meta.get("type"), []).append((doc_id, meta))
+
+        for mem_type, pairs in by_type.items():
+            policy = policy_for(self.retention, mem_type)
+            legacy = [(doc_id, meta) for doc_id, meta in pairs if "created_at" not in meta]
+            if legacy:
+                self.collection.update(
+                    ids=[doc_id for doc_id, _ in legacy],
+                    metadatas=[{**meta, "created_at": now, "last_retrieved": now} for _, meta in legacy]
+                )
+                pairs = [(doc_id, {**meta, "created_at": meta.get("created_at", now)}) for doc_id, meta in pairs]
+
+            expired, lru = policy.select_evictions(pairs, now)
+            doomed = expired + lru
+            for i in range(0, len(doomed), 5000):
+                self.collection.delete(ids=doomed[i:i + 5000])
+            report["evicted"][mem_type] = {"expired": len(expired), "lru": len(lru)}
+            report["remaining"][mem_type] = len(pairs) - len(doomed)
+
+        if vacuum:
+            report["vacuum"] = self._vacuum()
+        bytes_after = _directory_size(self.db_path)
+        report.update({
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "reclaimed_bytes": max(0, bytes_before - bytes_after),
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+        return report
+
+    def _vacuum(self) -> str:
+        """Returns freed SQLite pages to the filesystem (Chroma only marks deleted rows free)."""
+        try:
+            conn = sqlite3.connect(os.path.join(self.db_path, "chroma.sqlite3"), timeout=10)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+            return "done"
+        except sqlite3.Error as e:
+            # Busy with a concurrent write: the next compaction will try again
+            return f"skipped: {e}"
+
+    def start_background_compaction(self, interval_seconds: float):
+        """Runs compact() every interval_seconds on a daemon thread (idempotent)."""
+        if self._compactor is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    print(f"[memory] compaction: {json.dumps(self.compact())}")
+                except Exception as e:
+                    print(f"[memory] compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=loop, name="memory-compactor", daemon=True)
+        self._compactor.start()
 
 # Singleton Instance
 memory_db = VectorMemory()
+
+if __name__ == "__main__":
+    # One-off compaction: python memory_db.py
+    print(json.dumps(memory_db.compact(), indent=2))
@@ -0,0 +1,65 @@
+import os
+import json
+
+DAY_SECONDS = 86400
+
+# Retention per memory type. Codebase vectors ("code") are owned by the indexer's
+# manifest and stay unbounded unless configured. The "*" entry applies to every type
+# without its own entry (e.g. types chosen by the agent through memory_store).
+DEFAULT_POLICY_KEY = "*"
+DEFAULT_RETENTION = {
+    "general": {"max_age_days": 90, "max_count": 10000},
+    "code": {},
+    DEFAULT_POLICY_KEY: {"max_age_days": 90, "max_count": 10000},
+}
+
+
+class RetentionPolicy:
+    """Max age, max count and least-recently-retrieved eviction for one memory type."""
+
+    def __init__(self, max_age_days: float = None, max_count: int = None):
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+
+    def select_evictions(self, records: list, now: float) -> tuple:
+        """
+        records: (id, metadata) pairs of one type. Returns (expired_ids, lru_ids): fragments
+        older than max_age_days, then the least recently retrieved beyond max_count.
+        """
+        expired, kept = [], []
+        cutoff = now - self.max_age_days * DAY_SECONDS if self.max_age_days else None
+        for doc_id, meta in records:
+            if cutoff is not None and meta.get("created_at", now) < cutoff:
+                expired.append(doc_id)
+            else:
+                kept.append((doc_id, meta))
+
+        lru = []
+        if self.max_count is not None and len(kept) > self.max_count:
+            kept.sort(key=lambda r: r[1].get("last_retrieved", r[1].get("created_at", 0)))
+            lru = [doc_id for doc_id, _ in kept[:len(kept) - self.max_count]]
+        return expired, lru
+
+
+def load_retention_policies() -> dict:
+    """
+    DEFAULT_RETENTION overlaid with OPENJUDGE_MEMORY_RETENTION (JSON: {"type": {"max_age_days", "max_count"}}).
+    An invalid setting is reported and ignored rather than failing memory start-up.
+    """
+    defaults = {mem_type: RetentionPolicy(**spec) for mem_type, spec in DEFAULT_RETENTION.items()}
+    raw = os.getenv("OPENJUDGE_MEMORY_RETENTION", "").strip()
+    if not raw:
+        return defaults
+    try:
+        configured = json.loads(raw)
+        if not isinstance(configured, dict):
+            raise ValueError("expected a JSON object keyed by memory type")
+        return {**defaults, **{mem_type: RetentionPolicy(**spec) for mem_type, spec in configured.items()}}
+    except (ValueError, TypeError) as e:
+        print(f"[memory] Ignoring invalid OPENJUDGE_MEMORY_RETENTION ({e}); using the default retention.")
+        return defaults
+
+
+def policy_for(policies: dict, mem_type: str) -> RetentionPolicy:
+    """The policy of mem_type, falling back to the "*" default for unconfigured types."""
+    return policies.get(mem_type) or policies.get(DEFAULT_POLICY_KEY) or RetentionPolicy()
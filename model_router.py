@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from context_packer import count_tokens
+
+# Call classes, each with a ladder of models from cheapest to strongest
+DEFAULT_ROUTES = {
+    "triage": ["gpt-4o-mini"],
+    "chat": ["gpt-4o-mini"],
+    "repair": ["gpt-4o-mini", "gpt-4o"],
+    "main": ["gpt-4o-mini", "gpt-4o"],
+    "vision": ["gpt-4o"],
+}
+
+# USD per million (input, output) tokens
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+class RouteStats:
+    """Rolling latency, cost and outcomes of one (call class, model) route."""
+
+    def __init__(self, window: int = 100):
+        self.calls = 0
+        self.cost_usd = 0.0
+        self.latencies = deque(maxlen=window)
+        self.costs = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+
+    @property
+    def failure_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else None
+
+    @property
+    def mean_cost(self) -> Optional[float]:
+        return sum(self.costs) / len(self.costs) if self.costs else None
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failure_rate": round(self.failure_rate, 3),
+            "mean_latency_s": round(self.mean_latency, 3) if self.latencies else None,
+            "mean_cost_usd": round(self.mean_cost, 6) if self.costs else None,
+            "cost_usd": round(self.cost_usd, 4),
+        }
+
+
+class ModelRouter:
+    """
+    Picks the model for every LLM call from its call class (triage, chat, repair,
+    main, vision) and an escalation tier.
+    - Each class has a ladder of models, cheapest first. Tier 0 starts at the bottom;
+      callers raise the tier after a cheaper model produced a format violation, a loop
+      or an overturned TERMINATE, so the stronger model is only paid for when needed.
+    - Measured latency, cost and failure rate of each route feed the choice: a cheaper
+      rung is skipped while it fails more than `max_failure_rate`, or while its
+      expected price per successful call (its own latency and cost, plus the
+      escalation its failures trigger) exceeds going straight to the next rung.
+      `cost_weight` converts dollars into seconds for that comparison.
+    - Skipped rungs are re-probed every `explore_every` selections, so a recovered
+      model wins its traffic back.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, List[str]]] = None, prices: Optional[Dict[str, tuple]] = None,
+                 min_samples: int = 10, max_failure_rate: float = 0.4, cost_weight: float = 100.0,
+                 explore_every: int = 50):
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self.min_samples = min_samples
+        self.max_failure_rate = max_failure_rate
+        self.cost_weight = cost_weight
+        self.explore_every = explore_every
+        self.escalations = 0
+        self._stats: Dict[tuple, RouteStats] = {}
+        self._selections: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """
+        OPENJUDGE_MODEL_ROUTES: JSON {"call_class": ["cheap-model", "strong-model"]} overriding DEFAULT_ROUTES
+        (a single-model ladder disables escalation for that class).
+        OPENJUDGE_MODEL_PRICES: JSON {"model": [usd_per_m_input, usd_per_m_output]}.
+        """
+        settings = {}
+        for name, key, convert in (("routes", "OPENJUDGE_MODEL_ROUTES", lambda v: {c: list(l) for c, l in json.loads(v).items()}),
+                                   ("prices", "OPENJUDGE_MODEL_PRICES", lambda v: {m: tuple(p) for m, p in json.loads(v).items()}),
+                                   ("cost_weight", "OPENJUDGE_ROUTER_COST_WEIGHT", float)):
+            raw = os.getenv(key, "").strip()
+            if not raw:
+                continue
+            try:
+                settings[name] = convert(raw)
+            except (ValueError, TypeError, AttributeError) as e:
+                # A bad setting must not break every import of the router
+                print(f"[router] Ignoring invalid {key} ({e}); using the defaults.")
+        return cls(**settings)
+
+    def ladder(self, call_class: str) -> List[str]:
+        return self.routes.get(call_class) or self.routes["main"]
+
+    def model_at(self, call_class: str, tier: int) -> str:
+        ladder = self.ladder(call_class)
+        return ladder[min(tier, len(ladder) - 1)]
+
+    def top_tier(self, call_class: str) -> int:
+        return len(self.ladder(call_class)) - 1
+
+    def _route(self, call_class: str, model: str) -> RouteStats:
+        key = (call_class, model)
+        if key not in self._stats:
+            self._stats[key] = RouteStats()
+        return self._stats[key]
+
+    def _price(self, stats: RouteStats) -> float:
+        """Latency plus weighted cost of one call on this route."""
+        return stats.mean_latency + self.cost_weight * (stats.mean_cost or 0.0)
+
+    def _worth_trying(self, cheaper: RouteStats, stronger: RouteStats) -> bool:
+        if len(cheaper.outcomes) < self.min_samples:
+            return True
+        if cheaper.failure_rate > self.max_failure_rate:
+            return False
+        if not cheaper.latencies or not stronger.latencies:
+            return True
+        # Going through the cheaper rung costs its own call, plus the stronger call after each failure
+        return self._price(cheaper) + cheaper.failure_rate * self._price(stronger) <= self._price(stronger)
+
+    def select(self, call_class: str, tier: int = 0) -> str:
+        """Returns the model for a call of this class at (at least) the given escalation tier."""
+        ladder = self.ladder(call_class)
+        candidates = ladder[min(tier, len(ladder) - 1):]
+        with self._lock:
+            self._selections[call_class] = self._selections.get(call_class, 0) + 1
+            if self._selections[call_class] % self.explore_every == 0:
+                return candidates[0]
+            for cheaper, stronger in zip(candidates, candidates[1:]):
+                if self._worth_trying(self._route(call_class, cheaper), self._route(call_class, stronger)):
+                    return cheaper
+            return candidates[-1]
+
+    def escalate(self, call_class: str, tier: int) -> int:
+        """Next tier after a violation or a loop (stays at the top of the ladder)."""
+        if tier < self.top_tier(call_class):
+            with self._lock:
+                self.escalations += 1
+            return tier + 1
+        return tier
+
+    def judge(self, call_class: str, model: str, tier: int, ok: bool) -> int:
+        """Records a call's outcome and returns the next tier: escalated after a failure, back to 0 after a success."""
+        self.record_outcome(call_class, model, ok)
+        return 0 if ok else self.escalate(call_class, tier)
+
+    def record_call(self, call_class: str, model: str, latency: float, prompt: str, completion: str) -> None:
+        """Records latency and estimated cost (local token counts) of one completed call."""
+        price_in, price_out = self.prices.get(model, (0.0, 0.0))
+        cost = (count_tokens(prompt) * price_in + count_tokens(completion) * price_out) / 1_000_000
+        with self._lock:
+            stats = self._route(call_class, model)
+            stats.calls += 1
+            stats.cost_usd += cost
+            stats.latencies.append(latency)
+            stats.costs.append(cost)
+
+    def record_outcome(self, call_class: str, model: str, ok: bool) -> None:
+        """Records whether the call's output held up (parsed, no loop, TERMINATE confirmed, no API error)."""
+        with self._lock:
+            self._route(call_class, model).outcomes.append(ok)
+
+    def stats(self) -> dict:
+        with self._lock:
+            routes: Dict[str, dict] = {}
+            for (call_class, model), stats in self._stats.items():
+                routes.setdefault(call_class, {})[model] = stats.to_dict()
+            return {"escalations": self.escalations, "routes": routes}
+
+
+class SessionRoute:
+    """
+    Routing state of one agent session, shared by the engine loop and the CLI loop:
+    the class and escalation tier of the next reasoning call, and the routes still
+    awaiting their outcome. Task verdicts are not scored: FAIL only means a criterion is
+    not met yet. A route fails on a format violation, a detected loop, or a TERMINATE
+    that the strongest model overturns. Escalation methods return the model escalated
+    to (None if the tier did not change).
+    """
+
+    def __init__(self, router: ModelRouter, confirm_terminate: bool = True):
+        self.router = router
+        self.confirm_terminate = confirm_terminate
+        self.call_class, self.tier = "main", 0
+        # Route of the last well-formed step, and of a TERMINATE awaiting confirmation
+        self.judged_route: Optional[tuple] = None
+        self.pending_terminate: Optional[tuple] = None
+
+    def settle(self) -> None:
+        """Called before each reasoning call: the previous step held up, so its route scores a success."""
+        if self.judged_route:
+            self.router.record_outcome(*self.judged_route, True)
+            self.judged_route = None
+            # Escalation covers one step: back to the cheapest rung after a clean one
+            self.tier = 0
+
+    def select(self) -> str:
+        self.settle()
+        return self.router.select(self.call_class, self.tier)
+
+    def on_step(self, model: str, enforcement: Optional[str]) -> None:
+        """A well-formed step; it also confirms or overturns a cheaper model's pending TERMINATE."""
+        if self.pending_terminate:
+            self.router.record_outcome(*self.pending_terminate, enforcement == "TERMINATE")
+            self.pending_terminate = None
+        self.judged_route = (self.call_class, model)
+        self.call_class = "main"
+
+    def confirm_terminate_by(self, model: str) -> Optional[str]:
+        """
+        A cheaper model may not end the session on its own: returns the strongest model,
+        which the next call escalates to for re-verification, or None if model may halt.
+        """
+        if not self.confirm_terminate or model == self.router.ladder("main")[-1]:
+            return None
+        self.pending_terminate, self.judged_route = self.judged_route, None
+        self.tier = self.router.top_tier("main")
+        return self.router.model_at("main", self.tier)
+
+    def on_violation(self, model: str) -> Optional[str]:
+        """The retry is a repair call, on a stronger model than the one that broke the format."""
+        next_tier = self.router.judge(self.call_class, model, self.tier, False)
+        self.call_class, self.judged_route = "repair", None
+        escalated = self.router.model_at("repair", next_tier) if next_tier > self.tier else None
+        self.tier = next_tier
+        return escalated
+
+    def on_loop(self) -> Optional[str]:
+        """A loop or stall counts against the route that produced the step; the next call escalates."""
+        if self.judged_route:
+            self.router.record_outcome(*self.judged_route, False)
+            self.judged_route = None
+        next_tier = self.router.escalate("main", self.tier)
+        escalated = self.router.model_at("main", next_tier) if next_tier > self.tier else None
+        self.tier = next_tier
+        return escalated
+
+
+def routed_call(call_class: str, system_prompt: str, user_prompt: str, tier: int = 0, **kwargs) -> tuple:
+    """
+    call_llm through the router: picks the model, records latency and cost (and an
+    outcome failure on API errors). Returns (response, model).
+    """
+    from llm_client import call_llm
+
+    model = model_router.select(call_class, tier)
+    started = time.perf_counter()
+    response = call_llm(system_prompt, user_prompt, model=model, **kwargs)
+    if "[CRITICAL LLM API ERROR]" in response:
+        model_router.record_outcome(call_class, model, False)
+    else:
+        model_router.record_call(call_class, model, time.perf_counter() - started, system_prompt + user_prompt, response)
+    return response, model
+
+
+# Shared router used by the engine, the CLI routes and the vision tool
+model_router = ModelRouter.from_env()
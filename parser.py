@@ -1,4 +1,101 @@
 import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+ENFORCEMENT_ACTIONS = ["PROCEED", "PURGE", "PIVOT", "TERMINATE"]
+BLOCK_TAGS = ["state_memory", "logical_extern", "verdict", "tool_required", "tool_payload"]
+VERDICTS = ["PASS", "FAIL", "UNAVAILABLE"]
+
+_JSON_TYPES = {
+    "string": str, "integer": int, "number": (int, float), "boolean": bool,
+    "object": dict, "array": list, "null": type(None)
+}
+
+
+def tool_parameters(required: Dict[str, dict], optional: Optional[Dict[str, dict]] = None) -> dict:
+    """
+    Builds a strict-mode JSON schema for tool arguments: every property is listed as
+    required, and optional ones accept null (their tool-side default applies).
+    """
+    properties = dict(required)
+    for name, schema in (optional or {}).items():
+        nullable = {**schema, "type": [schema["type"], "null"]}
+        if "enum" in schema:
+            nullable["enum"] = schema["enum"] + [None]
+        properties[name] = nullable
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+def build_step_schema(tool_schemas: Dict[str, dict]) -> dict:
+    """
+    JSON schema of one OpenJudge step in the structured protocol: the XML blocks become
+    fields, the [ENFORCE:] tag an enum, and the tool call one typed variant per tool.
+    """
+    tool_variants: List[dict] = [{"type": "null"}]
+    for name, parameters in tool_schemas.items():
+        tool_variants.append({
+            "type": "object",
+            "properties": {"name": {"type": "string", "enum": [name]}, "arguments": parameters},
+            "required": ["name", "arguments"],
+            "additionalProperties": False
+        })
+    return {
+        "type": "object",
+        "properties": {
+            "state_memory": {"type": "string"},
+            "logical_extern": {"type": "string"},
+            "tool_call": {"anyOf": tool_variants},
+            "verdict": {"type": "string", "enum": VERDICTS},
+            "enforcement": {"type": "string", "enum": ENFORCEMENT_ACTIONS}
+        },
+        "required": ["state_memory", "logical_extern", "tool_call", "verdict", "enforcement"],
+        "additionalProperties": False
+    }
+
+
+def validate_json_schema(value: Any, schema: dict, path: str = "$") -> Optional[str]:
+    """Checks value against the JSON schema subset used by tool parameters. Returns the first error, or None."""
+    if "anyOf" in schema:
+        errors = [validate_json_schema(value, option, path) for option in schema["anyOf"]]
+        if all(errors):
+            return min(errors, key=len)
+        return None
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        # bool is an int subclass in Python, but not a JSON integer
+        if not any(isinstance(value, _JSON_TYPES[t]) and not (isinstance(value, bool) and t in ("integer", "number"))
+                   for t in types):
+            return f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path}: {value!r} is not one of {schema['enum']}"
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                return f"{path}: missing required field '{name}'"
+        for name, item in value.items():
+            if name in properties:
+                error = validate_json_schema(item, properties[name], f"{path}.{name}")
+                if error:
+                    return error
+            elif schema.get("additionalProperties") is False:
+                return f"{path}: unexpected field '{name}'"
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            error = validate_json_schema(item, schema["items"], f"{path}[{i}]")
+            if error:
+                return error
+    return None
+
+
+def payload_text(arguments: Dict[str, Any]) -> str:
+    """Canonical text form of structured tool arguments, for the ledger, cache keys and loop detection."""
+    present = {k: v for k, v in arguments.items() if v is not None}
+    if len(present) == 1 and isinstance(next(iter(present.values())), str):
+        return next(iter(present.values()))
+    return json.dumps(present, sort_keys=True)
+
 
 class FormatViolationError(Exception):
     """
@@ -23,6 +120,16 @@ class OpenJudgeParser:
         # Regex to catch the ENFORCE tag exactly
         self.enforce_pattern = re.compile(r'\[ENFORCE:\s*(PROCEED|PURGE|PIVOT|TERMINATE)\]')
 
+        # Near-miss patterns that repair() normalizes locally
+        actions = "|".join(ENFORCEMENT_ACTIONS)
+        self.fence_pattern = re.compile(r'[ \t]*```[\w-]*[ \t]*')
+        self.loose_tag_pattern = re.compile(r'<\s*(/?)\s*(openjudge_process|' + "|".join(BLOCK_TAGS) + r')\s*>', re.IGNORECASE)
+        self.loose_enforce_pattern = re.compile(r'\[\s*ENFORCE\s*:\s*(' + actions + r')\s*\]', re.IGNORECASE)
+        self.bare_enforce_pattern = re.compile(r'(?<!\[)\bENFORCE\s*:\s*(' + actions + r')\b\]?', re.IGNORECASE)
+        self.closing_block_pattern = re.compile(r'</(?:' + "|".join(BLOCK_TAGS) + r')>')
+        self.next_tag_pattern = re.compile(r'<(?:/?openjudge_process|' + "|".join(BLOCK_TAGS) + r')>|\[\s*ENFORCE\s*:|^[ \t*_]*ENFORCE\s*:',
+                                           re.IGNORECASE | re.MULTILINE)
+
     def parse(self, text: str) -> dict:
         """
         Parses the raw LLM output text.
@@ -51,8 +158,9 @@ class OpenJudgeParser:
                 "include <state_memory>, <logical_extern>, and <verdict> blocks."
             )
 
-        # 2. Extract Enforcement Tag
-        enforce_match = self.enforce_pattern.search(text)
+        # 2. Extract Enforcement Tag: the last one after the blocks, since the reasoning may quote the tag
+        enforce_matches = list(self.enforce_pattern.finditer(text, self._tail_start(text)))
+        enforce_match = enforce_matches[-1] if enforce_matches else None
         
         if not enforce_match:
             raise FormatViolationError(
@@ -63,3 +171,139 @@ class OpenJudgeParser:
         result["enforcement"] = enforce_match.group(1).upper()
         
         return result
+
+    def _tail_start(self, text: str) -> int:
+        """Offset just past the last closed block: only text from here on can hold the enforcement tag."""
+        closing = [m.end() for m in self.closing_block_pattern.finditer(text)]
+        return closing[-1] if closing else 0
+
+    def _normalize_tags(self, text: str) -> str:
+        """Fixes the spelling of block tags, leaving tag-like text inside a closed <tool_payload> untouched."""
+        pieces, position, payload_end = [], 0, -1
+        for match in self.loose_tag_pattern.finditer(text):
+            if match.start() < payload_end:
+                continue
+            closing, tag = match.group(1), match.group(2).lower()
+            pieces.append(text[position:match.start()] + f"<{closing}{tag}>")
+            position = match.end()
+            if tag == "tool_payload" and not closing:
+                # Payload content (files, scripts) runs to the last closing payload tag before the next opening one
+                following = re.search(r'<\s*tool_payload\s*>', text[position:], re.IGNORECASE)
+                limit = position + following.start() if following else len(text)
+                ends = [m for m in re.finditer(r'<\s*/\s*tool_payload\s*>', text[position:limit], re.IGNORECASE)]
+                if ends:
+                    payload_end = position + ends[-1].start()
+                    pieces.append(text[position:payload_end])
+                    position = payload_end
+        pieces.append(text[position:])
+        return "".join(pieces)
+
+    def repair(self, text: str) -> Tuple[str, List[str]]:
+        """
+        Deterministically normalizes near-miss formatting: a markdown code fence around the reply, miscapitalized
+        or spaced block tags, unclosed blocks, a lowercase [enforce: action] tag and an
+        unbracketed ENFORCE: ACTION after the blocks. Returns the text and the repairs applied.
+        """
+        repairs = []
+
+        # Only a fence wrapping the whole reply: fences inside blocks are payload content
+        lines = text.strip().split("\n")
+        if len(lines) > 2 and self.fence_pattern.fullmatch(lines[0]) and self.fence_pattern.fullmatch(lines[-1]):
+            repairs.append("stripped markdown code fence")
+            text = "\n".join(lines[1:-1])
+
+        normalized = self._normalize_tags(text)
+        if normalized != text:
+            repairs.append("normalized block tag spelling")
+            text = normalized
+
+        # Only the last tag after the blocks: the reasoning may quote a tag in passing
+        tail_start = self._tail_start(text)
+        if not self.enforce_pattern.search(text, tail_start):
+            matches = list(self.loose_enforce_pattern.finditer(text, tail_start))
+            if matches:
+                match = matches[-1]
+                text = f"{text[:match.start()]}[ENFORCE: {match.group(1).upper()}]{text[match.end():]}"
+                repairs.append("normalized enforcement tag case")
+
+        for tag in BLOCK_TAGS:
+            opening = text.find(f"<{tag}>")
+            if opening >= 0 and f"</{tag}>" not in text:
+                # The block ends where the next block (or the enforcement tag) begins
+                content_start = opening + len(tag) + 2
+                following = self.next_tag_pattern.search(text, content_start)
+                end = following.start() if following else len(text)
+                text = f"{text[:end].rstrip()}\n</{tag}>\n{text[end:]}"
+                repairs.append(f"closed <{tag}>")
+
+        tail_start = self._tail_start(text)
+        if not self.enforce_pattern.search(text, tail_start):
+            matches = list(self.bare_enforce_pattern.finditer(text, tail_start))
+            if matches:
+                match = matches[-1]
+                text = f"{text[:match.start()]}[ENFORCE: {match.group(1).upper()}]{text[match.end():]}"
+                repairs.append("bracketed bare ENFORCE tag")
+
+        return text, repairs
+
+    def parse_or_repair(self, text: str) -> Tuple[dict, List[str]]:
+        """
+        parse(), falling back to a repaired copy of the text when parsing fails or a block
+        was left unclosed. Returns (result, repairs applied); raises the original
+        FormatViolationError when the output is not a near miss.
+        """
+        result, violation = None, None
+        try:
+            result = self.parse(text)
+            # An unclosed block parses, but silently loses its content (e.g. the verdict)
+            unclosed = [tag for tag in BLOCK_TAGS if result[tag] is None and re.search(rf'<\s*{tag}\s*>', text, re.IGNORECASE)]
+            if not unclosed:
+                return result, []
+        except FormatViolationError as error:
+            violation = error
+        repaired, repairs = self.repair(text)
+        if repairs:
+            try:
+                return self.parse(repaired), repairs
+            except FormatViolationError:
+                pass
+        if result is not None:
+            return result, []
+        raise violation
+
+    def parse_structured(self, text: str, tool_schemas: Dict[str, dict]) -> dict:
+        """
+        Parses a JSON step of the structured protocol (see build_step_schema) into the
+        same fields parse() returns, plus `tool_arguments` (the validated, typed arguments).
+        """
+        body = text.strip()
+        if body.startswith("```"):
+            # Tolerate a fenced block from providers without schema enforcement
+            body = re.sub(r'^```(?:json)?\s*|\s*```$', '', body)
+        try:
+            step = json.loads(body)
+        except ValueError as e:
+            raise FormatViolationError(f"Response is not valid JSON ({e}). Return exactly one JSON object matching the step schema.")
+
+        # The tool call is checked against its own tool's schema for a precise error message
+        envelope = build_step_schema({})
+        envelope["properties"]["tool_call"] = {"type": ["object", "null"]}
+        error = validate_json_schema(step, envelope)
+        tool_call = step.get("tool_call") if isinstance(step, dict) else None
+        if not error and tool_call is not None:
+            if tool_call.get("name") not in tool_schemas:
+                error = f"$.tool_call.name: unknown tool {tool_call.get('name')!r}; available: {', '.join(tool_schemas)}"
+            else:
+                error = validate_json_schema(tool_call.get("arguments"), tool_schemas[tool_call["name"]], "$.tool_call.arguments")
+        if error:
+            raise FormatViolationError(f"Response does not match the step schema: {error}")
+
+        return {
+            "state_memory": step["state_memory"],
+            "logical_extern": step["logical_extern"],
+            "verdict": step["verdict"],
+            "tool_required": tool_call["name"] if tool_call else None,
+            "tool_payload": payload_text(tool_call["arguments"]) if tool_call else None,
+            "tool_arguments": tool_call["arguments"] if tool_call else None,
+            "enforcement": step["enforcement"]
+        }
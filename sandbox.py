@@ -0,0 +1,265 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+from typing import List, Optional, Union
+
+from tool_context import on_cancel, raise_if_cancelled
+
+try:
+    import resource
+    import fcntl
+except ImportError:
+    # Non-POSIX hosts (Windows): no rlimits and only a process-wide concurrency cap
+    resource = None
+    fcntl = None
+
+
+class ToolOutput(str):
+    """
+    A tool result string that also carries resource usage of the run.
+    Agent-visible semantics are unchanged (it *is* the output string); the engine
+    reads `.usage` to enrich the TOOL_RESULT event.
+    """
+    usage: Optional[dict] = None
+
+    def __new__(cls, text: str, usage: Optional[dict] = None):
+        obj = super().__new__(cls, text)
+        obj.usage = usage
+        return obj
+
+
+class SandboxResult:
+    def __init__(self, returncode: Optional[int], stdout: str, stderr: str, timed_out: bool, truncated: bool, usage: dict,
+                 cancelled: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.truncated = truncated
+        self.usage = usage
+        self.cancelled = cancelled
+
+
+# Exec wrapper applying the rlimits: it runs as its own program after exec, so no Python
+# code executes between fork and exec of the (possibly multithreaded) OpenJudge process.
+# argv: wrapper, "RLIMIT_X=soft:hard,...", command...
+LIMITS_WRAPPER = (
+    "import os, sys, resource\n"
+    "for spec in filter(None, sys.argv[1].split(',')):\n"
+    "    name, limits = spec.split('=')\n"
+    "    soft, hard = limits.split(':')\n"
+    "    resource.setrlimit(getattr(resource, name), (int(soft), int(hard)))\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class SandboxExecutor:
+    """
+    Resource-governed executor for the bash and python tools.
+    - rlimits per run: CPU seconds, process count, file size and writable memory,
+      applied by a small exec wrapper
+    - the run gets its own process group, killed as a whole on timeout
+    - stdout/stderr are capped at max_output_bytes
+    - runs queue behind a machine-wide semaphore (lock-file slots shared by every
+      OpenJudge process of the user)
+    - cancelling the session's token kills the process group at once
+    CPU seconds and peak RSS are measured with wait4() and reported per run.
+    """
+
+    def __init__(self, timeout: int = 30, cpu_seconds: Optional[int] = None, memory_mb: Optional[int] = None,
+                 max_processes: Optional[int] = None, max_output_bytes: Optional[int] = None,
+                 max_file_mb: Optional[int] = None, slots: Optional[int] = None, slot_dir: Optional[str] = None,
+                 queue_timeout: float = 300.0):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds or _env_int("OPENJUDGE_SANDBOX_CPU_SECONDS", 60)
+        # Caps the writable memory a run may map (RLIMIT_DATA: heap and private mappings). Unlike
+        # RLIMIT_AS it ignores the PROT_NONE reservations of Node, the JVM, Go and Chromium,
+        # so they still start. 0 disables the cap.
+        self.memory_mb = memory_mb if memory_mb is not None else _env_int("OPENJUDGE_SANDBOX_MEMORY_MB", 4096)
+        # RLIMIT_NPROC counts every process of the user, so keep it generous
+        self.max_processes = max_processes or _env_int("OPENJUDGE_SANDBOX_MAX_PROCS", 1024)
+        self.max_output_bytes = max_output_bytes or _env_int("OPENJUDGE_SANDBOX_MAX_OUTPUT_BYTES", 1_000_000)
+        self.max_file_mb = max_file_mb or _env_int("OPENJUDGE_SANDBOX_MAX_FILE_MB", 1024)
+        self.slots = slots or _env_int("OPENJUDGE_SANDBOX_SLOTS", os.cpu_count() or 4)
+        # Per-user directory: lock files in a world-writable /tmp could be pre-created by another user
+        self.slot_dir = slot_dir or os.getenv(
+            "OPENJUDGE_SANDBOX_SLOT_DIR", os.path.join(os.path.expanduser("~"), ".cache", "openjudge", "sandbox-slots")
+        )
+        self.queue_timeout = queue_timeout
+        self._local_semaphore = threading.BoundedSemaphore(self.slots)
+
+    # --- Host-wide concurrency ---
+
+    def _acquire_slot(self):
+        """Blocks until a host-wide execution slot is free. Returns a release callable."""
+        if fcntl is None:
+            if not self._local_semaphore.acquire(timeout=self.queue_timeout):
+                raise TimeoutError("No sandbox slot became free in time.")
+            return self._local_semaphore.release
+
+        os.makedirs(self.slot_dir, mode=0o700, exist_ok=True)
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            for i in range(self.slots):
+                fd = os.open(os.path.join(self.slot_dir, f"slot-{i}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    continue
+
+                def release(fd=fd):
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+                return release
+            if time.monotonic() > deadline:
+                raise TimeoutError("No sandbox slot became free in time.")
+            # A cancelled session stops queueing for a slot
+            raise_if_cancelled()
+            time.sleep(0.05)
+
+    # --- Execution ---
+
+    def _limited(self, command: Union[str, List[str]], shell: bool) -> List[str]:
+        """The argument vector running command under LIMITS_WRAPPER with this executor's rlimits."""
+        argv = ["/bin/sh", "-c", command] if shell else ([command] if isinstance(command, str) else list(command))
+        if resource is None:
+            return argv
+        limits = {"RLIMIT_CPU": (self.cpu_seconds, self.cpu_seconds + 1)}
+        if self.memory_mb:
+            # RLIMIT_DATA only covers mmap()ed memory since Linux 4.7; elsewhere fall back to the address space
+            memory_limit = "RLIMIT_DATA" if sys.platform.startswith("linux") else "RLIMIT_AS"
+            limits[memory_limit] = (self.memory_mb * 1024 * 1024,) * 2
+        limits["RLIMIT_FSIZE"] = (self.max_file_mb * 1024 * 1024,) * 2
+        if hasattr(resource, "RLIMIT_NPROC"):
+            limits["RLIMIT_NPROC"] = (self.max_processes, self.max_processes)
+        spec = ",".join(f"{name}={soft}:{hard}" for name, (soft, hard) in limits.items())
+        # -I -S: isolated mode without site imports keeps the wrapper's start-up to a few milliseconds
+        return [sys.executable, "-I", "-S", "-c", LIMITS_WRAPPER, spec] + argv
+
+    def _reader(self, stream, chunks: List[bytes], state: dict):
+        """Drains a pipe, keeping at most max_output_bytes (the rest is discarded)."""
+        kept = 0
+        for chunk in iter(lambda: stream.read(65536), b""):
+            room = self.max_output_bytes - kept
+            if room > 0:
+                chunks.append(chunk[:room])
+                kept += min(len(chunk), room)
+            if len(chunk) > room:
+                state["truncated"] = True
+        stream.close()
+
+    def run(self, command: Union[str, List[str]], shell: bool = False, cwd: Optional[str] = None) -> SandboxResult:
+        queued_at = time.monotonic()
+        raise_if_cancelled()
+        release = self._acquire_slot()
+        queue_wait = time.monotonic() - queued_at
+        try:
+            if os.name != "posix":
+                return self._run_unconfined(command, shell, cwd, queue_wait)
+            return self._run_confined(command, shell, cwd, queue_wait)
+        finally:
+            release()
+
+    def _run_confined(self, command, shell, cwd, queue_wait) -> SandboxResult:
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            self._limited(command, shell), cwd=cwd,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True  # own process group, so the whole tree can be killed
+        )
+        state = {"truncated": False, "timed_out": False, "cancelled": False}
+        out_chunks: List[bytes] = []
+        err_chunks: List[bytes] = []
+        readers = [
+            threading.Thread(target=self._reader, args=(proc.stdout, out_chunks, state), daemon=True),
+            threading.Thread(target=self._reader, args=(proc.stderr, err_chunks, state), daemon=True),
+        ]
+        for t in readers:
+            t.start()
+
+        def on_timeout():
+            state["timed_out"] = True
+            self.kill_group(proc.pid)
+        def on_cancelled():
+            state["cancelled"] = True
+            self.kill_group(proc.pid)
+        timer = threading.Timer(self.timeout, on_timeout)
+        timer.start()
+        unregister = on_cancel(on_cancelled)
+        try:
+            # wait4 reaps the child and returns its rusage (including reaped descendants)
+            _, status, rusage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+            unregister()
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        # Stragglers (background jobs) would keep the pipes open: end the whole group
+        self.kill_group(proc.pid)
+        for t in readers:
+            t.join(timeout=5)
+
+        rss_kb = rusage.ru_maxrss / 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+        usage = {
+            "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+            "peak_rss_mb": round(rss_kb / 1024, 1),
+            "wall_seconds": round(time.monotonic() - started, 3),
+            "queue_wait_seconds": round(queue_wait, 3),
+        }
+        return SandboxResult(
+            proc.returncode,
+            b"".join(out_chunks).decode("utf-8", "replace"),
+            b"".join(err_chunks).decode("utf-8", "replace"),
+            state["timed_out"], state["truncated"], usage, state["cancelled"]
+        )
+
+    def _run_unconfined(self, command, shell, cwd, queue_wait) -> SandboxResult:
+        started = time.monotonic()
+        proc = subprocess.Popen(command, shell=shell, cwd=cwd, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        state = {"cancelled": False}
+
+        def on_cancelled():
+            state["cancelled"] = True
+            proc.kill()
+        unregister = on_cancel(on_cancelled)
+        try:
+            stdout, stderr = proc.communicate(timeout=self.timeout)
+            returncode, timed_out = proc.returncode, False
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, stderr = proc.communicate()
+            returncode, timed_out = None, True
+        finally:
+            unregister()
+        truncated = len(stdout) > self.max_output_bytes or len(stderr) > self.max_output_bytes
+        usage = {"cpu_seconds": None, "peak_rss_mb": None,
+                 "wall_seconds": round(time.monotonic() - started, 3), "queue_wait_seconds": round(queue_wait, 3)}
+        return SandboxResult(
+            returncode,
+            stdout[:self.max_output_bytes].decode("utf-8", "replace"),
+            stderr[:self.max_output_bytes].decode("utf-8", "replace"),
+            timed_out, truncated, usage, state["cancelled"]
+        )
+
+    @staticmethod
+    def kill_group(pid: int) -> None:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+# Shared executor used by the bash and python tools
+sandbox_executor = SandboxExecutor()
@@ -0,0 +1,210 @@
+import json
+import time
+import uuid
+import zlib
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from tool_context import CancellationToken
+
+
+class SessionEventBuffer:
+    """
+    Bounded ring buffer of one session's telemetry events with monotonically
+    increasing IDs. Subscribers replay everything after a given Last-Event-ID and
+    then follow live events; a subscriber that fell out of the window receives a
+    STREAM_GAP event describing the IDs it missed.
+    """
+
+    def __init__(self, capacity: int = 1000, first_id: int = 1):
+        self.events: deque = deque(maxlen=capacity)
+        self.next_id = first_id
+        self.done = False
+        self.finished_at: Optional[float] = None
+        # Attached subscribers, and since when nobody has been attached
+        self.subscribers = 0
+        self.unwatched_since: Optional[float] = time.time()
+        self._changed = asyncio.Condition()
+
+    async def append(self, data: str) -> int:
+        async with self._changed:
+            event_id = self.next_id
+            self.next_id += 1
+            self.events.append((event_id, data))
+            self._changed.notify_all()
+            return event_id
+
+    async def close(self) -> None:
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def reopen(self) -> None:
+        """Continues a finished buffer (a resumed session): its history stays replayable and IDs keep rising."""
+        self.done = False
+        self.finished_at = None
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncGenerator[Tuple[int, str], None]:
+        self.subscribers += 1
+        self.unwatched_since = None
+        try:
+            async for item in self._follow(last_event_id):
+                yield item
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self.unwatched_since = time.time()
+
+    async def _follow(self, last_event_id: int) -> AsyncGenerator[Tuple[int, str], None]:
+        cursor = last_event_id
+        while True:
+            async with self._changed:
+                while not self.done and (not self.events or self.events[-1][0] <= cursor):
+                    await self._changed.wait()
+                batch = [(i, d) for i, d in self.events if i > cursor]
+                finished = self.done
+
+            if batch and batch[0][0] > cursor + 1:
+                yield (batch[0][0] - 1, f'{{"event": "STREAM_GAP", "missed_from": {cursor + 1}, "missed_to": {batch[0][0] - 1}}}')
+            for event_id, data in batch:
+                yield event_id, data
+                cursor = event_id
+
+            if finished and (not self.events or self.events[-1][0] <= cursor):
+                return
+
+
+class SessionRegistry:
+    """
+    Runs agent sessions as background tasks decoupled from client connections.
+    Clients attach to (and re-attach to) a session's event buffer; a dropped
+    connection does not abandon the run. Finished sessions stay replayable for
+    `retention_seconds`. Every session owns a CancellationToken: cancel() ends it
+    explicitly, and with `abandon_seconds` set, a running session that no client has
+    watched for that long is cancelled so its tools and LLM calls stop consuming resources.
+    """
+
+    def __init__(self, capacity: int = 1000, retention_seconds: float = 900.0, abandon_seconds: Optional[float] = None):
+        self.capacity = capacity
+        self.retention_seconds = retention_seconds
+        self.abandon_seconds = abandon_seconds
+        self.buffers: Dict[str, SessionEventBuffer] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.tokens: Dict[str, CancellationToken] = {}
+        self._watchdog: Optional[asyncio.Task] = None
+
+    def start(self, session_id: Optional[str],
+              source_factory: Callable[[str, CancellationToken], AsyncIterator[str]],
+              first_event_id: int = 1) -> str:
+        """
+        Starts draining source_factory(session_id, cancel_token) into the session's buffer and
+        returns the session id. A session restarted (resumed) while its finished buffer is still
+        retained continues that buffer; otherwise a fresh one numbers events from first_event_id
+        (after a worker restart: one past the client's Last-Event-ID, so nothing is skipped).
+        """
+        self._evict_expired()
+        session_id = session_id or uuid.uuid4().hex
+        if session_id in self.tasks and not self.tasks[session_id].done():
+            return session_id
+
+        buffer = self.buffers.get(session_id)
+        if buffer is not None:
+            buffer.reopen()
+        else:
+            buffer = SessionEventBuffer(self.capacity, first_event_id)
+            self.buffers[session_id] = buffer
+        token = CancellationToken()
+        self.tokens[session_id] = token
+
+        async def drain():
+            try:
+                async for telemetry_json in source_factory(session_id, token):
+                    await buffer.append(telemetry_json)
+            except Exception as e:
+                await buffer.append(f'{{"event": "CRITICAL_ERROR", "message": {json.dumps(str(e))}}}')
+            finally:
+                await buffer.close()
+
+        self.tasks[session_id] = asyncio.create_task(drain())
+        if self.abandon_seconds and (self._watchdog is None or self._watchdog.done()):
+            self._watchdog = asyncio.create_task(self._reap_abandoned())
+        return session_id
+
+    def get(self, session_id: str) -> Optional[SessionEventBuffer]:
+        return self.buffers.get(session_id)
+
+    def cancel(self, session_id: str, reason: str = "CANCELLED") -> bool:
+        """Cancels a running session; it halts with CANCELLED. Returns False if it is not running."""
+        task = self.tasks.get(session_id)
+        if task is None or task.done():
+            return False
+        return self.tokens[session_id].cancel(reason)
+
+    async def _reap_abandoned(self) -> None:
+        while any(not task.done() for task in self.tasks.values()):
+            await asyncio.sleep(min(5.0, self.abandon_seconds / 2))
+            now = time.time()
+            for session_id, buffer in list(self.buffers.items()):
+                if (not buffer.done and buffer.unwatched_since is not None
+                        and now - buffer.unwatched_since > self.abandon_seconds):
+                    self.cancel(session_id, "ABANDONED")
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        for session_id, buffer in list(self.buffers.items()):
+            if buffer.done and buffer.finished_at and now - buffer.finished_at > self.retention_seconds:
+                del self.buffers[session_id]
+                self.tasks.pop(session_id, None)
+                self.tokens.pop(session_id, None)
+
+
+async def ndjson_batches(events: AsyncIterator[Tuple[int, str]], batch_ms: int = 50,
+                         max_batch: int = 256, compress: bool = False) -> AsyncGenerator[bytes, None]:
+    """
+    Coalesces bursts of events into NDJSON chunks ({"id": n, "event": {...}} per line).
+    Events arriving within batch_ms of the first one in a burst share one write.
+    With compress=True the stream is gzip-encoded, sync-flushed after each batch.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    iterator = events.__aiter__()
+    loop = asyncio.get_running_loop()
+    next_event: Optional[asyncio.Future] = None
+    ended = False
+
+    try:
+        while not ended:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+            try:
+                event_id, data = await next_event
+            except StopAsyncIteration:
+                break
+            next_event = None
+            lines = [f'{{"id": {event_id}, "event": {data}}}\n']
+
+            deadline = loop.time() + batch_ms / 1000
+            while len(lines) < max_batch and loop.time() < deadline:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({next_event}, timeout=deadline - loop.time())
+                if not done:
+                    # Keep waiting for this event in the next batch
+                    break
+                finished, next_event = next_event, None
+                try:
+                    event_id, data = finished.result()
+                except StopAsyncIteration:
+                    ended = True
+                    break
+                lines.append(f'{{"id": {event_id}, "event": {data}}}\n')
+
+            chunk = "".join(lines).encode("utf-8")
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else chunk
+
+        if compressor:
+            yield compressor.flush()
+    finally:
+        # Client went away mid-batch: stop waiting on the subscription (the agent run continues)
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
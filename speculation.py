@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from git_ops import run_git, GitError
+
+# Heavy dependency trees are shared with the origin through symlinks instead of copied
+SHARED_DIRS = ("node_modules", ".venv", "venv", "__pycache__", ".tox", ".mypy_cache", ".pytest_cache")
+
+
+def _stat_tree(root: str) -> Dict[str, Tuple[int, int]]:
+    """(mtime_ns, size) of every regular file under root, excluding .git and shared symlinked dirs."""
+    snapshot = {}
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d != ".git" and not os.path.islink(os.path.join(directory, d))]
+        for name in files:
+            path = os.path.join(directory, name)
+            if name == ".git" or os.path.islink(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[os.path.relpath(path, root)] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+class ScratchWorkspace:
+    """
+    Isolated copy of a working directory for one speculative branch.
+    Git work trees get a detached `git worktree` (cheap: objects are shared) with the
+    origin's uncommitted and untracked files overlaid; other directories are copied.
+    The winning branch's file changes are synced back into the origin.
+    """
+
+    def __init__(self, origin: str, root: Optional[str] = None, label: str = "branch"):
+        self.origin = os.path.abspath(origin)
+        self.root = root
+        self.label = label
+        self.parent: Optional[str] = None
+        self.path: Optional[str] = None
+        # The directory tools run in: the origin's counterpart inside the scratch copy
+        self.workdir: Optional[str] = None
+        self.is_worktree = False
+        self.snapshot: Dict[str, Tuple[int, int]] = {}
+
+    def create(self) -> str:
+        self.parent = tempfile.mkdtemp(prefix=f"openjudge-{self.label}-", dir=self.root)
+        self.path = os.path.join(self.parent, "work")
+        try:
+            run_git(["rev-parse", "--verify", "HEAD"], cwd=self.origin)
+            toplevel = run_git(["rev-parse", "--show-toplevel"], cwd=self.origin).strip()
+            prefix = run_git(["rev-parse", "--show-prefix"], cwd=self.origin).strip()
+            run_git(["worktree", "add", "--detach", "--quiet", self.path, "HEAD"], cwd=self.origin)
+            self.is_worktree = True
+            self.workdir = os.path.join(self.path, prefix) if prefix else self.path
+            self._overlay_uncommitted(toplevel)
+            os.makedirs(self.workdir, exist_ok=True)
+        except (GitError, OSError):
+            if self.is_worktree:
+                self.cleanup()
+                self.parent = tempfile.mkdtemp(prefix=f"openjudge-{self.label}-", dir=self.root)
+                self.path = os.path.join(self.parent, "work")
+                self.is_worktree = False
+            shutil.copytree(self.origin, self.path, symlinks=True,
+                            ignore=shutil.ignore_patterns(".git", *SHARED_DIRS))
+            self.workdir = self.path
+
+        for name in SHARED_DIRS:
+            source = os.path.join(self.origin, name)
+            target = os.path.join(self.workdir, name)
+            if os.path.isdir(source) and not os.path.lexists(target):
+                os.symlink(source, target)
+
+        self.snapshot = _stat_tree(self.workdir)
+        return self.workdir
+
+    def _overlay_uncommitted(self, toplevel: str) -> None:
+        """Brings the origin's modified, deleted and untracked files into the fresh worktree."""
+        entries = run_git(["status", "--porcelain", "-z", "--untracked-files=all"], cwd=toplevel).split("\0")
+        i = 0
+        while i < len(entries):
+            entry = entries[i]
+            i += 1
+            if len(entry) < 4:
+                continue
+            status, rel = entry[:2], entry[3:]
+            if status[0] in "RC":
+                # Renames/copies carry the source path as the next field
+                i += 1
+            source = os.path.join(toplevel, rel)
+            target = os.path.join(self.path, rel)
+            if os.path.isfile(source):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+            elif os.path.lexists(target) and not os.path.isdir(target):
+                os.remove(target)
+
+    def sync_back(self) -> dict:
+        """Applies the branch's file changes (writes and deletions) to the origin directory."""
+        current = _stat_tree(self.workdir)
+        written = [rel for rel, state in current.items() if self.snapshot.get(rel) != state]
+        deleted = [rel for rel in self.snapshot if rel not in current]
+        for rel in written:
+            target = os.path.join(self.origin, rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(self.workdir, rel), target)
+        for rel in deleted:
+            try:
+                os.remove(os.path.join(self.origin, rel))
+            except OSError:
+                pass
+        return {"written": sorted(written), "deleted": sorted(deleted)}
+
+    def cleanup(self) -> None:
+        if self.is_worktree:
+            try:
+                run_git(["worktree", "remove", "--force", self.path], cwd=self.origin)
+            except GitError:
+                pass
+        if self.parent:
+            shutil.rmtree(self.parent, ignore_errors=True)
+        if self.is_worktree:
+            try:
+                run_git(["worktree", "prune"], cwd=self.origin)
+            except GitError:
+                pass
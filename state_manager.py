@@ -1,4 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from context_packer import count_tokens, digest_output
+from blob_store import BlobStore
 
 class StateManager:
     """
@@ -7,7 +10,13 @@ class StateManager:
     to prevent the LLM from entering infinite loops and to mitigate context amnesia.
     """
     
-    def __init__(self):
+    def __init__(self, token_budget: int = 6000, full_outputs: int = 2, blob_store: Optional[BlobStore] = None):
+        # Context packing: the ledger never renders more than token_budget tokens,
+        # and only the newest `full_outputs` tool outputs are shown undigested.
+        self.token_budget = token_budget
+        self.full_outputs = full_outputs
+        # Large outputs live out of line in the blob store; the ledger keeps hash, size and digest
+        self.blob_store = blob_store
         self.history_of_actions: List[str] = []
         self.known_failures: List[str] = []
         self.tool_outputs: List[Dict[str, Any]] = []
@@ -21,52 +30,132 @@ class StateManager:
         """Logs a failure (e.g., format violation or execution error)."""
         self.known_failures.append(f"[Iter {self.iteration_count}] FAIL: {failure_reason}")
 
-    def add_tool_output(self, tool_name: str, output: str) -> None:
-        """Records the result of a tool execution."""
-        self.tool_outputs.append({
+    def add_tool_output(self, tool_name: str, output: str, cached: bool = False) -> None:
+        """Records the result of a tool execution (noting when it was served from the session cache)."""
+        entry = {
             "iteration": self.iteration_count,
             "tool": tool_name,
-            "output": output
-        })
+            "cached": cached
+        }
+        text = str(output)
+        if self.blob_store and len(text) > self.blob_store.inline_threshold:
+            entry["blob"] = self.blob_store.put(text)
+            entry["size"] = len(text.encode("utf-8", "replace"))
+            entry["digest"] = digest_output(text, 256)
+        else:
+            entry["output"] = output
+        self.tool_outputs.append(entry)
+
+    def output_text(self, entry: Dict[str, Any]) -> str:
+        """Returns the full text of a ledger entry, dereferencing out-of-line blobs."""
+        if "blob" in entry:
+            try:
+                return self.blob_store.read(entry["blob"])
+            except (OSError, ValueError, AttributeError):
+                return entry["digest"]
+        return str(entry["output"])
+
+    def fork(self) -> "StateManager":
+        """Independent copy of the ledger for a speculative branch (blob references are shared)."""
+        clone = StateManager(self.token_budget, self.full_outputs, self.blob_store)
+        clone.history_of_actions = list(self.history_of_actions)
+        clone.known_failures = list(self.known_failures)
+        clone.tool_outputs = [dict(entry) for entry in self.tool_outputs]
+        clone.iteration_count = self.iteration_count
+        return clone
+
+    def adopt(self, branch: "StateManager") -> None:
+        """Merges a winning branch back: its ledger extends this one from the fork point."""
+        self.history_of_actions = branch.history_of_actions
+        self.known_failures = branch.known_failures
+        self.tool_outputs = branch.tool_outputs
+        self.iteration_count = branch.iteration_count
 
     def increment_iteration(self) -> None:
         """Advances the iteration counter."""
         self.iteration_count += 1
 
+    def discard_iteration(self) -> None:
+        """Rolls the counter back over an iteration that was cancelled before it recorded anything."""
+        self.iteration_count = max(0, self.iteration_count - 1)
+
     def format_for_prompt(self) -> str:
         """
-        Formats the history cleanly to be injected back into the LLM prompt.
-        Ensures context is preserved without excessive bloat.
+        Packs the ledger into at most `token_budget` tokens (counted with the local tokenizer).
+        Priority order: known failures, the recent action history, the newest tool outputs
+        in full, then older tool outputs as compact digests while room remains.
         """
-        state_str = "=== RUNTIME STATE MEMORY ===\n\n"
-        
-        state_str += f"Current Iteration: {self.iteration_count}\n\n"
-        
+        header = "=== RUNTIME STATE MEMORY ===\n\n" + f"Current Iteration: {self.iteration_count}\n\n"
+        footer = "============================\n"
+        remaining = self.token_budget - count_tokens(header + footer) - 40  # section titles
+
+        # 1. Known failures, newest first
+        failures: List[str] = []
+        failure_cap = max(64, self.token_budget // 8)
+        for fail in reversed(self.known_failures):
+            line = f"- {digest_output(fail, failure_cap)}\n"
+            cost = count_tokens(line)
+            if cost > remaining:
+                break
+            failures.insert(0, line)
+            remaining -= cost
+
+        # 2. Action history (one-liners, recent bounds)
+        actions: List[str] = []
+        for act in reversed(self.history_of_actions[-10:]):
+            line = f"- {act}\n"
+            cost = count_tokens(line)
+            if cost > remaining:
+                break
+            actions.insert(0, line)
+            remaining -= cost
+
+        # 3. Tool outputs, newest first: the latest ones in full (or digested to fit), older ones digested
+        outputs: List[str] = []
+        older_cap = max(128, self.token_budget // 10)
+        for rank, out in enumerate(reversed(self.tool_outputs)):
+            cache_note = " | served from cache" if out.get("cached") else ""
+            blob_note = f" | blob {out['blob']} ({out['size']} bytes, read ranges with blob_read)" if "blob" in out else ""
+            out_header = f"[{out['tool']} Output | Iter {out['iteration']}{cache_note}{blob_note}]:\n"
+            room = remaining - count_tokens(out_header) - 1
+            if room < 16:
+                break
+            if rank < self.full_outputs:
+                entry = out_header + digest_output(self.output_text(out), room) + "\n"
+            else:
+                # Older blobs are rendered from their stored digest without touching the disk
+                text = out["digest"] if "blob" in out else str(out["output"])
+                entry = out_header + digest_output(text, min(room, older_cap)) + "\n"
+            outputs.insert(0, entry)
+            remaining -= count_tokens(entry)
+
+        while True:
+            state_str = self._render(header, footer, failures, actions, outputs)
+            # Guard against tokenizer merges across piece boundaries
+            if count_tokens(state_str) <= self.token_budget or not outputs:
+                return state_str
+            outputs.pop(0)
+
+    def _render(self, header: str, footer: str, failures: List[str], actions: List[str], outputs: List[str]) -> str:
+        state_str = header
+
         state_str += "--- History of Actions ---\n"
         if not self.history_of_actions:
             state_str += "(No actions taken yet)\n"
-        for act in self.history_of_actions[-10:]: # Keep recent bounds
-            state_str += f"- {act}\n"
-            
+        state_str += "".join(actions)
+
         state_str += "\n--- Known Failures (DO NOT REPEAT) ---\n"
         if not self.known_failures:
             state_str += "(No recorded failures)\n"
-        for fail in self.known_failures[-5:]:
-            state_str += f"- {fail}\n"
-            
+        state_str += "".join(failures)
+
         state_str += "\n--- Recent Tool Logs ---\n"
         if not self.tool_outputs:
             state_str += "(No tools executed yet)\n"
-        
-        # Only show the last 3-5 tool outputs to prevent context bloat
-        recent_outputs = self.tool_outputs[-5:]
-        for out in recent_outputs:
-            state_str += f"[{out['tool']} Output | Iter {out['iteration']}]:\n"
-            # Truncate output if too long
-            out_str = str(out['output'])
-            if len(out_str) > 1000:
-                out_str = out_str[:1000] + "... [TRUNCATED]"
-            state_str += f"{out_str}\n"
-            
-        state_str += "============================\n"
+        omitted = len(self.tool_outputs) - len(outputs)
+        if omitted > 0:
+            state_str += f"({omitted} older tool outputs omitted to fit the context budget)\n"
+        state_str += "".join(outputs)
+
+        state_str += footer
         return state_str
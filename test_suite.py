@@ -1,6 +1,37 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
 import unittest
-from parser import OpenJudgeParser, FormatViolationError
-from tools import execute_bash, execute_python
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from parser import OpenJudgeParser, FormatViolationError, tool_parameters, validate_json_schema, payload_text
+from tools import execute_bash, execute_python, browser_script
+from triage import TriageClassifier
+from batch import load_objectives, load_completed_ids, discard_torn_tail
+from state_manager import StateManager
+from context_packer import count_tokens, digest_output
+from tool_cache import ToolResultCache, file_state_key
+from speculation import ScratchWorkspace
+from loop_detector import LoopDetector
+from checkpoint import CheckpointLog
+from blob_store import BlobStore
+from git_ops import GitMirrorCache, StructuredGitQueries, GitError, run_git
+from sandbox import SandboxExecutor
+from llm_client import LLMGateway, LLMEndpoint
+from session_stream import SessionEventBuffer, SessionRegistry
+from job_queue import JobQueue, JobWorkerPool, LeaseLost
+import indexer as indexer_module
+from indexer import CodebaseIndexer, chunk_python
+from memory_retention import RetentionPolicy, DAY_SECONDS, load_retention_policies, policy_for
+from tool_context import CancellationToken, SessionCancelled, run_cancellable, raise_if_cancelled, tool_workdir, resolve_path
+from daemon import OpenJudgeDaemon, request_daemon
+from model_router import ModelRouter, SessionRoute
+import engine as engine_module
+from engine import OpenJudgeEngine
 
 class TestOpenJudgeParser(unittest.TestCase):
     def setUp(self):
@@ -44,6 +75,135 @@ class TestOpenJudgeParser(unittest.TestCase):
             self.parser.parse(invalid_xml)
 
 
+# Malformed replies as seen in real sessions: (output, expected enforcement, or None if unrecoverable)
+NEAR_MISS_CORPUS = [
+    ("```xml\n<openjudge_process>\n<state_memory>C1: tests pass</state_memory>\n<logical_extern>Run pytest</logical_extern>\n"
+     "<tool_required>bash</tool_required>\n<tool_payload>pytest -q</tool_payload>\n<verdict>FAIL</verdict>\n"
+     "</openjudge_process>\n[ENFORCE: proceed]\n```", "PROCEED"),
+    ("<openjudge_process>\n<state_memory>C1 verified</state_memory>\n<logical_extern>Output matches</logical_extern>\n"
+     "<verdict>PASS</verdict>\n</openjudge_process>\n[enforce: terminate]", "TERMINATE"),
+    ("<openjudge_process>\n<state_memory>Checking C2</state_memory>\n<logical_extern>Read config</logical_extern>\n"
+     "<tool_required>read_file</tool_required>\n<tool_payload>config.yaml</tool_payload>\n<verdict>FAIL\n"
+     "</openjudge_process>\n[ENFORCE: PROCEED]", "PROCEED"),
+    ("<openjudge_process>\n<state_memory>All criteria met</state_memory>\n<logical_extern>Evidence in ledger</logical_extern>\n"
+     "<verdict>PASS</verdict>\n</openjudge_process>\n\n**ENFORCE: TERMINATE**", "TERMINATE"),
+    ("<openjudge_process>\n<State_Memory>Approach failed twice</State_Memory>\n<logical_extern>Switch to the API</logical_extern>\n"
+     "<Verdict>FAIL</Verdict>\n</openjudge_process>\n[Enforce:Pivot]", "PIVOT"),
+    ("```\n<openjudge_process>\n<state_memory>Trim output</state_memory>\n<logical_extern>Too verbose</logical_extern>\n"
+     "<verdict>FAIL\n[enforce: purge]\n```", "PURGE"),
+    ("<openjudge_process>\n<state_memory>C1: README documents install</state_memory>\n<logical_extern>Write it</logical_extern>\n"
+     "<tool_required>write_file</tool_required>\n<tool_payload>README.md|# Demo\n\n```bash\npip install demo\n```\n</tool_payload>\n"
+     "<verdict>FAIL</verdict>\n</openjudge_process>\n[enforce: proceed]", "PROCEED"),
+    ("<openjudge_process>\n<state_memory>C3 still open: must not [enforce: terminate] yet</state_memory>\n"
+     "<logical_extern>Run the integration suite</logical_extern>\n<verdict>FAIL</verdict>\n</openjudge_process>\n"
+     "[enforce: proceed]", "PROCEED"),
+    ("Sure! I will run the tests now and report back.", None),
+    ("<openjudge_process>\n<state_memory>No decision</state_memory>\n<verdict>FAIL</verdict>\n</openjudge_process>", None),
+]
+
+
+class TestNearMissRepair(unittest.TestCase):
+    def setUp(self):
+        self.parser = OpenJudgeParser()
+
+    def test_corpus_repairs_save_llm_calls(self):
+        llm_calls_saved = 0
+        for text, expected in NEAR_MISS_CORPUS:
+            try:
+                self.parser.parse(text)
+                strict_failed = False
+            except FormatViolationError:
+                strict_failed = True
+            if expected is None:
+                with self.assertRaises(FormatViolationError):
+                    self.parser.parse_or_repair(text)
+                continue
+            result, repairs = self.parser.parse_or_repair(text)
+            self.assertTrue(repairs)
+            self.assertEqual(result["enforcement"], expected)
+            self.assertIn(result["verdict"], ("PASS", "FAIL"))
+            llm_calls_saved += strict_failed
+        # The unclosed <verdict> reply parses strictly, but would have lost its verdict
+        self.assertEqual(llm_calls_saved, 7)
+
+    def test_repair_keeps_block_contents(self):
+        result, repairs = self.parser.parse_or_repair(NEAR_MISS_CORPUS[2][0])
+        self.assertEqual(result["tool_payload"], "config.yaml")
+        self.assertEqual(result["verdict"], "FAIL")
+        self.assertEqual(repairs, ["closed <verdict>"])
+
+    def test_fences_inside_blocks_are_payload(self):
+        result, repairs = self.parser.parse_or_repair(NEAR_MISS_CORPUS[6][0])
+        self.assertEqual(result["tool_payload"], "README.md|# Demo\n\n```bash\npip install demo\n```")
+        self.assertEqual(repairs, ["normalized enforcement tag case"])
+
+    def test_valid_output_is_not_touched(self):
+        text = "<state_memory>m</state_memory><verdict>PASS</verdict>\n[ENFORCE: TERMINATE]"
+        self.assertEqual(self.parser.parse_or_repair(text)[1], [])
+
+    def test_tag_quoted_in_reasoning_is_not_promoted(self):
+        text = ("<state_memory>Do not ENFORCE: TERMINATE before C2</state_memory>\n<logical_extern>l</logical_extern>\n"
+                "<verdict>FAIL</verdict>")
+        with self.assertRaises(FormatViolationError):
+            self.parser.parse_or_repair(text)
+
+    def test_lowercase_tag_quoted_in_reasoning_is_left_alone(self):
+        result, repairs = self.parser.parse_or_repair(NEAR_MISS_CORPUS[7][0])
+        self.assertEqual(result["enforcement"], "PROCEED")
+        self.assertEqual(result["state_memory"], "C3 still open: must not [enforce: terminate] yet")
+        self.assertEqual(repairs, ["normalized enforcement tag case"])
+
+    def test_tag_like_payload_text_is_not_rewritten(self):
+        payload = "notes.md|Reply with <Verdict>PASS</Verdict> and [enforce: terminate]"
+        text = (f"<State_Memory>m</State_Memory><logical_extern>l</logical_extern><tool_required>write_file</tool_required>"
+                f"<tool_payload>{payload}</tool_payload><verdict>FAIL</verdict>\n[ENFORCE: PROCEED]")
+        result, repairs = self.parser.parse_or_repair(text)
+        self.assertEqual(repairs, ["normalized block tag spelling"])
+        self.assertEqual(result["tool_payload"], payload)
+        self.assertEqual((result["verdict"], result["enforcement"]), ("FAIL", "PROCEED"))
+
+
+class TestStructuredProtocol(unittest.TestCase):
+    def setUp(self):
+        self.parser = OpenJudgeParser()
+        self.schemas = {
+            "write_file": tool_parameters({"filepath": {"type": "string"}, "content": {"type": "string"}}),
+            "memory_query": tool_parameters({"query": {"type": "string"}}, {"count": {"type": "integer"}}),
+        }
+
+    def step(self, **overrides):
+        step = {"state_memory": "C1 pending", "logical_extern": "Write the file", "verdict": "FAIL",
+                "enforcement": "PROCEED",
+                "tool_call": {"name": "write_file", "arguments": {"filepath": "a.txt", "content": "x | y"}}}
+        step.update(overrides)
+        return json.dumps(step)
+
+    def test_typed_arguments_survive_pipes(self):
+        result = self.parser.parse_structured(self.step(), self.schemas)
+        self.assertEqual(result["tool_required"], "write_file")
+        self.assertEqual(result["tool_arguments"], {"filepath": "a.txt", "content": "x | y"})
+        self.assertEqual(result["enforcement"], "PROCEED")
+
+    def test_schema_violations_are_format_violations(self):
+        bad_steps = [
+            "<verdict>PASS</verdict> [ENFORCE: PROCEED]",
+            self.step(enforcement="HALT"),
+            self.step(tool_call={"name": "rm_rf", "arguments": {}}),
+            self.step(tool_call={"name": "write_file", "arguments": {"filepath": "a.txt"}}),
+            self.step(tool_call={"name": "memory_query", "arguments": {"query": "q", "count": "3"}}),
+        ]
+        for text in bad_steps:
+            with self.assertRaises(FormatViolationError):
+                self.parser.parse_structured(text, self.schemas)
+
+    def test_optional_arguments_are_nullable(self):
+        schema = self.schemas["memory_query"]
+        self.assertIsNone(validate_json_schema({"query": "q", "count": None}, schema))
+        self.assertIsNotNone(validate_json_schema({"query": "q", "count": True}, schema))
+        self.assertEqual(payload_text({"query": "deploy logs", "count": None}), "deploy logs")
+        self.assertEqual(payload_text({"query": "q", "count": 5}), '{"count": 5, "query": "q"}')
+
+
 class TestOpenJudgeTools(unittest.TestCase):
     def test_execute_bash(self):
         result = execute_bash('echo OpenJudge Test')
@@ -54,5 +214,1032 @@ class TestOpenJudgeTools(unittest.TestCase):
         result = execute_python(code)
         self.assertEqual(result, "Python Tool Working")
 
+    def test_browser_script_requires_steps(self):
+        self.assertTrue(browser_script({"steps": []}).startswith("[ERROR] Browser script contains no steps"))
+
+    def test_browser_script_stops_at_first_failing_step(self):
+        class FakeLocator:
+            def __init__(self, page, selector):
+                self.page, self.selector, self.first = page, selector, self
+
+            def fill(self, value, timeout=None):
+                self.page.actions.append(("fill", self.selector, value))
+
+            def click(self, timeout=None):
+                self.page.actions.append(("click", self.selector))
+
+            def evaluate(self, script, timeout=None):
+                return self.page.text
+
+        class FakePage:
+            def __init__(self):
+                self.url, self.text, self.actions = "about:blank", "", []
+
+            def goto(self, url, wait_until=None, timeout=None):
+                self.url, self.text = url, "Welcome back, please sign in"
+                self.actions.append(("goto", url))
+                return type("Response", (), {"status": 200})()
+
+            def locator(self, selector):
+                return FakeLocator(self, selector)
+
+            def evaluate(self, script):
+                return self.text
+
+            def title(self):
+                return "Sign in"
+
+        page = FakePage()
+
+        class FakePlaywright:
+            def __enter__(self):
+                browser = type("Browser", (), {"new_page": lambda _: page, "close": lambda _: None})()
+                return type("Playwright", (), {"chromium": type("Chromium", (), {"launch": lambda _, headless: browser})()})()
+
+            def __exit__(self, *exc):
+                return False
+
+        sync_api = type(sys)("playwright.sync_api")
+        sync_api.sync_playwright = FakePlaywright
+        saved = {name: sys.modules.get(name) for name in ("playwright", "playwright.sync_api")}
+        sys.modules.update({"playwright": type(sys)("playwright"), "playwright.sync_api": sync_api})
+        try:
+            output = browser_script({"url": "https://app.test/login", "steps": [
+                {"action": "fill", "selector": "#user", "value": "ada"},
+                {"action": "assert_text", "text": "Dashboard"},
+                {"action": "click", "selector": "#never"},
+            ]})
+        finally:
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+
+        header, summary = output.split("\n", 1)
+        self.assertEqual(header, "[ERROR] Browser script stopped at step 3 (assert_text): Expected text 'Dashboard' not found.")
+        summary = json.loads(summary)
+        self.assertEqual((summary["completed"], summary["total"]), (2, 4))
+        self.assertEqual([step["ok"] for step in summary["steps"]], [True, True, False])
+        self.assertEqual(summary["steps"][0]["status"], 200)
+        self.assertEqual(summary["final_url"], "https://app.test/login")
+        self.assertEqual(page.actions, [("goto", "https://app.test/login"), ("fill", "#user", "ada")])
+
+
+class TestTriageClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = TriageClassifier(cache_path="")
+
+    def test_clear_cases_are_routed_locally(self):
+        self.assertEqual(self.classifier.classify("Hello, who are you?"), "CHAT")
+        self.assertEqual(self.classifier.classify("Run the tests in ./src and fix them"), "ENGINE")
+
+    def test_uncertain_case_escalates(self):
+        self.assertIsNone(self.classifier.classify("Calculate the smallest number with remainders 1, 2, 3"))
+
+    def test_decisions_cached_by_normalized_objective(self):
+        self.classifier.remember("What is the current price of Bitcoin?", "ENGINE")
+        self.assertEqual(self.classifier.classify("  what is the CURRENT price of bitcoin "), "ENGINE")
+
+    def test_persisted_cache_is_bounded_lru(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "triage_cache.json")
+            classifier = TriageClassifier(cache_path=path, max_entries=2)
+            classifier.remember("first objective", "ENGINE")
+            classifier.remember("second objective", "CHAT")
+            self.assertEqual(classifier.classify("first objective"), "ENGINE")
+            classifier.remember("third objective", "ENGINE")
+            reloaded = TriageClassifier(cache_path=path, max_entries=2)
+            self.assertEqual(list(reloaded.cache), ["first objective", "third objective"])
+            self.assertEqual(os.listdir(tmp), ["triage_cache.json"])
+
+
+class TestContextPacking(unittest.TestCase):
+    def test_prompt_stays_within_token_budget(self):
+        state_manager = StateManager(token_budget=800)
+        for i in range(8):
+            state_manager.increment_iteration()
+            state_manager.add_failure(f"Attempt {i} failed")
+            state_manager.add_tool_output("bash", "\n".join(f"row {j} of run {i}" for j in range(500)))
+
+        prompt = state_manager.format_for_prompt()
+        self.assertLessEqual(count_tokens(prompt), 800)
+        # Failures are packed first, newest output is always present
+        self.assertIn("Attempt 7 failed", prompt)
+        self.assertIn("Attempt 0 failed", prompt)
+        self.assertIn("[bash Output | Iter 8]", prompt)
+
+    def test_digest_extracts_error_lines(self):
+        output = "\n".join(["compiling module"] * 400 + ["Traceback (most recent call last):", "ValueError: bad input"])
+        digest = digest_output(output, 60)
+        self.assertIn("ERROR-LINE EXTRACT", digest)
+        self.assertIn("ValueError: bad input", digest)
+        self.assertNotIn("compiling module", digest)
+
+
+class TestToolResultCache(unittest.TestCase):
+    def test_file_reads_invalidated_by_content_change(self):
+        cache = ToolResultCache()
+        meta = {"idempotent": True, "cache_key": file_state_key}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "notes.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("v1")
+            key = cache.key_for("read_file", meta, path)
+            cache.put(key, "v1")
+            self.assertEqual(cache.get(cache.key_for("read_file", meta, path)), "v1")
+
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("version 2")
+            self.assertIsNone(cache.get(cache.key_for("read_file", meta, path)))
+
+    def test_errors_and_non_idempotent_tools_are_not_cached(self):
+        cache = ToolResultCache()
+        self.assertIsNone(cache.key_for("bash", {"idempotent": False}, "ls"))
+        key = cache.key_for("web_search", {"idempotent": True}, "python release")
+        cache.put(key, "[ERROR] Web search failed")
+        self.assertIsNone(cache.get(key))
+
+
+class TestLoopDetector(unittest.TestCase):
+    def test_repetition_warns_then_halts(self):
+        detector = LoopDetector(repeat_threshold=3, halt_after=2)
+        results = []
+        for _ in range(4):
+            detector.observe_step("bash", "ls missing_dir", "[ERROR] No such file")
+            results.append(detector.observe_iteration("FAIL", "PROCEED"))
+        self.assertEqual(results[:2], [None, None])
+        self.assertIsNotNone(results[2])
+        self.assertTrue(detector.should_halt)
+
+    def test_oscillation_detected(self):
+        detector = LoopDetector()
+        found = None
+        for payload in ["git checkout a", "git checkout b", "git checkout a", "git checkout b"]:
+            detector.observe_step("bash", payload, "ok")
+            found = detector.observe_iteration("FAIL", "PIVOT")
+        self.assertIn("cycle of length 2", found)
+
+    def test_progress_is_not_a_loop(self):
+        detector = LoopDetector()
+        for i in range(6):
+            detector.observe_step("bash", "pytest", f"{i} failed")
+            self.assertIsNone(detector.observe_iteration("FAIL", "PROCEED"))
+
+
+class TestCheckpointLog(unittest.TestCase):
+    def test_replay_rebuilds_ledger_and_ignores_torn_writes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = CheckpointLog(tmp, fsync_every=2)
+            state_manager = StateManager()
+            for i in range(3):
+                state_manager.increment_iteration()
+                state_manager.add_action("Agent Action: PROCEED")
+                state_manager.add_tool_output("bash", f"output {i}")
+                log.checkpoint("s1", "Build the project", state_manager, {"loop_detector": {"detections": 0}})
+            log.close("s1")
+            with open(log.path_for("s1"), "a", encoding="utf-8") as f:
+                f.write('{"session_id": "s1", "iter')
+
+            session = CheckpointLog(tmp).load("s1")
+            restored = session["state_manager"]
+            self.assertEqual(session["objective"], "Build the project")
+            self.assertEqual(restored.iteration_count, 3)
+            self.assertEqual(len(restored.history_of_actions), 3)
+            self.assertEqual(restored.tool_outputs[-1]["output"], "output 2")
+            self.assertIsNone(session["halted"])
+
+    def test_distinct_session_ids_get_distinct_ledgers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = CheckpointLog(tmp)
+            for session_id, goal in (("job/1", "first"), ("job1", "second")):
+                state_manager = StateManager()
+                state_manager.increment_iteration()
+                state_manager.add_tool_output("python", {3})
+                log.checkpoint(session_id, goal, state_manager)
+                log.close(session_id)
+            self.assertNotEqual(log.path_for("job/1"), log.path_for("job1"))
+            self.assertEqual(log.list_sessions(), ["job/1", "job1"])
+            session = CheckpointLog(tmp).load("job/1")
+            self.assertEqual(session["objective"], "first")
+            self.assertEqual(session["state_manager"].tool_outputs[0]["output"], "{3}")
+
+    def test_checkpoints_appended_after_torn_tail_survive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = CheckpointLog(tmp)
+            state_manager = StateManager()
+            state_manager.increment_iteration()
+            state_manager.add_action("Agent Action: PROCEED")
+            log.checkpoint("s1", "Build the project", state_manager)
+            log.close("s1")
+            with open(log.path_for("s1"), "a", encoding="utf-8") as f:
+                f.write('{"session_id": "s1", "iter')
+
+            resumed_log = CheckpointLog(tmp)
+            restored = resumed_log.load("s1")["state_manager"]
+            restored.increment_iteration()
+            restored.add_action("Agent Action: PIVOT")
+            resumed_log.checkpoint("s1", "Build the project", restored)
+            resumed_log.mark_halted("s1", "TERMINATE_ACHIEVED")
+
+            session = CheckpointLog(tmp).load("s1")
+            self.assertEqual(session["state_manager"].iteration_count, 2)
+            self.assertEqual(len(session["state_manager"].history_of_actions), 2)
+            self.assertEqual(session["halted"], "TERMINATE_ACHIEVED")
+
+    def test_unknown_session(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(CheckpointLog(tmp).load("missing"))
+
+
+class TestBlobStore(unittest.TestCase):
+    def test_large_outputs_stored_out_of_line_and_deduplicated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = BlobStore(tmp, inline_threshold=100)
+            state_manager = StateManager(blob_store=store)
+            big_output = "\n".join(f"line {i}" for i in range(1000))
+            state_manager.add_tool_output("read_file", big_output)
+            state_manager.add_tool_output("read_file", big_output)
+            state_manager.add_tool_output("bash", "small")
+
+            first, second, small = state_manager.tool_outputs
+            self.assertNotIn("output", first)
+            self.assertEqual(first["blob"], second["blob"])
+            self.assertEqual(first["size"], len(big_output))
+            self.assertEqual(small["output"], "small")
+            self.assertEqual(store.read(first["blob"], 0, 6), "line 0")
+            self.assertEqual(state_manager.output_text(first), big_output)
+            self.assertIn(first["blob"], state_manager.format_for_prompt())
+
+    def test_rejects_invalid_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                BlobStore(tmp).read("../../etc/passwd")
+
+    def test_engine_prunes_stale_blobs_when_a_session_halts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            agent = OpenJudgeEngine(blob_dir=tmp, blob_max_age_days=1)
+            stale, fresh = agent.blob_store.put("old output"), agent.blob_store.put("new output")
+            two_days_ago = time.time() - 2 * 86400
+            os.utime(agent.blob_store._path(stale), (two_days_ago, two_days_ago))
+
+            agent._halt("s", "goal", StateManager(), LoopDetector(), {"reason": "TERMINATE_ACHIEVED"})
+            self.assertFalse(os.path.exists(agent.blob_store._path(stale)))
+            self.assertEqual(agent.blob_store.read(fresh), "new output")
+
+
+class TestGitOps(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.origin = os.path.join(self.tmp.name, "origin")
+        run_git(["init", "-q", self.origin])
+        with open(os.path.join(self.origin, "README.md"), "w", encoding="utf-8") as f:
+            f.write("hello\n")
+        run_git(["add", "-A"], cwd=self.origin)
+        run_git(["-c", "user.name=OJ", "-c", "user.email=oj@example.com", "commit", "-q", "-m", "init"], cwd=self.origin)
+        self.url = "file://" + self.origin
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_repeat_clone_served_from_mirror(self):
+        cache = GitMirrorCache(os.path.join(self.tmp.name, "mirrors"))
+        for name in ("first", "second"):
+            dest = os.path.join(self.tmp.name, name)
+            self.assertIn("[SUCCESS]", cache.clone(self.url, dest))
+            self.assertEqual(run_git(["remote", "get-url", "origin"], cwd=dest).strip(), self.url)
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+
+    def test_structured_status_cached_until_worktree_changes(self):
+        queries = StructuredGitQueries()
+        self.assertTrue(queries.status(self.origin)["clean"])
+        with open(os.path.join(self.origin, "notes.txt"), "w", encoding="utf-8") as f:
+            f.write("draft")
+        status = queries.status(self.origin)
+        self.assertEqual(status["untracked"], ["notes.txt"])
+        self.assertEqual(queries.log(self.origin)["commits"][0]["subject"], "init")
+
+    def test_cached_log_of_remote_ref_refreshed_after_fetch(self):
+        queries = StructuredGitQueries()
+        head = run_git(["rev-parse", "HEAD"], cwd=self.origin).strip()
+        run_git(["update-ref", "refs/remotes/origin/main", head], cwd=self.origin)
+        self.assertEqual(queries.log(self.origin, "origin/main")["commits"][0]["subject"], "init")
+        tree = run_git(["rev-parse", "HEAD^{tree}"], cwd=self.origin).strip()
+        fetched = run_git(["-c", "user.name=OJ", "-c", "user.email=oj@example.com",
+                           "commit-tree", tree, "-p", head, "-m", "upstream"], cwd=self.origin).strip()
+        run_git(["update-ref", "refs/remotes/origin/main", fetched], cwd=self.origin)
+        self.assertEqual(queries.log(self.origin, "origin/main")["commits"][0]["subject"], "upstream")
+
+    def test_agent_values_are_never_git_options(self):
+        queries = StructuredGitQueries()
+        written = os.path.join(self.tmp.name, "written.patch")
+        with self.assertRaises(GitError):
+            queries.diff(self.origin, f"--output={written}")
+        with self.assertRaises(GitError):
+            queries.log(self.origin, "--output=x")
+        with self.assertRaises(GitError):
+            GitMirrorCache(os.path.join(self.tmp.name, "mirrors")).clone("--upload-pack=touch pwned", os.path.join(self.tmp.name, "c"))
+        self.assertFalse(os.path.exists(written))
+        self.assertEqual(queries.log(self.origin, "HEAD")["commits"][0]["subject"], "init")
+
+
+class TestSandboxExecutor(unittest.TestCase):
+    def test_usage_reported(self):
+        result = execute_python("print(sum(range(10**6)))")
+        self.assertEqual(result, str(sum(range(10**6))))
+        self.assertIn("cpu_seconds", result.usage)
+        self.assertIn("peak_rss_mb", result.usage)
+
+    def test_timeout_kills_whole_process_group(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            executor = SandboxExecutor(timeout=1, slot_dir=tmp)
+            result = executor.run("sleep 30 & sleep 30", shell=True)
+            self.assertTrue(result.timed_out)
+            self.assertLess(result.usage["wall_seconds"], 5)
+
+    def test_output_capped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            executor = SandboxExecutor(max_output_bytes=1000, slot_dir=tmp)
+            result = executor.run(["python", "-c", "print('x' * 100000)"])
+            self.assertEqual(len(result.stdout), 1000)
+            self.assertTrue(result.truncated)
+
+    def test_limits_applied_by_exec_wrapper(self):
+        import resource
+        with tempfile.TemporaryDirectory() as tmp:
+            executor = SandboxExecutor(cpu_seconds=7, slot_dir=tmp)
+            probe = "import resource; print(resource.getrlimit(resource.RLIMIT_CPU), resource.getrlimit(resource.RLIMIT_DATA)[0])"
+            result = executor.run(["python", "-c", probe])
+            self.assertEqual(result.stdout.strip(), f"(7, 8) {4096 * 1024 * 1024}")
+            self.assertEqual(executor.run("echo $0 ok", shell=True).stdout.strip(), "/bin/sh ok")
+
+            unlimited = SandboxExecutor(memory_mb=0, slot_dir=tmp).run(["python", "-c", probe])
+            self.assertTrue(unlimited.stdout.strip().endswith(str(resource.RLIM_INFINITY)))
+            hog = executor.run(["python", "-c", "blob = bytearray(6 * 1024 ** 3); print('allocated')"])
+            self.assertNotIn("allocated", hog.stdout)
+
+
+class StandInLLMServer:
+    """Local OpenAI-compatible stand-in with injectable delay and failures."""
+
+    def __init__(self, reply: str, delay: float = 0.0, failures: int = 0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                time.sleep(server.delay)
+                if server.failures > 0:
+                    server.failures -= 1
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                if request.get("stream"):
+                    chunk = json.dumps({"id": "cmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "stand-in",
+                                        "choices": [{"index": 0, "delta": {"content": server.reply}, "finish_reason": None}]})
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    self.wfile.write(f"data: {chunk}\n\ndata: [DONE]\n\n".encode())
+                    return
+                body = json.dumps({
+                    "id": "cmpl-test", "object": "chat.completion", "created": 0, "model": "stand-in",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": server.reply}}]
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.reply, self.delay, self.failures, self.requests = reply, delay, failures, 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class TestLLMGateway(unittest.TestCase):
+    def test_hedged_request_wins_on_fast_endpoint(self):
+        slow, fast = StandInLLMServer("slow", delay=2.0), StandInLLMServer("fast")
+        try:
+            gateway = LLMGateway([LLMEndpoint("slow", slow.base_url, "test"), LLMEndpoint("fast", fast.base_url, "test")],
+                                 hedge_after=0.2)
+            gateway._rr = len(gateway.endpoints) - 1  # Next call starts on the slow endpoint
+            start = time.perf_counter()
+            self.assertEqual(gateway.complete([{"role": "user", "content": "hi"}], "gpt-4o"), "fast")
+            self.assertLess(time.perf_counter() - start, 1.5)
+            self.assertEqual(gateway.hedges_fired, 1)
+            # The losing request is cancelled, not counted as a failure or a latency sample
+            time.sleep(2.5)
+            self.assertEqual((gateway.endpoints[0].errors, gateway.endpoints[0].samples("gpt-4o")), (0, []))
+        finally:
+            slow.close()
+            fast.close()
+
+    def test_hedge_threshold_is_kept_per_model(self):
+        endpoint = LLMEndpoint("shared", "http://127.0.0.1:9/v1", "test")
+        gateway = LLMGateway([endpoint], hedge_after=15.0, min_hedge_samples=20)
+        endpoint.latencies["gpt-4o-mini"] = deque([0.3] * 50)
+        endpoint.latencies["gpt-4o"] = deque([8.0] * 25)
+        self.assertEqual(gateway._hedge_delay(endpoint, "gpt-4o-mini"), 0.3)
+        self.assertEqual(gateway._hedge_delay(endpoint, "gpt-4o"), 8.0)
+        self.assertEqual(gateway._hedge_delay(endpoint, "o1"), 15.0)
+
+    def test_transient_errors_retried(self):
+        flaky = StandInLLMServer("recovered", failures=2)
+        try:
+            gateway = LLMGateway([LLMEndpoint("flaky", flaky.base_url, "test")], backoff_base=0.01)
+            self.assertEqual(gateway.complete([{"role": "user", "content": "hi"}], "gpt-4o"), "recovered")
+        finally:
+            flaky.close()
+
+
+class TestCancellation(unittest.TestCase):
+    def test_cancel_kills_sandboxed_process_tree(self):
+        async def run():
+            token = CancellationToken()
+            asyncio.get_running_loop().call_later(0.3, token.cancel)
+            with self.assertRaises(SessionCancelled):
+                # A generous grace period: returning early proves the process group was killed
+                await run_cancellable(token, execute_bash, "sleep 30 & sleep 30; wait", grace=20)
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_cancel_aborts_pending_llm_request(self):
+        slow = StandInLLMServer("too late", delay=5.0)
+        try:
+            gateway = LLMGateway([LLMEndpoint("slow", slow.base_url, "test")], hedge_after=30)
+            token = CancellationToken()
+            threading.Timer(0.2, token.cancel).start()
+
+            async def run():
+                return await run_cancellable(token, gateway.complete, [{"role": "user", "content": "hi"}], "gpt-4o")
+
+            start = time.perf_counter()
+            with self.assertRaises(SessionCancelled):
+                asyncio.run(run())
+            self.assertLess(time.perf_counter() - start, 2)
+        finally:
+            slow.close()
+
+    def test_cancelled_iteration_is_not_checkpointed_as_completed(self):
+        first_command = {}
+
+        def fake_call_llm(system, user, model="gpt-4o"):
+            if "Current Iteration: 1" in system:
+                return ("<state_memory>s</state_memory><logical_extern>l</logical_extern><verdict>FAIL</verdict>"
+                        f"<tool_required>bash</tool_required><tool_payload>{first_command['bash']}</tool_payload>"
+                        "[ENFORCE: PROCEED]")
+            # Later iterations: the LLM call itself is still in flight when the session is cancelled
+            while True:
+                raise_if_cancelled()
+                time.sleep(0.01)
+
+        async def run(agent, session_id, command, cancel_on):
+            first_command["bash"] = command
+            token = CancellationToken()
+            async for telemetry_json in agent.stream_execute("goal", session_id=session_id, cancel_token=token):
+                event = json.loads(telemetry_json)
+                if (event["event"], event.get("iteration")) == cancel_on:
+                    token.cancel()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            agent = OpenJudgeEngine(checkpoint_dir=tmp, blob_dir=tmp, router=ModelRouter({"main": ["m"]}, {"m": (1.0, 1.0)}))
+            original, engine_module.call_llm = engine_module.call_llm, fake_call_llm
+            try:
+                asyncio.run(run(agent, "killed-tool", "sleep 30", ("TOOL_TRIGGERED", None)))
+                asyncio.run(run(agent, "killed-llm", "echo done", ("LLM_INFERENCE_START", 2)))
+            finally:
+                engine_module.call_llm = original
+
+            killed_tool = agent.checkpoints.load("killed-tool")
+            self.assertEqual(killed_tool["halted"], "CANCELLED")
+            self.assertEqual(killed_tool["state_manager"].iteration_count, 1)
+            self.assertTrue(killed_tool["state_manager"].tool_outputs[-1]["output"].startswith("[CANCELLED]"))
+
+            killed_llm = agent.checkpoints.load("killed-llm")
+            # Iteration 2 never produced a reply, so only iteration 1 counts as completed
+            self.assertEqual(killed_llm["state_manager"].iteration_count, 1)
+            self.assertEqual(killed_llm["state_manager"].tool_outputs[-1]["output"].strip(), "done")
+
+    def test_child_tokens_follow_parent_only(self):
+        parent = CancellationToken()
+        first, second = CancellationToken(parent), CancellationToken(parent)
+        first.cancel("SUPERSEDED")
+        self.assertFalse(parent.cancelled)
+        parent.cancel("ABANDONED")
+        self.assertEqual((second.cancelled, second.reason), (True, "ABANDONED"))
+        self.assertEqual(first.reason, "SUPERSEDED")
+
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter({"main": ["small", "large"]}, {"small": (1.0, 1.0), "large": (10.0, 10.0)},
+                                  min_samples=5, cost_weight=0.0, explore_every=1000)
+
+    def test_escalates_after_failure_and_resets_after_success(self):
+        self.assertEqual(self.router.select("main"), "small")
+        tier = self.router.judge("main", "small", 0, ok=False)
+        self.assertEqual(self.router.select("main", tier), "large")
+        self.assertEqual(self.router.judge("main", "large", tier, ok=False), 1)
+        self.assertEqual(self.router.judge("main", "large", tier, ok=True), 0)
+        self.assertEqual(self.router.stats()["escalations"], 1)
+
+    def test_unreliable_cheap_route_is_skipped(self):
+        for _ in range(5):
+            self.router.record_outcome("main", "small", False)
+        self.assertEqual(self.router.select("main"), "large")
+
+    def test_latency_stats_feed_the_choice(self):
+        # 20% failures on a slow small model: small + 0.2 * large > large alone
+        for i in range(5):
+            self.router.record_call("main", "small", 4.0, "prompt", "reply")
+            self.router.record_call("main", "large", 2.0, "prompt", "reply")
+            self.router.record_outcome("main", "small", i > 0)
+        self.assertEqual(self.router.select("main"), "large")
+        fast = ModelRouter({"main": ["small", "large"]}, min_samples=5, cost_weight=0.0)
+        for i in range(5):
+            fast.record_call("main", "small", 0.5, "prompt", "reply")
+            fast.record_call("main", "large", 2.0, "prompt", "reply")
+            fast.record_outcome("main", "small", i > 0)
+        self.assertEqual(fast.select("main"), "small")
+
+    def test_session_route_confirms_cheap_terminate_and_escalates_loops(self):
+        route = SessionRoute(self.router)
+        self.assertEqual(route.select(), "small")
+        self.assertEqual(route.confirm_terminate_by("small"), "large")
+        self.assertEqual(route.select(), "large")
+        self.assertIsNone(route.confirm_terminate_by("large"))
+
+        route = SessionRoute(self.router)
+        route.on_loop()
+        self.assertEqual(route.select(), "large")
+        self.assertIsNone(SessionRoute(self.router, confirm_terminate=False).confirm_terminate_by("small"))
+
+    def test_work_in_progress_verdicts_do_not_count_against_a_route(self):
+        for _ in range(6):
+            route = SessionRoute(self.router)
+            for enforcement in ("PROCEED", "PROCEED", "PROCEED", "TERMINATE"):
+                model = route.select()
+                self.assertEqual(model, "small")
+                route.on_step(model, enforcement)
+            # The strongest model overturns the cheap TERMINATE
+            self.assertEqual(route.confirm_terminate_by(model), "large")
+            route.on_step(route.select(), "PROCEED")
+            self.assertEqual(route.select(), "small")
+        small = self.router.stats()["routes"]["main"]["small"]
+        self.assertAlmostEqual(small["failure_rate"], 6 / 24, places=3)
+        self.assertEqual(self.router.select("main"), "small")
+
+    def test_invalid_env_settings_fall_back_to_defaults(self):
+        saved = {key: os.environ.get(key) for key in ("OPENJUDGE_MODEL_ROUTES", "OPENJUDGE_MODEL_PRICES")}
+        os.environ["OPENJUDGE_MODEL_ROUTES"] = '{"main": ["a", "b"'
+        os.environ["OPENJUDGE_MODEL_PRICES"] = '{"b": [1, 2]}'
+        try:
+            router = ModelRouter.from_env()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self.assertEqual(router.ladder("main"), ["gpt-4o-mini", "gpt-4o"])
+        self.assertEqual(router.prices["b"], (1, 2))
+
+
+class TestBatchMode(unittest.TestCase):
+    def test_resume_skips_completed_objectives(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "objectives.jsonl")
+            output_path = os.path.join(tmp, "results.jsonl")
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"id": "qa-1", "objective": "Check the homepage"}) + "\n")
+                f.write(json.dumps("Run the test suite") + "\n")
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"id": "qa-1", "halt_reason": "TERMINATE_ACHIEVED"}) + "\n")
+                f.write('{"id": "2", "halt_re')  # Torn line from an interrupted run
+
+            objectives = load_objectives(input_path)
+            self.assertEqual([o["id"] for o in objectives], ["qa-1", "2"])
+            self.assertEqual(load_completed_ids(output_path), {"qa-1"})
+
+            discard_torn_tail(output_path)
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"id": "2", "halt_reason": "TERMINATE_ACHIEVED"}) + "\n")
+            self.assertEqual(load_completed_ids(output_path), {"qa-1", "2"})
+
+
+class TestSessionEventBuffer(unittest.TestCase):
+    def collect(self, buffer, last_event_id):
+        async def run():
+            return [(i, json.loads(d)) async for i, d in buffer.subscribe(last_event_id)]
+        return asyncio.run(run())
+
+    def fill(self, capacity, count):
+        async def run():
+            buffer = SessionEventBuffer(capacity)
+            for n in range(count):
+                await buffer.append(json.dumps({"event": "TICK", "n": n}))
+            await buffer.close()
+            return buffer
+        return asyncio.run(run())
+
+    def test_replay_after_last_event_id(self):
+        buffer = self.fill(capacity=10, count=5)
+        events = self.collect(buffer, 3)
+        self.assertEqual([i for i, _ in events], [4, 5])
+        self.assertEqual(events[0][1]["n"], 3)
+
+    def test_gap_reported_when_window_overrun(self):
+        buffer = self.fill(capacity=3, count=6)
+        events = self.collect(buffer, 1)
+        self.assertEqual(events[0][1], {"event": "STREAM_GAP", "missed_from": 2, "missed_to": 3})
+        self.assertEqual([i for i, _ in events[1:]], [4, 5, 6])
+
+    def test_resume_with_stale_last_event_id_skips_nothing(self):
+        def source(events):
+            async def generate(session_id, token):
+                for name in events:
+                    yield json.dumps({"event": name})
+            return generate
+
+        async def run():
+            registry = SessionRegistry()
+            registry.start("s1", source(["AGENT_START", "ITERATION_START", "ENGINE_HALT"]))
+            await registry.tasks["s1"]
+            # Resumed in the same process: the retained buffer continues
+            registry.start("s1", source(["AGENT_RESUMED", "ENGINE_HALT"]))
+            await registry.tasks["s1"]
+            same_worker = [(i, json.loads(d)["event"]) async for i, d in registry.get("s1").subscribe(3)]
+            # Resumed on a fresh worker: numbering continues after the client's Last-Event-ID
+            restarted = SessionRegistry()
+            restarted.start("s1", source(["AGENT_RESUMED", "ENGINE_HALT"]), first_event_id=4)
+            await restarted.tasks["s1"]
+            fresh_worker = [(i, json.loads(d)["event"]) async for i, d in restarted.get("s1").subscribe(3)]
+            return same_worker, fresh_worker
+
+        same_worker, fresh_worker = asyncio.run(run())
+        self.assertEqual(same_worker, [(4, "AGENT_RESUMED"), (5, "ENGINE_HALT")])
+        self.assertEqual(fresh_worker, [(4, "AGENT_RESUMED"), (5, "ENGINE_HALT")])
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_claims_are_exclusive_and_ordered(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"))
+            first = queue.enqueue("Audit the login flow")
+            second = queue.enqueue("Run the test suite")
+            self.assertEqual(queue.claim("w1")["id"], first)
+            self.assertEqual(queue.claim("w2")["id"], second)
+            self.assertIsNone(queue.claim("w3"))
+
+    def test_expired_lease_is_reclaimed_with_events_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"), lease_seconds=0.05)
+            job_id = queue.enqueue("Check the homepage")
+            queue.claim("crashed-worker")
+            self.assertEqual(queue.append_event(job_id, "crashed-worker", '{"event": "AGENT_START"}'), 1)
+            time.sleep(0.1)
+
+            job = queue.claim("w2")
+            self.assertEqual((job["id"], job["attempts"]), (job_id, 2))
+            queue.append_event(job_id, "w2", '{"event": "AGENT_RESUMED"}')
+            queue.finish(job_id, "w2", "succeeded", {"halt_reason": "TERMINATE_ACHIEVED"})
+
+            self.assertEqual([seq for seq, _ in queue.events_after(job_id, 0)], [1, 2])
+            stored = queue.get(job_id)
+            self.assertEqual(stored["status"], "succeeded")
+            self.assertEqual(stored["result"]["halt_reason"], "TERMINATE_ACHIEVED")
+
+    def test_cancel_queued_and_running_jobs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"))
+            running = queue.enqueue("Crawl the docs")
+            queued = queue.enqueue("Run the test suite")
+            queue.claim("w1")
+            self.assertEqual(queue.cancel(queued), "cancelled")
+            self.assertEqual(queue.cancel(running), "cancelling")
+            self.assertIsNone(queue.claim("w2"))
+            queue.finish(running, "w1", "cancelled", {"halt_reason": "CANCELLED"})
+            self.assertEqual(queue.status(running), "cancelled")
+            self.assertIsNone(queue.cancel("missing"))
+
+    def test_stalled_worker_loses_its_lease(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"), lease_seconds=0.05)
+            job_id = queue.enqueue("Check the homepage")
+            queue.claim("stalled-worker")
+            time.sleep(0.1)
+            queue.claim("w2")
+            with self.assertRaises(LeaseLost):
+                queue.append_event(job_id, "stalled-worker", '{"event": "TOOL_RESULT"}')
+            with self.assertRaises(LeaseLost):
+                queue.heartbeat(job_id, "stalled-worker")
+            self.assertEqual(queue.events_after(job_id, 0), [])
+
+    def test_worker_pool_abandons_a_reclaimed_run(self):
+        class StallingEngine:
+            checkpoints = None
+            token = None
+
+            async def stream_execute(self, objective, session_id=None, cancel_token=None):
+                StallingEngine.token = cancel_token
+                yield json.dumps({"event": "AGENT_START"})
+                # Another worker reclaims the job while this one is stalled
+                with queue._db() as conn:
+                    conn.execute("UPDATE jobs SET worker = 'w2' WHERE id = ?", (job_id,))
+                await asyncio.sleep(0.1)
+                yield json.dumps({"event": "TOOL_RESULT"})
+                yield json.dumps({"event": "ENGINE_HALT", "reason": "TERMINATE_ACHIEVED"})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"), lease_seconds=0.05)
+            job_id = queue.enqueue("Check the homepage")
+            job = queue.claim("w1")
+            asyncio.run(JobWorkerPool(queue, StallingEngine()).run_job(job, "w1"))
+            self.assertEqual(StallingEngine.token.reason, "LEASE_LOST")
+            self.assertEqual(len(queue.events_after(job_id, 0)), 1)
+            self.assertEqual((queue.get(job_id)["status"], queue.get(job_id)["worker"]), ("running", "w2"))
+
+    def test_only_a_verified_terminate_succeeds(self):
+        class ScriptedEngine:
+            checkpoints = None
+
+            def __init__(self, verdict, reason):
+                self.verdict, self.reason = verdict, reason
+
+            async def stream_execute(self, objective, session_id=None, cancel_token=None):
+                yield json.dumps({"event": "THOUGHT_PROCESS", "verdict": self.verdict})
+                yield json.dumps({"event": "ENGINE_HALT", "reason": self.reason})
+
+        outcomes = [("PASS", "TERMINATE_ACHIEVED", "succeeded"), ("FAIL", "TERMINATE_ACHIEVED", "failed"),
+                    ("FAIL", "MAX_ITERATIONS", "failed"), ("PASS", "LOOP_DETECTED", "failed")]
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.db"))
+            for verdict, reason, expected in outcomes:
+                job_id = queue.enqueue(f"{reason} with {verdict}")
+                asyncio.run(JobWorkerPool(queue, ScriptedEngine(verdict, reason)).run_job(queue.claim("w1"), "w1"))
+                self.assertEqual(queue.get(job_id)["status"], expected, reason)
+
+
+class InMemoryVectors:
+    """Stand-in for VectorMemory's batch API."""
+    def __init__(self):
+        self.vectors = {}
+
+    def store_many(self, ids, documents, metadatas, embeddings=None):
+        self.vectors.update({i: (d, m) for i, d, m in zip(ids, documents, metadatas)})
+        return True
+
+    def delete(self, ids=None, where=None):
+        for i in ids:
+            self.vectors.pop(i, None)
+        return True
+
+
+class TestCodebaseIndexer(unittest.TestCase):
+    def test_python_chunks_follow_definitions(self):
+        source = "import os\n\n# Helper\ndef a():\n    return 1\n\n\nclass B:\n    def c(self):\n        pass\n"
+        chunks = chunk_python(source)
+        self.assertEqual([c["symbol"] for c in chunks], [None, "a", "B"])
+        self.assertTrue(chunks[1]["text"].startswith("# Helper"))
+
+    def test_reindex_touches_only_changed_and_removed_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = os.path.join(tmp, "repo")
+            os.makedirs(repo)
+            for name in ("a.py", "b.py", "notes.md"):
+                with open(os.path.join(repo, name), "w", encoding="utf-8") as f:
+                    f.write(f"def {name[0]}():\n    return '{name}'\n")
+            embedded = []
+            vectors = InMemoryVectors()
+            indexer = CodebaseIndexer(os.path.join(tmp, "manifest.json"), vectors,
+                                      embed=lambda texts: embedded.extend(texts) or [[0.0] for _ in texts])
+
+            self.assertEqual(indexer.index(repo)["files_reindexed"], 3)
+            self.assertEqual(indexer.index(repo)["chunks_embedded"], 0)
+
+            with open(os.path.join(repo, "a.py"), "a", encoding="utf-8") as f:
+                f.write("\ndef extra():\n    pass\n")
+            os.remove(os.path.join(repo, "b.py"))
+            embedded.clear()
+            report = indexer.index(repo)
+            self.assertEqual((report["files_reindexed"], report["files_removed"]), (1, 1))
+            self.assertTrue(all(text.startswith("a.py:") for text in embedded))
+            self.assertFalse(any(meta["path"] == "b.py" for _, meta in vectors.vectors.values()))
+
+    def test_unreadable_files_and_failed_deletes_are_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = os.path.join(tmp, "repo")
+            os.makedirs(repo)
+            for name in ("a.py", "b.py"):
+                with open(os.path.join(repo, name), "w", encoding="utf-8") as f:
+                    f.write(f"def {name[0]}():\n    return '{name}'\n")
+            vectors = InMemoryVectors()
+            indexer = CodebaseIndexer(os.path.join(tmp, "manifest.json"), vectors, embed=lambda texts: [[0.0] for _ in texts])
+            indexer.index(repo)
+
+            with open(os.path.join(repo, "a.py"), "a", encoding="utf-8") as f:
+                f.write("\ndef locked():\n    pass\n")
+            real_open = open
+
+            def guarded_open(path, *args, **kwargs):
+                if str(path).endswith("a.py"):
+                    raise PermissionError(13, "Permission denied", path)
+                return real_open(path, *args, **kwargs)
+
+            indexer_module.open = guarded_open
+            try:
+                report = indexer.index(repo)
+            finally:
+                del indexer_module.open
+            self.assertEqual(report["files_unreadable"], {"a.py": "PermissionError: Permission denied"})
+            # The unreadable file keeps its vectors until it can be read again
+            self.assertTrue(any(meta["path"] == "a.py" for _, meta in vectors.vectors.values()))
+            self.assertEqual(indexer.index(repo)["files_reindexed"], 1)
+
+            os.remove(os.path.join(repo, "b.py"))
+            vectors.delete = lambda ids=None, where=None: "collection is read-only"
+            with self.assertRaisesRegex(RuntimeError, "read-only"):
+                indexer.index(repo)
+            del vectors.delete
+            self.assertEqual(indexer.index(repo)["files_removed"], 1)
+
+
+class TestMemoryRetention(unittest.TestCase):
+    def test_expired_then_least_recently_retrieved_evicted(self):
+        now = 100 * DAY_SECONDS
+        records = [
+            ("ancient", {"created_at": now - 40 * DAY_SECONDS, "last_retrieved": now}),
+            ("hot", {"created_at": now - 5 * DAY_SECONDS, "last_retrieved": now - 60}),
+            ("cold", {"created_at": now - 2 * DAY_SECONDS, "last_retrieved": now - 2 * DAY_SECONDS}),
+            ("fresh", {"created_at": now - 3600, "last_retrieved": now - 3600}),
+        ]
+        expired, lru = RetentionPolicy(max_age_days=30, max_count=2).select_evictions(records, now)
+        self.assertEqual(expired, ["ancient"])
+        self.assertEqual(lru, ["cold"])
+
+    def test_unbounded_policy_keeps_everything(self):
+        records = [(str(i), {"created_at": 0}) for i in range(50)]
+        self.assertEqual(RetentionPolicy().select_evictions(records, time.time()), ([], []))
+
+    def test_invalid_config_falls_back_and_unconfigured_types_get_the_default(self):
+        saved = os.environ.get("OPENJUDGE_MEMORY_RETENTION")
+        try:
+            os.environ["OPENJUDGE_MEMORY_RETENTION"] = '{"general": {"max_count": 5}'
+            policies = load_retention_policies()
+            self.assertEqual(policies["general"].max_count, 10000)
+
+            os.environ["OPENJUDGE_MEMORY_RETENTION"] = '{"*": {"max_age_days": 7}, "decision": {}}'
+            policies = load_retention_policies()
+        finally:
+            if saved is None:
+                os.environ.pop("OPENJUDGE_MEMORY_RETENTION", None)
+            else:
+                os.environ["OPENJUDGE_MEMORY_RETENTION"] = saved
+        self.assertEqual(policy_for(policies, "project_notes").max_age_days, 7)
+        self.assertIsNone(policy_for(policies, "decision").max_age_days)
+        self.assertIsNone(policy_for(policies, "code").max_count)
+
+
+class TestSpeculation(unittest.TestCase):
+    def test_fork_and_adopt_keep_ledgers_apart(self):
+        main_line = StateManager()
+        main_line.add_action("Agent Action: PROCEED")
+        branch = main_line.fork()
+        branch.add_failure("SYSTEM OVERRIDE: SPECULATIVE BRANCH 1/2")
+        branch.add_tool_output("execute_bash", "[SUCCESS] ok")
+        self.assertEqual(len(main_line.known_failures), 0)
+        main_line.adopt(branch)
+        self.assertEqual(len(main_line.known_failures), 1)
+        self.assertEqual(main_line.history_of_actions, branch.history_of_actions)
+
+    def test_worktree_branch_syncs_back_only_its_changes(self):
+        with tempfile.TemporaryDirectory() as origin:
+            run_git(["init", "-q"], cwd=origin)
+            with open(os.path.join(origin, "app.py"), "w") as f:
+                f.write("print('v1')\n")
+            with open(os.path.join(origin, "stale.txt"), "w") as f:
+                f.write("remove me\n")
+            run_git(["add", "-A"], cwd=origin)
+            run_git(["-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "base"], cwd=origin)
+            with open(os.path.join(origin, "notes.md"), "w") as f:
+                f.write("uncommitted\n")
+
+            workspace = ScratchWorkspace(origin, label="test")
+            try:
+                workdir = workspace.create()
+                self.assertTrue(workspace.is_worktree)
+                self.assertTrue(os.path.isfile(os.path.join(workdir, "notes.md")))
+                with open(os.path.join(workdir, "app.py"), "w") as f:
+                    f.write("print('v2, longer')\n")
+                os.remove(os.path.join(workdir, "stale.txt"))
+                with open(os.path.join(origin, "app.py")) as f:
+                    self.assertEqual(f.read(), "print('v1')\n")
+
+                synced = workspace.sync_back()
+            finally:
+                workspace.cleanup()
+            self.assertEqual(synced, {"written": ["app.py"], "deleted": ["stale.txt"]})
+            with open(os.path.join(origin, "app.py")) as f:
+                self.assertEqual(f.read(), "print('v2, longer')\n")
+            self.assertFalse(os.path.exists(os.path.join(origin, "stale.txt")))
+            self.assertEqual(len(run_git(["worktree", "list"], cwd=origin).strip().splitlines()), 1)
+
+    def test_engine_race_adopts_winner_and_cancels_loser(self):
+        def step(verdict, enforcement, tool="none", payload="none"):
+            return (f"<state_memory>s</state_memory><logical_extern>l</logical_extern><verdict>{verdict}</verdict>"
+                    f"<tool_required>{tool}</tool_required><tool_payload>{payload}</tool_payload>[ENFORCE: {enforcement}]")
+
+        winner_steps = iter([step("FAIL", "PROCEED", "write_file", "result.txt|from branch 2"),
+                             step("PASS", "TERMINATE")])
+        loser_thinking, loser_cancelled = threading.Event(), threading.Event()
+
+        def fake_call_llm(system, user, model="gpt-4o"):
+            if "SPECULATIVE BRANCH 2/2" in system:
+                loser_thinking.wait(timeout=10)
+                return next(winner_steps)
+            # The losing branch thinks forever until its token is cancelled
+            loser_thinking.set()
+            try:
+                while True:
+                    raise_if_cancelled()
+                    time.sleep(0.01)
+            except SessionCancelled:
+                loser_cancelled.set()
+                raise
+
+        async def run(agent):
+            return [json.loads(e) async for e in agent.stream_execute("race")]
+
+        with tempfile.TemporaryDirectory() as origin, tempfile.TemporaryDirectory() as scratch, \
+                tempfile.TemporaryDirectory() as blobs:
+            agent = OpenJudgeEngine(max_iterations=5, blob_dir=blobs, speculative_branches=2, speculate_at_start=True,
+                                    scratch_root=scratch, router=ModelRouter({"main": ["m"]}, {"m": (1.0, 1.0)}))
+            original, engine_module.call_llm = engine_module.call_llm, fake_call_llm
+            workdir = tool_workdir.set(origin)
+            try:
+                events = asyncio.run(run(agent))
+            finally:
+                tool_workdir.reset(workdir)
+                engine_module.call_llm = original
+
+            resolved = next(e for e in events if e["event"] == "SPECULATION_RESOLVED")
+            self.assertEqual(resolved["winner"], 1)
+            self.assertEqual(resolved["synced_files"]["written"], ["result.txt"])
+            self.assertEqual(events[-1]["event"], "ENGINE_HALT")
+            self.assertEqual(events[-1]["reason"], "TERMINATE_ACHIEVED")
+            self.assertTrue(loser_cancelled.is_set())
+            with open(os.path.join(origin, "result.txt")) as f:
+                self.assertEqual(f.read(), "from branch 2")
+            self.assertEqual(os.listdir(scratch), [])
+
+
+
+class TestDaemon(unittest.TestCase):
+    def test_socket_round_trip_runs_sessions_in_the_client_cwd(self):
+        class WorkdirEngine:
+            async def stream_execute(self, objective, cancel_token=None):
+                yield json.dumps({"event": "TOOL_RESULT", "workdir": resolve_path("out.txt")})
+                yield json.dumps({"event": "ENGINE_HALT", "reason": "TERMINATE_ACHIEVED", "objective": objective})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, "oj.sock")
+            daemon = OpenJudgeDaemon(socket_path)
+            daemon.engine = WorkdirEngine()
+            daemon.triage_route = lambda objective: "ENGINE"
+            server = threading.Thread(target=asyncio.run, args=(daemon.serve_forever(),))
+            server.start()
+            try:
+                deadline = time.time() + 10
+                while not os.path.exists(socket_path) and time.time() < deadline:
+                    time.sleep(0.02)
+                self.assertEqual(request_daemon({"command": "ping"}, socket_path, timeout=5)[0]["event"], "PONG")
+
+                events = request_daemon({"objective": "build it", "cwd": tmp}, socket_path, timeout=5)
+                self.assertEqual(events[0]["workdir"], os.path.join(tmp, "out.txt"))
+                self.assertEqual(events[-1]["objective"], "build it")
+                self.assertNotEqual(os.getcwd(), tmp)
+                self.assertEqual(request_daemon({"command": "ping"}, socket_path, timeout=5)[0]["sessions_served"], 1)
+
+                self.assertEqual(request_daemon({"command": "shutdown"}, socket_path, timeout=5)[0]["event"], "DAEMON_SHUTDOWN")
+                server.join(timeout=10)
+                self.assertFalse(server.is_alive())
+                self.assertFalse(os.path.exists(socket_path))
+            finally:
+                daemon.stop()
+                server.join(timeout=10)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+import os
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from blob_store import BlobStore
+from tool_context import resolve_path
+
+
+class ToolResultCache:
+    """
+    Session-scoped memoization of idempotent tool calls.
+    Results are keyed by (tool, cache key), where the cache key may embed validity
+    signals (e.g. file mtime/size) so stale results are never served.
+    """
+
+    def __init__(self, blob_store: Optional[BlobStore] = None):
+        # Large results are held as blob references rather than in memory
+        self.blob_store = blob_store
+        self._entries: Dict[Tuple[str, Hashable], Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, tool_name: str, metadata: Dict[str, Any], payload: str) -> Optional[Tuple[str, Hashable]]:
+        """Returns the cache key for this call, or None if the call must not be memoized."""
+        if not metadata.get("idempotent"):
+            return None
+        key_func: Optional[Callable[[str], Hashable]] = metadata.get("cache_key")
+        try:
+            key = key_func(payload) if key_func else payload
+        except Exception:
+            return None
+        if key is None:
+            return None
+        return (tool_name, key)
+
+    def get(self, key: Tuple[str, Hashable]) -> Optional[str]:
+        if key in self._entries:
+            entry = self._entries[key]
+            if isinstance(entry, tuple):
+                try:
+                    entry = self.blob_store.read(entry[1])
+                except OSError:
+                    # The blob was pruned underneath us: treat as a miss
+                    del self._entries[key]
+                    self.misses += 1
+                    return None
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple[str, Hashable], output: str) -> None:
+        # Failures are never memoized: a retry may legitimately succeed
+        if str(output).lstrip().startswith(("[ERROR", "[FATAL")):
+            return
+        text = str(output)
+        if self.blob_store and len(text) > self.blob_store.inline_threshold:
+            self._entries[key] = ("blob", self.blob_store.put(text))
+        else:
+            self._entries[key] = output
+
+    def invalidate(self, tool_name: str) -> None:
+        """Drops every cached result of the given tool (e.g. memory_query after memory_store)."""
+        for key in [k for k in self._entries if k[0] == tool_name]:
+            del self._entries[key]
+
+
+def file_state_key(payload: str) -> Optional[Hashable]:
+    """Cache key for file reads: absolute path plus mtime and size, so any change is a miss."""
+    path = os.path.abspath(resolve_path(payload.strip()))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def normalized_text_key(payload: str) -> Hashable:
+    """Cache key for text queries: whitespace- and case-insensitive."""
+    return " ".join(payload.split()).lower()
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+# Working directory of the tool calls made by the current agent session (or speculative
+# branch). None means the process working directory. Being a ContextVar, it follows each
+# asyncio task and is copied into asyncio.to_thread workers, so concurrent sessions can
+# each run their tools in their own directory.
+tool_workdir: ContextVar[Optional[str]] = ContextVar("tool_workdir", default=None)
+
+
+def current_workdir() -> str:
+    return tool_workdir.get() or os.getcwd()
+
+
+def resolve_path(path: str) -> str:
+    """Resolves a tool-supplied path against the session's working directory."""
+    path = os.path.expanduser(path)
+    if os.path.isabs(path):
+        return path
+    return os.path.join(current_workdir(), path)
+
+
+class SessionCancelled(Exception):
+    """Raised out of a tool or LLM call whose session was cancelled."""
+
+    def __init__(self, reason: str = "CANCELLED"):
+        super().__init__(f"Session cancelled ({reason}).")
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Thread-safe, one-shot cancellation signal for one agent session (or speculative branch).
+    Blocking work registers a callback that aborts it (kill a process group, close an
+    HTTP stream); cancel() fires every callback once, from the cancelling thread.
+    A child token is cancelled together with its parent, but not the other way round.
+    """
+
+    def __init__(self, parent: Optional["CancellationToken"] = None):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        if parent is not None:
+            parent.on_cancel(lambda: self.cancel(parent.reason))
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "CANCELLED") -> bool:
+        """Cancels the token. Returns False if it was already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Aborting is best effort: the resource may already be gone
+                pass
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Registers callback (run immediately if already cancelled). Returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleeps up to timeout; returns True as soon as the token is cancelled."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise SessionCancelled(self.reason)
+
+
+# Cancellation token of the session whose tool or LLM call runs in the current thread
+active_token: ContextVar[Optional[CancellationToken]] = ContextVar("active_token", default=None)
+
+
+def on_cancel(callback: Callable[[], None]) -> Callable[[], None]:
+    """Registers callback on the active session's token, if any. Returns an unregister function."""
+    token = active_token.get()
+    return token.on_cancel(callback) if token is not None else (lambda: None)
+
+
+def raise_if_cancelled() -> None:
+    token = active_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+async def run_cancellable(token: Optional[CancellationToken], func: Callable, *args, grace: float = 5.0):
+    """
+    Runs a blocking call in the default thread pool with `token` as its active token.
+    Raises SessionCancelled once the token is cancelled: the call gets `grace` seconds to
+    abort cooperatively and is abandoned after that. If the awaiting task itself is
+    cancelled, the token is cancelled too, so the thread's work is torn down.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    context.run(active_token.set, token)
+    future = loop.run_in_executor(None, functools.partial(context.run, func, *args))
+    if token is None:
+        return await future
+
+    cancelled = loop.create_future()
+
+    def wake():
+        loop.call_soon_threadsafe(lambda: cancelled.done() or cancelled.set_result(None))
+    unregister = token.on_cancel(wake)
+    try:
+        await asyncio.wait({future, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        if token.cancelled:
+            if not future.done():
+                await asyncio.wait({future}, timeout=grace)
+            # Retrieve the abandoned call's outcome so it is never reported as unhandled
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise SessionCancelled(token.reason)
+        return future.result()
+    except asyncio.CancelledError:
+        token.cancel("ABANDONED")
+        raise
+    finally:
+        unregister()
+        if not cancelled.done():
+            cancelled.cancel()
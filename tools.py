@@ -1,40 +1,44 @@
-import subprocess
 import os
+import json
+import time
 import tempfile
 import traceback
 import base64
 from duckduckgo_search import DDGS
 
+from sandbox import sandbox_executor, ToolOutput
+from tool_context import tool_workdir, resolve_path, raise_if_cancelled
+
 # Note: llm_client import is handled locally within analyze_image 
 # to avoid circular dependency since llm_client might be used by main.
 
+def _format_sandbox_result(result, label: str, timeout_msg: str) -> str:
+    """Renders a SandboxResult in the classic tool output format, carrying its usage."""
+    if result.cancelled:
+        return ToolOutput(f"[ERROR] {label} was killed: the session was cancelled.", result.usage)
+    if result.timed_out:
+        return ToolOutput(timeout_msg, result.usage)
+
+    output = result.stdout
+    if result.stderr:
+        output += f"\n--- STDERR ---\n{result.stderr}"
+    if result.truncated:
+        output += f"\n[TRUNCATED] Output exceeded {sandbox_executor.max_output_bytes} bytes."
+
+    if result.returncode != 0:
+        return ToolOutput(f"[ERROR] {label} failed with return code {result.returncode}.\nOutput: {output}", result.usage)
+
+    return ToolOutput(output.strip() if output.strip() else "[SUCCESS] (No output returned)", result.usage)
+
+
 def execute_bash(command: str) -> str:
     """
-    Executes a shell command. 
-    Captures stdout and stderr, with a 30-second timeout to prevent hangs.
+    Executes a shell command inside the resource-governed sandbox executor.
+    Captures stdout and stderr, with the executor's timeout to prevent hangs.
     """
     try:
-        # We capture both stdout and stderr together or separately. 
-        # Using capture_output=True handles both.
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        output = result.stdout
-        if result.stderr:
-            output += f"\n--- STDERR ---\n{result.stderr}"
-            
-        if result.returncode != 0:
-            return f"[ERROR] Command failed with return code {result.returncode}.\nOutput: {output}"
-            
-        return output.strip() if output.strip() else "[SUCCESS] (No output returned)"
-        
-    except subprocess.TimeoutExpired:
-        return "[ERROR] Bash command timed out after 30 seconds."
+        result = sandbox_executor.run(command, shell=True, cwd=tool_workdir.get())
+        return _format_sandbox_result(result, "Command", f"[ERROR] Bash command timed out after {sandbox_executor.timeout} seconds.")
     except Exception as e:
         return f"[FATAL ERROR] Exception during bash execution: {str(e)}\n{traceback.format_exc()}"
 
@@ -42,7 +46,7 @@ def execute_bash(command: str) -> str:
 def execute_python(code_string: str) -> str:
     """
     Executes a Python code block by writing it to a temporary file 
-    and running it in a subprocess.
+    and running it in a sandboxed subprocess.
     """
     temp_file_path = None
     try:
@@ -52,24 +56,9 @@ def execute_python(code_string: str) -> str:
             temp_file_path = temp_file.name
 
         # Execute the temporary python file
-        result = subprocess.run(
-            ["python", temp_file_path],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+        result = sandbox_executor.run(["python", temp_file_path], cwd=tool_workdir.get())
+        return _format_sandbox_result(result, "Python script", f"[ERROR] Python execution timed out after {sandbox_executor.timeout} seconds.")
         
-        output = result.stdout
-        if result.stderr:
-            output += f"\n--- STDERR ---\n{result.stderr}"
-            
-        if result.returncode != 0:
-            return f"[ERROR] Python script failed with return code {result.returncode}.\nOutput: {output}"
-            
-        return output.strip() if output.strip() else "[SUCCESS] (No output returned)"
-        
-    except subprocess.TimeoutExpired:
-        return "[ERROR] Python execution timed out after 30 seconds."
     except Exception as e:
         return f"[FATAL ERROR] Exception during python execution: {str(e)}\n{traceback.format_exc()}"
     finally:
@@ -86,7 +75,7 @@ def read_file(filepath: str) -> str:
     Reads the content of a file from the filesystem.
     """
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open(resolve_path(filepath), 'r', encoding='utf-8') as f:
             content = f.read()
         return content
     except FileNotFoundError:
@@ -100,7 +89,7 @@ def write_file(filepath: str, content: str) -> str:
     Writes content to a file. Overwrites if it exists.
     """
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with open(resolve_path(filepath), 'w', encoding='utf-8') as f:
             f.write(content)
         return f"[SUCCESS] Wrote to {filepath} successfully."
     except Exception as e:
@@ -128,6 +117,7 @@ def analyze_image(image_path: str, question: str) -> str:
     Reads a local image, converts to Base64, and dynamically asks the Vision API for analysis.
     """
     try:
+        image_path = resolve_path(image_path)
         if not os.path.exists(image_path):
             return f"[ERROR] Image not found: {image_path}"
             
@@ -139,13 +129,14 @@ def analyze_image(image_path: str, question: str) -> str:
         mime = "image/png" if ext == ".png" else "image/jpeg"
         
         # Local import to prevent circular dependency
-        from llm_client import call_llm
+        from model_router import routed_call
         
         sys_prompt = "You are an expert Vision API tool. Answer the user's question about the image accurately based on visual evidence."
-        # Note: we pass image_base64 and mime_type to call_llm
-        vision_response = call_llm(
-            system_prompt=sys_prompt, 
-            user_prompt=question, 
+        # Note: we pass image_base64 and mime_type to call_llm (through the vision route)
+        vision_response, _ = routed_call(
+            "vision",
+            sys_prompt, 
+            question, 
             image_base64=base64_image,
             mime_type=mime
         )
@@ -159,31 +150,41 @@ def analyze_image(image_path: str, question: str) -> str:
 def git_action(repo_path: str, action: str, branch: str = "", message: str = "") -> str:
     """
     Dedicated Git Tool for safe repository orchestration.
-    Actions: 'init', 'clone', 'commit', 'push', 'checkout', 'status'
+    Actions: 'init', 'clone', 'commit', 'push', 'checkout', 'status', 'diff', 'log'
     Payload format depends on action.
+    Every command runs as an argument vector (no shell). Clones go through the local
+    mirror cache, and status/diff/log return structured JSON parsed from porcelain
+    formats, cached until the working tree changes.
     """
-    try:
-        # Default bash execution wrapper for git commands
-        def _run_git(cmd):
-            res = subprocess.run(f"cd \"{repo_path}\" && {cmd}", shell=True, capture_output=True, text=True)
-            if res.returncode != 0:
-                raise Exception(res.stderr.strip() or "Unknown Git Error")
-            return res.stdout.strip()
+    from git_ops import run_git, git_mirror_cache, git_queries, reject_option
 
+    repo_path = resolve_path(repo_path)
+    try:
         if action == "status":
-            return _run_git("git status")
+            return json.dumps(git_queries.status(repo_path))
+        elif action == "diff": # Optional revision (e.g. HEAD~1) passed in 'branch' param
+            return json.dumps(git_queries.diff(repo_path, branch))
+        elif action == "log": # Optional revision passed in 'branch' param
+            return json.dumps(git_queries.log(repo_path, branch))
         elif action == "init":
-            return subprocess.run(f"git init \"{repo_path}\"", shell=True, capture_output=True, text=True).stdout
-        elif action == "clone" and branch: # URL passed in 'branch' param for cloning
-            return subprocess.run(f"git clone \"{branch}\" \"{repo_path}\"", shell=True, capture_output=True, text=True).stdout
+            return run_git(["init", repo_path]).strip()
+        elif action == "clone" and branch: # URL passed in 'branch' param for cloning, optional branch in 'message'
+            return git_mirror_cache.clone(branch, repo_path, message or None)
         elif action == "checkout" and branch:
-            return _run_git(f"git checkout -b \"{branch}\" || git checkout \"{branch}\"")
+            reject_option(branch, "branch")
+            try:
+                return run_git(["checkout", "-b", branch], cwd=repo_path).strip() or f"Switched to a new branch '{branch}'"
+            except Exception:
+                return run_git(["checkout", branch], cwd=repo_path).strip() or f"Switched to branch '{branch}'"
         elif action == "commit":
-            _run_git("git add -A")
+            run_git(["add", "-A"], cwd=repo_path)
             msg = message if message else "Autonomous OpenJudge Commit"
-            return _run_git(f"git commit -m \"{msg}\"")
+            return run_git(["commit", "-m", msg], cwd=repo_path).strip()
         elif action == "push":
-            return _run_git("git push origin main")
+            # Push the requested branch, or the currently checked-out one
+            target = reject_option(branch, "branch") or run_git(["rev-parse", "--abbrev-ref", "HEAD"], cwd=repo_path).strip()
+            run_git(["push", "--set-upstream", "origin", target], cwd=repo_path)
+            return f"[SUCCESS] Pushed {target} to origin."
             
         return f"[ERROR] Invalid or unsupported git_action: {action}"
     except Exception as e:
@@ -202,11 +203,13 @@ def browser_action(url: str, action: str, selector: str = "", value: str = "") -
             page = browser.new_page()
             
             page.goto(url, wait_until="domcontentloaded")
+            # A cancelled session skips the action; the context manager closes the browser
+            raise_if_cancelled()
             
             output = "[SUCCESS] Browser Action Triggered"
             
             if action == 'goto_and_screenshot':
-                shot_path = f"screenshot_{os.urandom(4).hex()}.png"
+                shot_path = resolve_path(f"screenshot_{os.urandom(4).hex()}.png")
                 page.screenshot(path=shot_path, full_page=True)
                 output = f"Screenshot saved at {shot_path}"
                 
@@ -230,6 +233,110 @@ def browser_action(url: str, action: str, selector: str = "", value: str = "") -
     except Exception as e:
          return f"[ERROR] Browser Automation Failed: {str(e)}"
 
+# Rendered-text extraction: visible text only, whitespace collapsed, scripts/styles dropped
+DOM_TO_TEXT_JS = """(root) => {
+    const el = root || document.body;
+    if (!el) return "";
+    const text = el.innerText !== undefined ? el.innerText : el.textContent;
+    return (text || "").replace(/[ \\t\\u00a0]+/g, " ").replace(/\\s*\\n\\s*/g, "\\n").trim();
+}"""
+
+BROWSER_SCRIPT_ACTIONS = ("goto", "fill", "click", "wait_for", "extract_text", "assert_text", "screenshot")
+
+
+def _run_browser_step(page, step: dict) -> dict:
+    """Executes one script step on the live page and returns its compact result fields."""
+    action = step.get("action")
+    selector = step.get("selector", "")
+    timeout = step.get("timeout_ms", 10000)
+
+    if action == "goto":
+        response = page.goto(step["url"], wait_until=step.get("wait_until", "domcontentloaded"), timeout=timeout * 3)
+        return {"url": page.url, "status": response.status if response else None}
+    if action == "fill":
+        page.locator(selector).fill(str(step.get("value", "")), timeout=timeout)
+        return {"selector": selector}
+    if action == "click":
+        page.locator(selector).click(timeout=timeout)
+        if step.get("wait_for_navigation", True):
+            page.wait_for_load_state("domcontentloaded", timeout=timeout)
+        return {"selector": selector, "url": page.url}
+    if action == "wait_for":
+        page.locator(selector).first.wait_for(state=step.get("state", "visible"), timeout=timeout)
+        return {"selector": selector}
+    if action in ("extract_text", "assert_text"):
+        if selector:
+            text = page.locator(selector).first.evaluate(DOM_TO_TEXT_JS, timeout=timeout)
+        else:
+            text = page.evaluate(DOM_TO_TEXT_JS)
+        if action == "assert_text":
+            expected = str(step.get("text", ""))
+            if expected not in text:
+                raise AssertionError(f"Expected text {expected!r} not found{' in ' + selector if selector else ''}.")
+            return {"selector": selector, "found": expected}
+        max_chars = int(step.get("max_chars", 4000))
+        return {"selector": selector, "text": text[:max_chars], "truncated": len(text) > max_chars}
+    if action == "screenshot":
+        shot_path = resolve_path(f"screenshot_{os.urandom(4).hex()}.png")
+        if selector:
+            page.locator(selector).first.screenshot(path=shot_path, timeout=timeout)
+        else:
+            page.screenshot(path=shot_path, full_page=step.get("full_page", True))
+        return {"path": shot_path}
+    raise ValueError(f"Unknown step action {action!r}. Supported: {', '.join(BROWSER_SCRIPT_ACTIONS)}.")
+
+
+def browser_script(script) -> str:
+    """
+    Playwright Browser Script Tool.
+    Runs an ordered list of steps (goto, fill, click, wait_for, extract_text, assert_text,
+    screenshot) in ONE page session, so a login-and-verify flow costs one page load per
+    navigation and a single agent iteration. Accepts {"url": ..., "steps": [...]} or a bare
+    list of steps; stops at the first failing step and returns a compact JSON summary.
+    """
+    if isinstance(script, list):
+        script = {"steps": script}
+    steps = list(script.get("steps", []))
+    if script.get("url"):
+        steps.insert(0, {"action": "goto", "url": script["url"]})
+    if not steps:
+        return "[ERROR] Browser script contains no steps."
+
+    summary = {"steps": [], "completed": 0, "total": len(steps)}
+    failure = None
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            try:
+                page = browser.new_page()
+                for i, step in enumerate(steps, 1):
+                    # Cancellation takes effect between steps (each step is bounded by its timeout)
+                    raise_if_cancelled()
+                    started = time.perf_counter()
+                    record = {"step": i, "action": step.get("action")}
+                    try:
+                        record.update(_run_browser_step(page, step))
+                        record["ok"] = True
+                    except Exception as e:
+                        record.update({"ok": False, "error": str(e).splitlines()[0] if str(e) else type(e).__name__})
+                        failure = (i, record["action"], record["error"])
+                    record["ms"] = int((time.perf_counter() - started) * 1000)
+                    summary["steps"].append(record)
+                    if failure:
+                        break
+                    summary["completed"] = i
+                summary["final_url"] = page.url
+                summary["title"] = page.title()
+            finally:
+                browser.close()
+    except Exception as e:
+        return f"[ERROR] Browser Automation Failed: {str(e)}"
+
+    if failure:
+        return f"[ERROR] Browser script stopped at step {failure[0]} ({failure[1]}): {failure[2]}\n{json.dumps(summary)}"
+    return f"[SUCCESS] Browser script completed {summary['completed']}/{summary['total']} steps.\n{json.dumps(summary)}"
+
 def memory_store(document: str, mem_type: str = "general") -> str:
     """
     Inserts a factual event, snippet, or codebase summary into Vector Memory (ChromaDB).
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import math
+import time
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class TriageClassifier:
+    """
+    Zero-cost first-stage router placed in front of the LLM triage call.
+    Combines hard rules with a keyword-weighted logistic model and only answers
+    when it is confident; uncertain objectives are left to the LLM router.
+    Routing decisions are cached by normalized objective, least recently used first out
+    once the cache holds `max_entries` objectives.
+    """
+
+    # Hard rules: any match routes to ENGINE immediately.
+    ENGINE_RULES = [
+        re.compile(r'https?://|www\.'),                                        # URLs
+        re.compile(r'`[^`]+`|```'),                                            # inline code / code fences
+        re.compile(r'(^|\s)(\.{0,2}/|~/)[\w\-./]+'),                           # filesystem paths
+        re.compile(r'\b[\w\-]+\.(py|js|ts|json|txt|md|csv|yml|yaml|html|sh|log|png|jpe?g|pdf)\b'),
+        re.compile(r'\b(pip|npm|git|docker|kubectl|curl|wget|python3?)\s+\w'),
+    ]
+
+    # Keyword weights of the logistic model. Positive pushes towards ENGINE, negative towards CHAT.
+    KEYWORD_WEIGHTS: Dict[str, float] = {
+        # Physical execution
+        "create": 2.0, "write": 1.5, "save": 1.5, "file": 2.0, "files": 2.0, "folder": 2.0,
+        "directory": 2.0, "run": 2.0, "execute": 2.5, "install": 2.5, "script": 2.0,
+        "bash": 3.0, "shell": 2.5, "terminal": 2.5, "command": 1.5, "delete": 1.5,
+        "repo": 2.5, "repository": 2.5, "clone": 3.0, "commit": 3.0, "push": 1.5, "branch": 1.5,
+        "deploy": 2.5, "build": 1.5, "compile": 2.5, "test": 1.5, "tests": 2.0, "debug": 2.0,
+        "fix": 1.5, "refactor": 2.0, "implement": 1.5, "generate": 1.0, "download": 2.5,
+        # Web / live data
+        "browser": 3.0, "screenshot": 3.0, "website": 2.0, "page": 1.0, "scrape": 3.0,
+        "search": 2.0, "latest": 2.0, "today": 2.0, "current": 1.5, "live": 1.5, "price": 1.5,
+        "headline": 2.0, "news": 1.5,
+        # Verification / computation
+        "verify": 2.0, "check": 1.0, "validate": 2.0, "calculate": 2.0, "compute": 2.0,
+        "analyze": 1.0, "image": 1.5, "memory": 1.0, "remember": 1.5, "recall": 1.5,
+        # Conversational
+        "explain": -2.0, "what": -1.0, "why": -1.5, "who": -1.5, "define": -2.0,
+        "definition": -2.0, "meaning": -2.0, "difference": -1.5, "describe": -1.5,
+        "opinion": -2.5, "joke": -3.0, "poem": -2.5, "hello": -3.0, "hi": -3.0, "hey": -3.0,
+        "thanks": -3.0, "thank": -3.0, "advice": -2.0, "recommend": -1.0, "history": -1.0,
+        "concept": -2.0, "tell": -1.0, "summarize": -0.5, "translate": -1.5,
+    }
+
+    BIAS = -0.5
+
+    def __init__(self, cache_path: Optional[str] = None,
+                 engine_threshold: float = 0.85, chat_threshold: float = 0.15, max_entries: int = 2048):
+        self.engine_threshold = engine_threshold
+        self.chat_threshold = chat_threshold
+        self.max_entries = max_entries
+        self.cache_path = cache_path if cache_path is not None else os.path.join(
+            os.path.dirname(__file__), "triage_cache.json"
+        )
+        self.cache: "OrderedDict[str, str]" = self._load_cache()
+        self._evict()
+
+    def _load_cache(self) -> "OrderedDict[str, str]":
+        if not self.cache_path:
+            return OrderedDict()
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                # Persisted oldest first, so the file order is the LRU order
+                return OrderedDict(json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return OrderedDict()
+
+    def _evict(self) -> None:
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def _persist_cache(self) -> None:
+        if not self.cache_path:
+            return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cache_path)), prefix=".triage-")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f)
+            # Atomic publish: readers never see a half-written cache
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def normalize(objective: str) -> str:
+        """Lowercases, collapses whitespace and strips trailing punctuation."""
+        text = re.sub(r'\s+', ' ', objective.strip().lower())
+        return text.rstrip(' ?!.')
+
+    def score(self, objective: str) -> float:
+        """Returns the probability that the objective requires the ENGINE route."""
+        text = self.normalize(objective)
+        for rule in self.ENGINE_RULES:
+            if rule.search(text):
+                return 1.0
+
+        logit = self.BIAS
+        for token in re.findall(r"[a-z]+", text):
+            logit += self.KEYWORD_WEIGHTS.get(token, 0.0)
+        # Long multi-step objectives lean towards execution
+        if len(text.split()) > 40:
+            logit += 1.0
+        return 1.0 / (1.0 + math.exp(-logit))
+
+    def classify(self, objective: str) -> Optional[str]:
+        """
+        Returns 'CHAT' or 'ENGINE' when the cache or the local model is confident,
+        or None when the decision must be escalated to the LLM router.
+        """
+        key = self.normalize(objective)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        p_engine = self.score(objective)
+        if p_engine >= self.engine_threshold:
+            route = "ENGINE"
+        elif p_engine <= self.chat_threshold:
+            route = "CHAT"
+        else:
+            return None
+
+        # Local decisions are cheap to recompute, so they are only cached in memory.
+        self.cache[key] = route
+        self._evict()
+        return route
+
+    def remember(self, objective: str, route: str) -> None:
+        """Caches (and persists) a routing decision made by the LLM fallback."""
+        key = self.normalize(objective)
+        self.cache[key] = route
+        self.cache.move_to_end(key)
+        self._evict()
+        self._persist_cache()
+
+    def benchmark(self, labelled: List[Tuple[str, str]],
+                  llm_fallback: Optional[Callable[[str], str]] = None) -> dict:
+        """
+        Measures routing accuracy, local coverage and latency on a labelled set of
+        (objective, expected_route) pairs. Uncertain cases are counted as ENGINE
+        (the safe default) unless an llm_fallback is provided.
+        """
+        correct = 0
+        local_decisions = 0
+        latencies = []
+        for objective, expected in labelled:
+            start = time.perf_counter()
+            key = self.normalize(objective)
+            cached = self.cache.pop(key, None)
+            route = self.classify(objective)
+            if route is not None:
+                local_decisions += 1
+            elif llm_fallback:
+                route = llm_fallback(objective)
+            else:
+                route = "ENGINE"
+            latencies.append(time.perf_counter() - start)
+            if cached is not None:
+                self.cache[key] = cached
+            if route == expected:
+                correct += 1
+
+        total = len(labelled) or 1
+        latencies.sort()
+        return {
+            "samples": len(labelled),
+            "accuracy": correct / total,
+            "local_coverage": local_decisions / total,
+            "mean_latency_ms": 1000 * sum(latencies) / total,
+            "p95_latency_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
+
+
+# Small labelled objective set used for benchmarking the local router.
+LABELLED_OBJECTIVES: List[Tuple[str, str]] = [
+    ("What is the capital of France?", "CHAT"),
+    ("Explain the difference between TCP and UDP.", "CHAT"),
+    ("Hello, who are you?", "CHAT"),
+    ("Tell me a joke about programmers.", "CHAT"),
+    ("Define polymorphism in object oriented programming.", "CHAT"),
+    ("Why is the sky blue?", "CHAT"),
+    ("Thanks for the help!", "CHAT"),
+    ("Write a poem about autumn.", "CHAT"),
+    ("Create a file named 'secret_code.txt' containing the word 'EAGLE'.", "ENGINE"),
+    ("Run the test suite and fix any failing tests.", "ENGINE"),
+    ("Clone https://github.com/lukeedIII/OpenJudge and check the README.", "ENGINE"),
+    ("Take a screenshot of the Hacker News homepage.", "ENGINE"),
+    ("Search the web for the latest Python release.", "ENGINE"),
+    ("Install requests with pip install requests and verify the import works.", "ENGINE"),
+    ("Read config.yaml and validate its schema.", "ENGINE"),
+    ("Calculate the smallest number with remainders 1, 2, 3 when divided by 2, 3, 4.", "ENGINE"),
+    ("Commit all changes in the repository with a descriptive message.", "ENGINE"),
+    ("What is the current price of Bitcoin?", "ENGINE"),
+]
+
+
+# Shared instance used by the CLI router
+triage_classifier = TriageClassifier()
+
+
+if __name__ == "__main__":
+    report = TriageClassifier(cache_path="").benchmark(LABELLED_OBJECTIVES)
+    print(json.dumps(report, indent=2))